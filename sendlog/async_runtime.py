@@ -0,0 +1,399 @@
+"""Watch files, evaluate rules and deliver alerts as coroutines on a single event loop."""
+
+import asyncio
+import signal
+import time
+
+from log_monitor import LineBatch
+from outbox import Outbox
+from utils.errors import DeliveryError, AlertsDroppedError, ShutdownTimeoutError
+
+# Lines evaluated before other tasks get a turn
+LINES_PER_STEP = 100
+# Batches waiting for one file before reading is paused
+MAX_PENDING = 100
+
+class AsyncEndpointQueue:
+    """
+    Queue and delivery tasks for a single endpoint.
+
+    Items are (msg, meta) pairs passed to handler(msg, meta) by up to
+    'concurrency' tasks, or collected into lists for batch_handler(items) as
+    in EndpointQueue. If asynchronous is True, the handlers return coroutines,
+    which are awaited; otherwise they are run in the loop's default executor
+    so that a slow endpoint does not block the loop.
+
+    When queue_size alerts are waiting, 'drop' discards the new alert,
+    'drop_oldest' discards the oldest one, and 'sample' keeps one in every
+    sample_every new alerts in place of the oldest. With 'block' and 'spill',
+    the alert is kept and wait_for_space() holds back rule evaluation until
+    the endpoint catches up. While alerts are being dropped, the number
+    dropped is logged every summary_interval seconds.
+
+    If retry options are given, alerts that were not sent are retried by an
+    Outbox, whose thread hands each retry back to the loop. Alerts whose
+    handler raises are logged and discarded, so the tasks keep running.
+    """
+
+    def __init__(self, endpoint_name, handler, batch_handler=None, queue_size=1000, concurrency=1, policy="block", spill_path=None,
+                 sample_every=10, summary_interval=60, max_messages=1, max_delay_ms=0, asynchronous=False, retry=None):
+        self.endpoint_name = endpoint_name
+        self._handler = handler
+        self._batch_handler = batch_handler
+        self._asynchronous = asynchronous
+        self._queue_size = queue_size
+        self._concurrency = concurrency
+        self._policy = policy
+        self._sample_every = sample_every
+        self._summary_interval = summary_interval
+        self._arrivals = 0
+        self._max_messages = max_messages
+        self._max_delay = max_delay_ms / 1000
+        self._queue = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._tasks = []
+        self._loop = None
+        self._outbox = None if retry is None else Outbox(endpoint_name, self._retry, **retry)
+        self.dropped = 0
+        self._reported = 0
+
+    def start(self):
+        """Start the delivery tasks on the running loop."""
+        self._loop = asyncio.get_running_loop()
+        if self._outbox is not None:
+            self._outbox.start()
+        for _ in range(self._concurrency):
+            self._tasks.append(asyncio.create_task(self._work()))
+        if self._policy in ("drop", "drop_oldest", "sample"):
+            self._tasks.append(asyncio.create_task(self._summarise_periodically()))
+
+    async def close(self, drained=None):
+        """Wait until every queued alert has been handled, then stop the tasks and call drained()."""
+        await self._queue.join()
+        self.stop()
+        if drained is not None:
+            drained()
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self.summarise()
+        if self._outbox is not None:
+            self._outbox.stop()
+
+    async def _summarise_periodically(self):
+        while True:
+            await asyncio.sleep(self._summary_interval)
+            self.summarise()
+
+    def summarise(self):
+        """Log the number of alerts dropped since the last summary, if any were."""
+        dropped, self._reported = self.dropped - self._reported, self.dropped
+        if dropped:
+            AlertsDroppedError(self.endpoint_name, self._policy, dropped)
+
+    def _retry(self, msg, meta):
+        # Called on the outbox's thread
+        return asyncio.run_coroutine_threadsafe(self._call(self._handler, msg, meta), self._loop).result()
+
+    def submit(self, msg, meta):
+        if self._queue.qsize() >= self._queue_size and self._policy not in ("block", "spill"):
+            self._arrivals += 1
+            if self._policy == "drop" or (self._policy == "sample" and self._arrivals % self._sample_every):
+                self.dropped += 1
+                return
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+        self._queue.put_nowait((msg, meta))
+
+    async def wait_for_space(self):
+        if self._policy not in ("block", "spill"):
+            return
+        while self._queue.qsize() >= self._queue_size:
+            self._space.clear()
+            await self._space.wait()
+
+    async def _call(self, handler, *args):
+        if self._asynchronous:
+            return await handler(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, handler, *args)
+
+    async def _send(self, msg, meta):
+        if self._outbox is None:
+            await self._call(self._handler, msg, meta)
+        elif not self._outbox.breaker.allow():
+            self._outbox.hold(msg, meta)
+        elif await self._call(self._handler, msg, meta):
+            self._outbox.breaker.success()
+        else:
+            self._outbox.breaker.failure()
+            self._outbox.failed(msg, meta)
+
+    async def _send_batch(self, items):
+        if self._outbox is None:
+            await self._call(self._batch_handler, items)
+            return
+        if not self._outbox.breaker.allow():
+            for msg, meta in items:
+                self._outbox.hold(msg, meta)
+            return
+        failed = await self._call(self._batch_handler, items)
+        if failed:
+            self._outbox.breaker.failure()
+            for msg, meta in failed:
+                self._outbox.failed(msg, meta)
+        else:
+            self._outbox.breaker.success()
+
+    async def _get(self):
+        item = await self._queue.get()
+        if self._queue.qsize() < self._queue_size:
+            self._space.set()
+        return item
+
+    async def _work(self):
+        if self._batch_handler is not None and self._max_messages > 1:
+            await self._work_batches()
+        while True:
+            msg, meta = await self._get()
+            try:
+                await self._send(msg, meta)
+            except Exception as exc_info:
+                # The task must keep running, or the endpoint's queue stalls
+                DeliveryError(self.endpoint_name, exc_info, 1)
+            finally:
+                self._queue.task_done()
+
+    async def _work_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._get()]
+            deadline = loop.time() + self._max_delay
+            while len(items) < self._max_messages:
+                try:
+                    items.append(await asyncio.wait_for(self._get(), max(deadline - loop.time(), 0)))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._send_batch(items)
+            except Exception as exc_info:
+                DeliveryError(self.endpoint_name, exc_info, len(items))
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    async def join(self):
+        await self._queue.join()
+
+class AsyncDelivery:
+    """Route alerts to the AsyncEndpointQueue of each endpoint, in place of DeliveryStage."""
+
+    def __init__(self):
+        self._endpoints = {}
+        # Queues of removed endpoints, until their alerts are delivered
+        self._removed = {}
+        self._closing = set()
+        self._started = False
+
+    def add_endpoint(self, endpoint_name, handler, batch_handler=None, **options):
+        endpoint_queue = self._endpoints[endpoint_name] = AsyncEndpointQueue(endpoint_name, handler, batch_handler, **options)
+        # Endpoints added by a config reload start straight away
+        if self._started:
+            endpoint_queue.start()
+
+    def remove_endpoint(self, endpoint_name, drained=None):
+        """Stop routing alerts to an endpoint, and call drained() once the alerts already queued for it are handled."""
+        endpoint_queue = self._removed[endpoint_name] = self._endpoints.pop(endpoint_name)
+        async def close():
+            await endpoint_queue.close(drained)
+            if self._removed.get(endpoint_name) is endpoint_queue:
+                del self._removed[endpoint_name]
+        # Reloads run on the loop, once the queues have started
+        task = asyncio.get_running_loop().create_task(close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def start(self):
+        self._started = True
+        for endpoint_queue in self._endpoints.values():
+            endpoint_queue.start()
+
+    def stop(self):
+        self._started = False
+        for endpoint_queue in [*self._endpoints.values(), *self._removed.values()]:
+            endpoint_queue.stop()
+
+    def submit(self, endpoint_name, msg, meta):
+        # Workflows compiled before a reload may still send to a removed endpoint
+        endpoint_queue = self._endpoints.get(endpoint_name) or self._removed[endpoint_name]
+        endpoint_queue.submit(msg, meta)
+
+    async def wait_for_space(self):
+        """Wait until no endpoint holds more alerts than its queue_size."""
+        for endpoint_queue in self._endpoints.values():
+            await endpoint_queue.wait_for_space()
+
+    def depths(self):
+        """Return the number of queued alerts for each endpoint."""
+        return {name: endpoint_queue.depth for name, endpoint_queue in self._endpoints.items()}
+
+    def dropped(self):
+        """Return the number of alerts each endpoint has dropped because its queue was full."""
+        return {name: endpoint_queue.dropped for name, endpoint_queue in self._endpoints.items()}
+
+    async def join(self):
+        """Wait until every queued alert has been delivered or has failed."""
+        for endpoint_queue in self._endpoints.values():
+            await endpoint_queue.join()
+
+class AsyncRuntime:
+    """
+    Run the workflows of a WorkflowManager on the running event loop.
+
+    The LogMonitor's inotify descriptor is watched by the loop, and each file
+    has a task that runs its workflow on every batch of lines in order,
+    letting other tasks run every LINES_PER_STEP lines, until the file is no
+    longer followed. Alerts are queued on
+    an AsyncDelivery. While a file has MAX_PENDING batches waiting, reading is
+    paused; new events wait in the kernel, and if they overflow, the files are
+    read again from their last offsets.
+
+    If a Checkpoint is given, the position of each batch is recorded once it
+    has been processed. If an AlertLatency is given, the time each batch
+    waits in its file's queue is recorded under the file's path. On SIGHUP,
+    reload() is run on the loop if given, and endpoints are reopened
+    otherwise. On SIGTERM, or after stop(), files stop being read, and run()
+    returns once the batches already read have been processed and their
+    alerts delivered, or after shutdown_timeout seconds.
+    """
+
+    def __init__(self, workflow_manager, delivery, log_monitor, checkpoint=None, latency=None, reload=None, shutdown_timeout=30):
+        self._workflow_manager = workflow_manager
+        self._reload = reload
+        self._delivery = delivery
+        self._log_monitor = log_monitor
+        self._checkpoint = checkpoint
+        self._latency = latency
+        self._shutdown_timeout = shutdown_timeout
+        self._queues = {}
+        # Queues of files that are no longer followed, until their last batches are processed
+        self._closing = set()
+        self._tasks = []
+        self._paused = False
+        self._stopped = False
+
+    async def run(self):
+        """Monitor files until stopped or cancelled."""
+        loop = asyncio.get_running_loop()
+        self._delivery.start()
+        loop.add_reader(self._log_monitor.fileno(), self._read)
+        # Reload config and reopen endpoint files and connections on SIGHUP, e.g. after logrotate
+        loop.add_signal_handler(signal.SIGHUP, self._reload or self._workflow_manager.reopen_endpoints)
+        # Stop reading files on SIGTERM, e.g. from systemctl stop, so that what was read is finished
+        loop.add_signal_handler(signal.SIGTERM, self.stop)
+        self._log_monitor.on_forget(self._forget)
+        try:
+            # Catch up from saved positions straight away
+            self._read()
+            while not self._stopped:
+                # Drain rotated files and catch rotations that produced no events
+                await asyncio.sleep(1)
+                if not self._paused:
+                    self._read()
+            # Deliver the alerts of every batch whose position is recorded
+            try:
+                await asyncio.wait_for(self.join(), self._shutdown_timeout)
+            except asyncio.TimeoutError:
+                ShutdownTimeoutError(self._shutdown_timeout)
+        finally:
+            loop.remove_signal_handler(signal.SIGHUP)
+            loop.remove_signal_handler(signal.SIGTERM)
+            if not self._paused:
+                loop.remove_reader(self._log_monitor.fileno())
+            for task in self._tasks:
+                task.cancel()
+            self._delivery.stop()
+
+    def stop(self):
+        """Stop reading files, and make run() return once the batches already read are processed."""
+        if not self._paused:
+            asyncio.get_running_loop().remove_reader(self._log_monitor.fileno())
+        self._paused = self._stopped = True
+
+    async def join(self):
+        """Wait until every batch read so far has been processed and its alerts delivered."""
+        for file_queue in [*self._queues.values(), *self._closing]:
+            await file_queue.join()
+        await self._delivery.join()
+
+    def depths(self):
+        """Return the number of batches waiting for each file."""
+        return {path: file_queue.qsize() for path, file_queue in self._queues.items()}
+
+    def _read(self):
+        for path, batch in self._log_monitor.poll():
+            file_queue = self._queues.get(path)
+            if file_queue is None:
+                file_queue = self._queues[path] = asyncio.Queue()
+                self._tasks.append(asyncio.create_task(self._process(path, file_queue)))
+            file_queue.put_nowait((batch, self._log_monitor.position(path), time.monotonic()))
+            if file_queue.qsize() >= MAX_PENDING and not self._paused:
+                asyncio.get_running_loop().remove_reader(self._log_monitor.fileno())
+                self._paused = True
+
+    def _forget(self, path):
+        # poll() returns the last batches of path after forgetting it, so they are queued first
+        asyncio.get_running_loop().call_soon(self._close_queue, path)
+
+    def _close_queue(self, path):
+        """Stop the task of a file that is no longer followed once its queued batches are processed."""
+        file_queue = self._queues.pop(path, None)
+        if file_queue is None:
+            self._workflow_manager.forget_path(path)
+            return
+        self._closing.add(file_queue)
+        file_queue.put_nowait(None)
+
+    def _resume(self):
+        if self._paused and not self._stopped and all(file_queue.qsize() < MAX_PENDING for file_queue in self._queues.values()):
+            self._paused = False
+            asyncio.get_running_loop().add_reader(self._log_monitor.fileno(), self._read)
+
+    async def _process(self, path, file_queue):
+        while True:
+            item = await file_queue.get()
+            if item is None:
+                self._closing.discard(file_queue)
+                self._tasks.remove(asyncio.current_task())
+                # A file created at path since then has a new task, which uses the workflow
+                if path not in self._queues:
+                    self._workflow_manager.forget_path(path)
+                file_queue.task_done()
+                return
+            batch, position, enqueued = item
+            if self._latency is not None:
+                self._latency.queued(path, time.monotonic() - enqueued)
+            try:
+                workflow_batch = self._workflow_manager.get_batch_workflow(path)
+            except KeyError:
+                # The file was removed from the configuration by a reload
+                file_queue.task_done()
+                continue
+            try:
+                for i in range(0, len(batch), LINES_PER_STEP):
+                    # Slices of a LineBatch are plain lists, so the read time is carried over
+                    workflow_batch(LineBatch(batch[i:i + LINES_PER_STEP], batch.detected))
+                    await self._delivery.wait_for_space()
+                    await asyncio.sleep(0)
+                if self._checkpoint is not None and position is not None:
+                    self._checkpoint.update(path, *position)
+            finally:
+                file_queue.task_done()
+            self._resume()
@@ -0,0 +1,218 @@
+"""
+Run the workflows in the configuration file over existing log files.
+
+Alerts are counted rather than sent unless --deliver is given, so rules can
+be tried against historical logs, and the engine benchmarked, without
+notifying anyone. Files ending in .gz are decompressed as they are read.
+
+Usage: python backfill.py [--config PATH] [--workflow PATH] [--jobs N] [--deliver] FILE [FILE ...]
+"""
+
+from config_handler import ConfigHandler
+from delivery import DeliveryStage
+from log_monitor import line_start
+from main import CONFIG_PATH, load_workflows
+
+from utils import log
+from utils.paths import is_pattern, matches
+from collections import Counter
+import argparse
+import gzip
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+READ_SIZE = 1 << 20
+# Files smaller than this are not split between jobs
+MIN_CHUNK_SIZE = 1 << 24
+# Rotation suffixes, e.g. '.1', '.2.gz' or '-20250101.gz'
+ROTATED_SUFFIX = re.compile(r"(\.\d+|-\d{8})?(\.gz)?$")
+
+class CountingDelivery:
+    """
+    Delivery stage that counts alerts by workflow.
+
+    Alerts are passed on to forward, if given, and otherwise discarded.
+    Forwarded endpoints keep their alerts in memory: spilling is replaced
+    with blocking and retry journals are not kept, so a backfill never reads
+    or writes the spill files and journals of a running sendlog.
+    """
+
+    def __init__(self, forward=None):
+        self.counts = Counter()
+        self._forward = forward
+
+    def add_endpoint(self, endpoint_name, handler, batch_handler=None, **options):
+        if self._forward is None:
+            return
+        if options.get("policy") == "spill":
+            options = {**options, "policy": "block", "spill_path": None}
+        if options.get("retry") is not None:
+            options["retry"] = {**options["retry"], "journal_path": None}
+        self._forward.add_endpoint(endpoint_name, handler, batch_handler, **options)
+
+    def start(self):
+        if self._forward is not None:
+            self._forward.start()
+
+    def submit(self, endpoint_name, msg, meta):
+        trace_stack = meta[2]
+        self.counts[tuple(trace_stack)] += 1
+        if self._forward is not None:
+            self._forward.submit(endpoint_name, msg, meta)
+
+    def join(self):
+        if self._forward is not None:
+            self._forward.join()
+
+def read_batches(path, start=0, end=None):
+    """Yield lists of lines read from path in large chunks, between byte offsets start and end."""
+    if path.endswith(".gz"):
+        file = gzip.open(path, "rb")
+    else:
+        file = open(path, "rb", buffering=0)
+        file.seek(start)
+    with file:
+        remaining = None if end is None else end - start
+        partial = b""
+        while remaining is None or remaining > 0:
+            chunk = file.read(READ_SIZE if remaining is None else min(READ_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            *lines, partial = (partial + chunk).split(b"\n")
+            if lines:
+                yield [line.decode("utf-8", errors="replace").strip() for line in lines]
+        if partial:
+            yield [partial.decode("utf-8", errors="replace").strip()]
+
+def split_file(path, jobs):
+    """Return (start, end) byte ranges that split path into up to jobs parts on line boundaries."""
+    if path.endswith(".gz") or jobs == 1:
+        return [(0, None)]
+    size = os.path.getsize(path)
+    parts = max(min(jobs, size // MIN_CHUNK_SIZE), 1)
+    bounds = sorted({line_start(path, size * i // parts) for i in range(parts)} | {size})
+    return list(zip(bounds, bounds[1:])) or [(0, None)]
+
+def is_configured(path, configured):
+    """Return True if path is a configured file or matches a configured pattern."""
+    return path in configured or any(is_pattern(key) and matches(key, path) for key in configured)
+
+def workflow_path(path, configured, override=None):
+    """
+    Return the path whose workflow applies to path, ignoring rotation
+    suffixes. This is a configured file, or a file matching a configured
+    pattern, whose workflow is looked up as it would be while monitoring.
+    """
+    if override is not None:
+        return override
+    for candidate in (path, os.path.abspath(path)):
+        if is_configured(candidate, configured):
+            return candidate
+        base = ROTATED_SUFFIX.sub("", candidate)
+        if is_configured(base, configured):
+            return base
+    return None
+
+def load(config_path, deliver):
+    config_handler = ConfigHandler(config_path)
+    delivery = CountingDelivery(DeliveryStage() if deliver else None)
+    workflow_manager = load_workflows(config_handler, delivery, open_endpoints=deliver)
+    delivery.start()
+    return workflow_manager, delivery
+
+def process(workflow_manager, delivery, task):
+    """Run the workflow of one file over a range of it, returning the number of lines read."""
+    path, workflow, start, end = task
+    workflow_batch = workflow_manager.get_batch_workflow(workflow)
+    lines = 0
+    for batch in read_batches(path, start, end):
+        workflow_batch(batch)
+        lines += len(batch)
+    return lines
+
+_job = None
+
+def _init_job(config_path):
+    global _job
+    log.config(None)
+    _job = load(config_path, deliver=False)
+
+def _run_job(task):
+    workflow_manager, delivery = _job
+    lines = process(workflow_manager, delivery, task)
+    counts = Counter(delivery.counts)
+    delivery.counts.clear()
+    return task[0], lines, counts
+
+def run(paths, config_path=CONFIG_PATH, override=None, jobs=1, deliver=False):
+    """
+    Process every file and return ({path: lines}, alert counts, seconds taken).
+
+    With more than one job, alerts are only counted, and large files are
+    split into ranges that are processed in parallel.
+    """
+    if deliver and jobs > 1:
+        raise ValueError("--deliver sends alerts in order from one process, so it cannot be used with --jobs")
+    config_handler = ConfigHandler(config_path)
+    configured = {data[0] for data in config_handler.files()}
+    tasks = []
+    for path in paths:
+        workflow = workflow_path(path, configured, override)
+        if workflow is None or not is_configured(workflow, configured):
+            raise ValueError(f"No workflow is configured for '{path}'; use --workflow to choose one")
+        tasks.extend((path, workflow, start, end) for start, end in split_file(path, jobs))
+
+    lines = Counter()
+    counts = Counter()
+    started = time.perf_counter()
+    if jobs == 1:
+        workflow_manager, delivery = load(config_path, deliver)
+        try:
+            for task in tasks:
+                lines[task[0]] += process(workflow_manager, delivery, task)
+            delivery.join()
+        finally:
+            workflow_manager.close_endpoints()
+        counts = delivery.counts
+    else:
+        with multiprocessing.get_context("spawn").Pool(jobs, _init_job, (config_path,)) as pool:
+            for path, task_lines, task_counts in pool.imap_unordered(_run_job, tasks):
+                lines[path] += task_lines
+                counts.update(task_counts)
+    return lines, counts, time.perf_counter() - started
+
+def report(lines, counts, elapsed, out=sys.stdout):
+    total = sum(lines.values())
+    for path, path_lines in lines.items():
+        print(f"{path}: {path_lines} lines", file=out)
+    print(f"\n{total} lines in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} lines/s)", file=out)
+    print(f"{sum(counts.values())} alerts", file=out)
+    for trace_stack, count in counts.most_common():
+        print(f"  {count:>8}  {' -> '.join(trace_stack)}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run sendlog workflows over existing log files.")
+    parser.add_argument("files", nargs="+", help="log files to process; .gz files are decompressed")
+    parser.add_argument("--config", default=CONFIG_PATH, help=f"configuration file (default {CONFIG_PATH})")
+    parser.add_argument("--workflow", help="configured file whose workflow to run, instead of matching each file by name")
+    parser.add_argument("--jobs", type=int, default=1, help="processes to run; large files are split between them (default 1)")
+    parser.add_argument("--deliver", action="store_true", help="send alerts to their endpoints instead of only counting them")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    log.config(None)
+    try:
+        lines, counts, elapsed = run(args.files, args.config, args.workflow, args.jobs, args.deliver)
+    except ValueError as e:
+        parser.error(str(e))
+    report(lines, counts, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare per-alert latency of the Telegram channel against a new connection per alert.
+
+A local keep-alive HTTP server stands in for the Bot API, so the numbers
+exclude network distance and TLS, which make the difference larger in
+practice.
+
+Run from the sendlog directory:
+
+    python -m benchmarks.bench_http
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import statistics
+import threading
+import time
+
+import requests
+
+from plugins.channels.telegram import Telegram
+
+ALERTS = 500
+
+class BotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BotAPIHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def measure(send, alerts=ALERTS):
+    """Return per-alert latencies in milliseconds."""
+    latencies = []
+    for i in range(alerts):
+        start = time.perf_counter()
+        send(f"alert {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<12} {p50:>10.3f} {p99:>10.3f}")
+
+def main():
+    server = start_server()
+    api_url = f"http://127.0.0.1:{server.server_port}"
+
+    def post_per_alert(msg):
+        requests.post(f"{api_url}/botTOKEN/sendMessage", params={"chat_id": 1, "text": msg}, timeout=10)
+
+    telegram = Telegram("bench", chat_id=1, token="TOKEN", api_url=api_url)
+
+    print(f"{'client':<12} {'p50 ms':>10} {'p99 ms':>10}")
+    report("per-alert", measure(post_per_alert))
+    report("session", measure(telegram))
+    telegram.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
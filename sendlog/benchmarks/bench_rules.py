@@ -0,0 +1,50 @@
+"""
+Measure how the per-line cost of a workflow grows with the number of rules.
+
+Run from the sendlog directory:
+
+    python -m benchmarks.bench_rules
+"""
+
+import time
+
+from plugin import Transformer, Channel
+from workflow_manager import WorkflowManager
+from benchmarks.common import build_plugin
+
+RULE_COUNTS = [1, 5, 10, 20, 40]
+LINES = 20000
+LOG_LINE = "[2025-03-28T14:32:59+0000] [PACMAN] Running 'pacman -Syu'"
+
+class Out(Transformer):
+    pass
+
+class Null(Channel):
+    __slots__ = []
+    def __call__(self, msg):
+        pass
+
+def build_workflow(rule_count):
+    build_plugin("bench", rule_count, r"Running\s+'(?P<command>[^']+)'", Out, Null)
+    workflow_manager = WorkflowManager()
+    workflow_manager.load_endpoint("_bench", "Null", "null", {})
+    for i in range(rule_count):
+        workflow_manager.load_file("/bench.log", "_bench", "Bench", f"Rule{i}", "Out", "null")
+    return workflow_manager.get_workflow("/bench.log")
+
+def bench(rule_count, lines=LINES):
+    """Return the mean cost of a single line in microseconds."""
+    workflow = build_workflow(rule_count)
+    start = time.perf_counter()
+    for _ in range(lines):
+        workflow(LOG_LINE)
+    return (time.perf_counter() - start) / lines * 1e6
+
+def main():
+    print(f"{'rules':>6} {'us/line':>10} {'us/rule':>10}")
+    for rule_count in RULE_COUNTS:
+        cost = bench(rule_count)
+        print(f"{rule_count:>6} {cost:>10.2f} {cost / rule_count:>10.2f}")
+
+if __name__ == "__main__":
+    main()
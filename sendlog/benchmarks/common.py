@@ -0,0 +1,26 @@
+"""Synthetic plugins shared by the benchmarks."""
+
+import sys
+import types
+
+from plugin import LogType, Rule
+
+def build_plugin(name, rule_count, match_regex, transformer_cls, channel_cls):
+    """
+    Register the log plugin '_{name}', holding a LogType named name.title()
+    with rule_count rules of which only the first, with match_regex, can
+    match, and the channel plugin '_{name}' holding channel_cls.
+
+    Each rule is named 'Rule{i}' and has transformer_cls as its transformer.
+    """
+    attrs = {"regex": r"\[(?P<timestamp>.*?)\] \[(?P<application>.*?)\] (?P<message>.*)"}
+    for i in range(rule_count):
+        regex = match_regex if i == 0 else rf"Rule{i} '(?P<value>[^']+)'"
+        attrs[f"Rule{i}"] = type(f"Rule{i}", (Rule,), {"regex": regex, transformer_cls.__name__: transformer_cls})
+    module = types.ModuleType(f"plugins.logs._{name}")
+    setattr(module, name.title(), type(name.title(), (LogType,), attrs))
+    sys.modules[module.__name__] = module
+
+    channel_module = types.ModuleType(f"plugins.channels._{name}")
+    setattr(channel_module, channel_cls.__name__, channel_cls)
+    sys.modules[channel_module.__name__] = channel_module
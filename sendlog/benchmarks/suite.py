@@ -0,0 +1,320 @@
+"""
+Reproducible benchmarks of the parse -> rule -> transform -> channel pipeline.
+
+Synthetic pacman-style lines are run through three scenarios:
+
+- workflow: WorkflowManager.get_workflow called once per line.
+- batch: WorkflowManager.get_batch_workflow called on chunks of lines.
+- pipeline: lines appended to a file and followed by LogMonitor, then
+  processed by a WorkerPool and delivered through a DeliveryStage.
+
+Alerts go to in-memory stub channels. Results are written as JSON with
+lines/sec, p50/p99 latency and memory for every combination of rule count
+and match ratio. Latency is per line for 'workflow' and 'batch', and from
+the write of a matching line to its delivery for 'pipeline'. Each case runs
+in its own process, so that its memory and threads do not carry over into
+the next. A pipeline case that does not finish within its timeout is
+reported as timed out and fails the run. With --repeat, each case is run
+several times and the run with the median lines/sec is reported, so that a
+single noisy run does not decide the result. A previous result file can be
+given with --baseline to fail on regressions.
+
+Run from the sendlog directory:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --repeat 5 --baseline results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from plugin import Transformer, Channel
+from workflow_manager import WorkflowManager
+from log_monitor import LogMonitor
+from worker_pool import WorkerPool
+from delivery import DeliveryStage
+from bounded_queue import join_all
+from benchmarks.common import build_plugin
+
+SCENARIOS = ["workflow", "batch", "pipeline"]
+PACKAGES = ["linux", "glibc", "openssl", "python", "systemd", "mesa", "firefox", "curl"]
+BATCH_SIZE = 500
+# Lines written to the file at once in the pipeline scenario
+WRITE_SIZE = 1000
+# Seconds allowed for a pipeline case to process its lines
+PIPELINE_TIMEOUT = 60
+
+def generate_lines(count, match_ratio, seed=0):
+    """
+    Return count pacman-style log lines, where about match_ratio of them are
+    'Running' lines that the first rule matches. Each matching line carries
+    its index, so alerts can be traced back to the line that caused them.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        timestamp = f"[2025-03-28T14:{i // 60 % 60:02d}:{i % 60:02d}+0000]"
+        if rng.random() < match_ratio:
+            lines.append(f"{timestamp} [PACMAN] Running 'pacman -S {i}'")
+        else:
+            package = rng.choice(PACKAGES)
+            lines.append(f"{timestamp} [ALPM] upgraded {package} (1.{i % 10}.0-1 -> 1.{i % 10}.1-1)")
+    return lines
+
+class Seq(Transformer):
+    def __call__(self, parts):
+        return int(parts["context"]["seq"])
+
+# {seq: arrival time} of the alerts received in the current case
+RECEIVED = {}
+
+class Stub(Channel):
+    """In-memory channel that records when each alert arrives."""
+    __slots__ = []
+    def __call__(self, msg):
+        RECEIVED[msg] = time.perf_counter()
+
+def build_workflow_manager(rule_count, path, delivery=None):
+    build_plugin("suite", rule_count, r"Running 'pacman -S (?P<seq>\d+)'", Seq, Stub)
+    RECEIVED.clear()
+    workflow_manager = WorkflowManager(delivery)
+    workflow_manager.load_endpoint("_suite", "Stub", "stub", {})
+    for i in range(rule_count):
+        workflow_manager.load_file(path, "_suite", "Suite", f"Rule{i}", "Seq", "stub")
+    return workflow_manager
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run_workflow(lines, rule_count):
+    workflow_manager = build_workflow_manager(rule_count, "/suite.log")
+    workflow = workflow_manager.get_workflow("/suite.log")
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for line in lines:
+        line_start = clock()
+        workflow(line)
+        latencies.append(clock() - line_start)
+    return clock() - start, latencies, len(RECEIVED)
+
+def run_batch(lines, rule_count):
+    workflow_manager = build_workflow_manager(rule_count, "/suite.log")
+    workflow_batch = workflow_manager.get_batch_workflow("/suite.log")
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for i in range(0, len(lines), BATCH_SIZE):
+        batch = lines[i:i + BATCH_SIZE]
+        batch_start = clock()
+        workflow_batch(batch)
+        # Lines in a batch finish together, so each gets the mean cost
+        latencies.extend([(clock() - batch_start) / len(batch)] * len(batch))
+    return clock() - start, latencies, len(RECEIVED)
+
+def run_pipeline(lines, rule_count, write_rate=None, timeout=PIPELINE_TIMEOUT):
+    """
+    Return the elapsed time, latencies and alert count of the pipeline, and
+    whether it failed to process every line within timeout seconds. Every
+    thread started for the case is stopped before returning.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pacman.log")
+        open(path, "w").close()
+        delivery = DeliveryStage()
+        workflow_manager = build_workflow_manager(rule_count, path, delivery)
+        delivery.start()
+        worker_pool = WorkerPool(1)
+        worker_pool.start()
+        # Wake up often enough to notice stop() soon after the case ends
+        log_monitor = LogMonitor([path], block_duration_s=0.1)
+        processed = []
+
+        def monitor():
+            for monitored_path, batch in log_monitor.monitor():
+                worker_pool.submit(monitored_path, workflow_manager.get_batch_workflow(monitored_path), batch)
+                processed.append(len(batch))
+        monitor_thread = threading.Thread(target=monitor, daemon=True)
+        monitor_thread.start()
+
+        written = {}
+        start = time.perf_counter()
+        with open(path, "a") as file:
+            for i in range(0, len(lines), WRITE_SIZE):
+                chunk = lines[i:i + WRITE_SIZE]
+                now = time.perf_counter()
+                for line in chunk:
+                    if "Running" in line:
+                        written[int(line.rsplit(" ", 1)[1][:-1])] = now
+                file.write("".join(f"{line}\n" for line in chunk))
+                file.flush()
+                if write_rate:
+                    # Pace writes so that latency is measured below saturation
+                    time.sleep(max(start + (i + len(chunk)) / write_rate - time.perf_counter(), 0))
+
+        deadline = time.monotonic() + timeout
+        while sum(processed) < len(lines) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        finished = sum(processed) == len(lines) and join_all([worker_pool, delivery], max(deadline - time.monotonic(), 0))
+        elapsed = time.perf_counter() - start
+
+        latencies = [RECEIVED[seq] - written[seq] for seq in RECEIVED if seq in written]
+        alerts = len(RECEIVED)
+        log_monitor.stop()
+        monitor_thread.join(timeout=1)
+        log_monitor.close()
+        worker_pool.close(timeout=1)
+        delivery.stop(timeout=1)
+        workflow_manager.close_endpoints()
+        return elapsed, latencies, alerts, not finished
+
+def run_case(scenario, lines, rule_count, match_ratio, trace_memory=False, write_rate=None):
+    """Run one case in this process and return its result."""
+    if trace_memory:
+        tracemalloc.start()
+    timed_out = False
+    if scenario == "pipeline":
+        elapsed, latencies, alerts, timed_out = run_pipeline(lines, rule_count, write_rate)
+    elif scenario == "batch":
+        elapsed, latencies, alerts = run_batch(lines, rule_count)
+    else:
+        elapsed, latencies, alerts = run_workflow(lines, rule_count)
+    result = {
+        "scenario": scenario,
+        "rules": rule_count,
+        "match_ratio": match_ratio,
+        "lines": len(lines),
+        "alerts": alerts,
+        "seconds": round(elapsed, 6),
+        "timed_out": timed_out,
+        # Throughput of a case that did not finish is meaningless
+        "lines_per_sec": None if timed_out else round(len(lines) / elapsed, 1),
+        "latency_us": {
+            "p50": round(percentile(latencies, 0.5) * 1e6, 2) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1e6, 2) if latencies else None
+        },
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    if trace_memory:
+        result["peak_alloc_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+def run_generated_case(scenario, line_count, seed, rule_count, match_ratio, trace_memory=False, write_rate=None):
+    """Generate the lines of a case and run it, so that only the arguments are sent to a case process."""
+    return run_case(scenario, generate_lines(line_count, match_ratio, seed), rule_count, match_ratio, trace_memory, write_rate)
+
+def run_isolated(*args):
+    """Run run_generated_case(*args) in a new process, so that max_rss_kb is the peak of that case alone."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_generated_case, args)
+
+def median_result(runs):
+    """Return the run with the median lines/sec, or the first that timed out, recording every run's lines/sec."""
+    timed_out = [result for result in runs if result["timed_out"]]
+    result = timed_out[0] if timed_out else sorted(runs, key=lambda run: run["lines_per_sec"])[len(runs) // 2]
+    return {**result, "runs_lines_per_sec": [run["lines_per_sec"] for run in runs]}
+
+def run_suite(scenarios=SCENARIOS, rule_counts=(1, 10, 40), match_ratios=(0.01, 0.5), line_count=20000, seed=0, trace_memory=False,
+              write_rate=None, isolate=True, repeat=1):
+    """Run every case repeat times, each in its own process unless isolate is False."""
+    run = run_isolated if isolate else run_generated_case
+    results = []
+    for match_ratio in match_ratios:
+        for scenario in scenarios:
+            for rule_count in rule_counts:
+                runs = [run(scenario, line_count, seed, rule_count, match_ratio, trace_memory, write_rate) for _ in range(repeat)]
+                results.append(median_result(runs))
+    return {
+        "format": 1,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"lines": line_count, "seed": seed, "write_rate": write_rate, "repeat": repeat},
+        "results": results
+    }
+
+def describe(result):
+    return f"{result['scenario']} rules={result['rules']} match_ratio={result['match_ratio']}"
+
+def failed_cases(report):
+    """Return descriptions of cases that did not finish."""
+    return [f"{describe(result)}: timed out" for result in report["results"] if result.get("timed_out")]
+
+def compare(report, baseline, tolerance):
+    """
+    Return descriptions of cases whose throughput fell by more than tolerance
+    since baseline, or that timed out when they finished in baseline.
+    """
+    def key(result):
+        return result["scenario"], result["rules"], result["match_ratio"]
+    previous = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(key(result))
+        if before is None or before.get("lines_per_sec") is None:
+            continue
+        if result["lines_per_sec"] is None:
+            regressions.append(f"{describe(result)}: {before['lines_per_sec']:.0f} lines/s -> timed out")
+        elif result["lines_per_sec"] < before["lines_per_sec"] * (1 - tolerance):
+            regressions.append(f"{describe(result)}: {before['lines_per_sec']:.0f} -> {result['lines_per_sec']:.0f} lines/s")
+    return regressions
+
+def parse_list(cast):
+    return lambda text: [cast(item) for item in text.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sendlog pipeline.")
+    parser.add_argument("--scenarios", type=parse_list(str), default=SCENARIOS, help="comma-separated scenarios (default all)")
+    parser.add_argument("--rules", type=parse_list(int), default=[1, 10, 40], help="comma-separated rule counts (default 1,10,40)")
+    parser.add_argument("--match-ratio", type=parse_list(float), default=[0.01, 0.5], help="comma-separated ratios of matching lines (default 0.01,0.5)")
+    parser.add_argument("--lines", type=int, default=20000, help="lines per case (default 20000)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the line generator (default 0)")
+    parser.add_argument("--write-rate", type=int, help="lines/sec written in the pipeline scenario (default as fast as possible)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report peak Python allocations (slower)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each case, of which the median is reported (default 1)")
+    parser.add_argument("--no-isolate", dest="isolate", action="store_false", help="run every case in this process")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed drop in lines/sec before failing (default 0.2)")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = run_suite(args.scenarios, args.rules, args.match_ratio, args.lines, args.seed, args.trace_memory, args.write_rate,
+                       args.isolate, args.repeat)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    failures = failed_cases(report)
+    for failure in failures:
+        print(f"FAILED {failure}", file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+    if failures or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
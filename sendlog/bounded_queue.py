@@ -0,0 +1,177 @@
+"""Bounded FIFO queue with a configurable policy for when it is full."""
+
+from collections import deque
+import threading
+import queue
+import json
+import os
+import time
+
+POLICIES = ("block", "drop", "drop_oldest", "sample", "spill")
+
+def join_all(queues, timeout=None):
+    """Join each queue in turn within one timeout, returning False if they are not all done in time."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for each_queue in queues:
+        if not each_queue.join(None if deadline is None else max(deadline - time.monotonic(), 0)):
+            return False
+    return True
+
+class BoundedQueue:
+    """
+    Thread-safe FIFO queue holding at most maxsize items in memory.
+
+    When the queue is full, put() follows the overload policy:
+
+    - block: wait until a consumer frees a slot.
+    - drop: discard the new item.
+    - drop_oldest: discard the oldest queued item to make room.
+    - sample: keep one in every sample_every new items, in place of the
+      oldest queued item, and discard the rest.
+    - spill: append the item to a JSON lines file at spill_path. Once anything
+      has been spilled, new items are also spilled so order is preserved, and
+      consumers read spilled items back after the in-memory items. The read
+      offset is stored alongside the spill file, so spilled items that remain
+      when the process exits are read back on the next start.
+
+    Discarded items are counted in dropped and passed to on_drop, and spilled
+    items are counted in spilled_total. Spilled items must be JSON values, and
+    are read back as JSON decodes them, e.g. tuples as lists. Other items can
+    be converted with encode before they are spilled, and back with decode
+    when they are read; put() raises TypeError for an item that still cannot
+    be written, without queueing it.
+    """
+
+    def __init__(self, maxsize, policy="block", spill_path=None, sample_every=10, on_drop=None, encode=None, decode=None):
+        self._maxsize = maxsize
+        self._policy = policy
+        self._spill_path = spill_path
+        self._sample_every = sample_every
+        self._on_drop = on_drop
+        self._encode = encode
+        self._decode = decode
+        self._arrivals = 0
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._unfinished = 0
+        self._spilled = 0
+        self._spill_offset = 0
+        self.dropped = 0
+        self.spilled_total = 0
+        if policy == "spill" and os.path.exists(spill_path):
+            self._spill_offset = self._read_spill_offset()
+            with open(spill_path, "r") as file:
+                file.seek(self._spill_offset)
+                self._spilled = sum(1 for _ in file)
+            self._unfinished = self._spilled
+
+    def qsize(self):
+        """Return the number of queued items, including spilled items."""
+        with self._lock:
+            return len(self._items) + self._spilled
+
+    def put(self, item):
+        with self._not_full:
+            if self._spilled or len(self._items) >= self._maxsize:
+                if self._policy == "block":
+                    while len(self._items) >= self._maxsize:
+                        self._not_full.wait()
+                elif self._policy == "drop_oldest":
+                    self._drop(self._items.popleft())
+                    self._unfinished -= 1
+                elif self._policy in ("drop", "sample"):
+                    self._arrivals += 1
+                    if self._policy == "drop" or self._arrivals % self._sample_every:
+                        self._drop(item)
+                        return
+                    self._drop(self._items.popleft())
+                    self._unfinished -= 1
+                else:
+                    self._spill(item)
+                    self._unfinished += 1
+                    self._not_empty.notify()
+                    return
+            self._items.append(item)
+            self._unfinished += 1
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, raising queue.Empty after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_empty:
+            while not self._items:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if not self._not_empty.wait_for(lambda: self._items or self._spilled, remaining):
+                    raise queue.Empty
+                if not self._items:
+                    # Reads nothing if the spill file was truncated externally, so wait again
+                    self._unspill()
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def task_done(self):
+        with self._lock:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._all_done.notify_all()
+
+    def join(self, timeout=None):
+        """Block until every queued item has been marked done, returning False if timeout seconds pass first."""
+        with self._all_done:
+            return self._all_done.wait_for(lambda: self._unfinished <= 0, timeout)
+
+    def _drop(self, item):
+        self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(item)
+
+    def _spill(self, item):
+        if self._encode is not None:
+            item = self._encode(item)
+        try:
+            line = json.dumps(item)
+        except (TypeError, ValueError) as e:
+            raise TypeError(f"Cannot spill item to '{self._spill_path}': {e}") from e
+        with open(self._spill_path, "a") as file:
+            file.write(line + "\n")
+        self._spilled += 1
+        self.spilled_total += 1
+
+    def _unspill(self):
+        """Move up to maxsize spilled items back into memory."""
+        with open(self._spill_path, "r") as file:
+            file.seek(self._spill_offset)
+            while self._spilled and len(self._items) < self._maxsize:
+                line = file.readline()
+                if not line:
+                    # The spill file was truncated externally; nothing is left to read
+                    self._unfinished -= self._spilled
+                    self._spilled = 0
+                    if self._unfinished <= 0:
+                        self._all_done.notify_all()
+                    break
+                item = json.loads(line)
+                self._items.append(item if self._decode is None else self._decode(item))
+                self._spilled -= 1
+            self._spill_offset = file.tell()
+        # Reset the spill file once it has been fully read back
+        if not self._spilled:
+            with open(self._spill_path, "w"):
+                pass
+            self._spill_offset = 0
+        self._write_spill_offset()
+
+    def _read_spill_offset(self):
+        try:
+            with open(f"{self._spill_path}.offset", "r") as file:
+                return int(file.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_spill_offset(self):
+        with open(f"{self._spill_path}.offset", "w") as file:
+            file.write(str(self._spill_offset))
@@ -0,0 +1,105 @@
+"""Persist how far each monitored file has been processed, so a restart resumes where it stopped."""
+
+import fcntl
+import json
+import os
+import threading
+
+from utils.errors import CheckpointError
+
+class Checkpoint:
+    """
+    Read positions of monitored files, saved to a JSON state file.
+
+    Positions are (inode, offset) pairs, where offset is the end of the last
+    line that has been processed. update() only records a position in
+    memory; a background thread writes changed positions every interval
+    seconds, and close() writes them a final time. Each write replaces the
+    state file atomically and is flushed to disk, so the file is never left
+    half-written.
+
+    Several processes may share one state file. A write holds a lock on
+    '{path}.lock' and merges in the positions saved by other processes, so
+    that each process only replaces the files it has updated.
+    """
+
+    def __init__(self, path, interval=5):
+        self.path = path
+        self.interval = interval
+        self._positions = {}
+        self._updated = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Return the saved {path: (inode, offset)} positions."""
+        try:
+            with open(self.path, "r") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return {}
+        positions = {path: (entry["inode"], entry["offset"]) for path, entry in state.items()}
+        with self._lock:
+            self._positions = {**positions, **self._positions}
+        return positions
+
+    def update(self, path, inode, offset):
+        with self._lock:
+            self._positions[path] = (inode, offset)
+            self._updated.add(path)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._save_periodically)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.save()
+
+    def _save_periodically(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """Write positions updated since the last save to the state file."""
+        with self._lock:
+            if not self._updated:
+                return
+            updated = {path: self._positions[path] for path in self._updated}
+            self._updated = set()
+        try:
+            self._write(updated)
+        except OSError as exc_info:
+            CheckpointError(self.path, exc_info)
+            # Try again on the next save
+            with self._lock:
+                self._updated |= set(updated)
+
+    def _write(self, updated):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path, "r") as file:
+                    state = json.load(file)
+            except FileNotFoundError:
+                state = {}
+            for path, (inode, offset) in updated.items():
+                state[path] = {"inode": inode, "offset": offset}
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(state, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            # Make the rename itself durable
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
@@ -1,8 +1,12 @@
-from utils.errors import ConfigKeyError, ConfigTypeError
+from utils.errors import ConfigKeyError, ConfigTypeError, ConfigValueError
+
+from bounded_queue import POLICIES
 
 from importlib import import_module
 import yaml
 
+RUNTIMES = ("threads", "async")
+
 def get_val(key, dicti, enforced_type=None):
     try:
         val = dicti[key]
@@ -14,6 +18,19 @@ def get_val(key, dicti, enforced_type=None):
             raise ConfigTypeError(enforced_type.__name__, type(val).__name__)
     return dicti[key]
 
+def get_opt(key, dicti, enforced_type=None, default=None):
+    """Return an optional value, or default if the key is missing."""
+    if key not in dicti or dicti[key] is None:
+        return default
+    return get_val(key, dicti, enforced_type)
+
+def get_int(key, dicti, default, minimum=1):
+    """Return an optional integer no smaller than minimum."""
+    val = get_opt(key, dicti, int, default)
+    if val < minimum:
+        raise ConfigValueError(key, val, f"an integer of at least {minimum}")
+    return val
+
 class ConfigHandler:
     """Initialises and stores objects referenced in the configuration file."""
     def __init__(self, path):
@@ -57,12 +74,84 @@ class ConfigHandler:
                                 raise ConfigTypeError("str", type(item).__name__)
                         yield path, plugin_name, log_name, rule_name, transformer_name, endpoint_name
 
+    def suppressions(self):
+        """
+        Yield the 'suppress' options of every rule that has them in the following format:
+
+        (path, rule_name, options)
+        """
+        for path, file_config in get_val("files", self._config, dict).items():
+            for rule_name, rule_config in get_val("rules", file_config, dict).items():
+                suppress_config = get_opt("suppress", rule_config, dict)
+                if suppress_config is None:
+                    continue
+                key = get_opt("key", suppress_config, list, [])
+                for field in key:
+                    if type(field) is not str:
+                        raise ConfigTypeError("str", type(field).__name__)
+                yield path, rule_name, {
+                    "key": key,
+                    "burst": get_int("burst", suppress_config, 1),
+                    "interval_s": get_int("interval_s", suppress_config, 60),
+                    "max_keys": get_int("max_keys", suppress_config, 10000)
+                }
+
     def endpoints(self):
+        """
+        Yield information about every endpoint in the following format:
+
+        (module_name, channel_name, endpoint_name, endpoint_vars, endpoint_options)
+        """
         for endpoint_name, endpoint_config in get_val("endpoints", self._config, dict).items():
             plugin_name = get_val("plugin", endpoint_config, str)
             channel_name =  get_val("channel", endpoint_config, str)
             endpoint_vars = endpoint_config.get("vars", None)
-            yield plugin_name, channel_name, endpoint_name, endpoint_vars or {}
+            endpoint_options = {
+                "delivery": self._delivery_options(endpoint_config),
+                "batch": self._batch_options(endpoint_config),
+                "retry": self._retry_options(endpoint_config)
+            }
+            yield plugin_name, channel_name, endpoint_name, endpoint_vars or {}, endpoint_options
+
+    def _delivery_options(self, endpoint_config):
+        """Return the validated 'delivery' options of an endpoint."""
+        delivery_config = get_opt("delivery", endpoint_config, dict, {})
+        policy = get_opt("policy", delivery_config, str, "block")
+        if policy not in POLICIES:
+            raise ConfigValueError("policy", policy, f"one of {POLICIES}")
+        spill_path = get_opt("spill_path", delivery_config, str)
+        if policy == "spill" and spill_path is None:
+            raise ConfigKeyError("spill_path")
+        return {
+            "queue_size": get_int("queue_size", delivery_config, 1000),
+            "concurrency": get_int("concurrency", delivery_config, 1),
+            "policy": policy,
+            "spill_path": spill_path,
+            "sample_every": get_int("sample_every", delivery_config, 10),
+            "summary_interval": get_int("summary_interval", delivery_config, 60)
+        }
+
+    def _batch_options(self, endpoint_config):
+        """Return the validated 'batch' options of an endpoint."""
+        batch_config = get_opt("batch", endpoint_config, dict, {})
+        return {
+            "max_messages": get_int("max_messages", batch_config, 1),
+            "max_delay_ms": get_int("max_delay_ms", batch_config, 1000, minimum=0)
+        }
+
+    def _retry_options(self, endpoint_config):
+        """Return the validated 'retry' options of an endpoint, or None if failed alerts are not retried."""
+        retry_config = get_opt("retry", endpoint_config, dict)
+        if retry_config is None:
+            return None
+        return {
+            "max_attempts": get_int("max_attempts", retry_config, 5),
+            "base_delay_ms": get_int("base_delay_ms", retry_config, 1000),
+            "max_delay_ms": get_int("max_delay_ms", retry_config, 60000),
+            "breaker_threshold": get_int("breaker_threshold", retry_config, 5),
+            "breaker_reset_s": get_int("breaker_reset_s", retry_config, 30),
+            "journal_path": get_opt("journal_path", retry_config, str)
+        }
 
     @property
     def log_path(self):
@@ -73,3 +162,75 @@ class ConfigHandler:
             if log_path:
                 raise ConfigTypeError("str", log_path)
         return log_path
+
+
+    @property
+    def workers(self):
+        """Return the number of workflow worker threads."""
+        workers = self._config.get("workers", 1)
+        if type(workers) is not int:
+            raise ConfigTypeError("int", type(workers).__name__)
+        if workers < 1:
+            raise ConfigValueError("workers", workers, "an integer of at least 1")
+        return workers
+
+    @property
+    def workflow_queue(self):
+        """Return the validated 'workflow_queue' options for the queue of each worker thread."""
+        queue_config = get_opt("workflow_queue", self._config, dict, {})
+        policy = get_opt("policy", queue_config, str, "block")
+        if policy not in POLICIES:
+            raise ConfigValueError("policy", policy, f"one of {POLICIES}")
+        spill_path = get_opt("spill_path", queue_config, str)
+        if policy == "spill" and spill_path is None:
+            raise ConfigKeyError("spill_path")
+        return {
+            "queue_size": get_int("queue_size", queue_config, 1000),
+            "policy": policy,
+            "spill_path": spill_path,
+            "sample_every": get_int("sample_every", queue_config, 10),
+            "summary_interval": get_int("summary_interval", queue_config, 60)
+        }
+
+    @property
+    def runtime(self):
+        """Return the engine that runs workflows: 'threads' or 'async'."""
+        runtime = self._config.get("runtime", "threads")
+        if type(runtime) is not str:
+            raise ConfigTypeError("str", type(runtime).__name__)
+        if runtime not in RUNTIMES:
+            raise ConfigValueError("runtime", runtime, f"one of {RUNTIMES}")
+        return runtime
+
+    @property
+    def processes(self):
+        """Return the number of worker processes that monitored files are split across."""
+        return get_int("processes", self._config, 1)
+
+    @property
+    def checkpoint(self):
+        """Return the validated 'checkpoint' options, or None if read positions are not saved."""
+        checkpoint_config = get_opt("checkpoint", self._config, dict)
+        if checkpoint_config is None:
+            return None
+        max_catchup_bytes = get_opt("max_catchup_bytes", checkpoint_config, int)
+        if max_catchup_bytes is not None and max_catchup_bytes < 0:
+            raise ConfigValueError("max_catchup_bytes", max_catchup_bytes, "an integer of at least 0")
+        return {
+            "path": get_val("path", checkpoint_config, str),
+            "interval": get_int("interval", checkpoint_config, 5),
+            "max_catchup_bytes": max_catchup_bytes
+        }
+
+    @property
+    def metrics(self):
+        """Return the validated 'metrics' options, or None if nodes are not instrumented."""
+        metrics_config = get_opt("metrics", self._config, dict)
+        if metrics_config is None:
+            return None
+        return {
+            "host": get_opt("host", metrics_config, str, "127.0.0.1"),
+            "port": get_opt("port", metrics_config, int),
+            "dump_path": get_opt("dump_path", metrics_config, str),
+            "slow_alert_ms": get_opt("slow_alert_ms", metrics_config, int)
+        }
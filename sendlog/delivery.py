@@ -0,0 +1,237 @@
+"""Deliver alerts to endpoints on their own threads, decoupled from rule evaluation."""
+
+import threading
+import asyncio
+import queue
+import time
+
+from bounded_queue import BoundedQueue, join_all
+from outbox import Outbox
+from utils.errors import DeliveryError, AlertsDroppedError
+
+class EndpointQueue:
+    """
+    Bounded queue and worker threads for a single endpoint.
+
+    Items are (msg, meta) pairs passed to handler(msg, meta) by up to
+    'concurrency' threads. If max_messages is greater than 1, each thread
+    collects up to max_messages items, waiting at most max_delay_ms after the
+    first, and passes the list to batch_handler(items) instead.
+
+    If asynchronous is True, the handlers return coroutines, which each
+    thread runs to completion on its own event loop.
+
+    While alerts are being dropped by a full queue, the number dropped is
+    logged every summary_interval seconds.
+
+    handler returns True if the alert was sent, and batch_handler returns the
+    items that were not. If retry options are given, alerts that were not
+    sent are retried by an Outbox rather than lost. Alerts whose handler
+    raises are logged and discarded, so the threads keep running.
+    """
+
+    def __init__(self, endpoint_name, handler, batch_handler=None, queue_size=1000, concurrency=1, policy="block", spill_path=None,
+                 sample_every=10, summary_interval=60, max_messages=1, max_delay_ms=0, asynchronous=False, retry=None):
+        self.endpoint_name = endpoint_name
+        self._handler = handler
+        self._batch_handler = batch_handler
+        self._asynchronous = asynchronous
+        self._concurrency = concurrency
+        self._max_messages = max_messages
+        self._max_delay = max_delay_ms / 1000
+        self._policy = policy
+        self._summary_interval = summary_interval
+        self._queue = BoundedQueue(queue_size, policy, spill_path, sample_every, self._dropped)
+        self._outbox = None if retry is None else Outbox(endpoint_name, self._retry_handler(), **retry)
+        self._stopped = threading.Event()
+        self._threads = []
+        self.dropped = 0
+        self._reported = 0
+
+    def _retry_handler(self):
+        if not self._asynchronous:
+            return self._handler
+        loop = None
+        def handler(msg, meta):
+            # Retries are sent on the outbox's own thread, so it gets its own event loop
+            nonlocal loop
+            if loop is None:
+                loop = asyncio.new_event_loop()
+            return loop.run_until_complete(self._handler(msg, meta))
+        return handler
+
+    def start(self):
+        if self._outbox is not None:
+            self._outbox.start()
+        for _ in range(self._concurrency):
+            worker_thread = threading.Thread(target=self._work)
+            worker_thread.daemon = True
+            worker_thread.start()
+            self._threads.append(worker_thread)
+        if self._policy in ("drop", "drop_oldest", "sample"):
+            summary_thread = threading.Thread(target=self._summarise_periodically)
+            summary_thread.daemon = True
+            summary_thread.start()
+
+    def submit(self, msg, meta):
+        self._queue.put((msg, meta))
+
+    def close(self, drained=None):
+        """Wait until every queued alert has been handled, then stop the threads and call drained()."""
+        self._queue.join()
+        self.stop()
+        if drained is not None:
+            drained()
+
+    def stop(self, timeout=0):
+        """Stop the threads once they finish their current alerts, waiting up to timeout seconds for them to exit."""
+        self._stopped.set()
+        self.summarise()
+        if self._outbox is not None:
+            self._outbox.stop()
+        deadline = time.monotonic() + timeout
+        for worker_thread in self._threads:
+            worker_thread.join(max(deadline - time.monotonic(), 0))
+
+    def _dropped(self, item):
+        # Called by the full queue for each alert it discards
+        self.dropped += 1
+
+    def _summarise_periodically(self):
+        while not self._stopped.wait(self._summary_interval):
+            self.summarise()
+
+    def summarise(self):
+        """Log the number of alerts dropped since the last summary, if any were."""
+        dropped, self._reported = self.dropped - self._reported, self.dropped
+        if dropped:
+            AlertsDroppedError(self.endpoint_name, self._policy, dropped)
+
+    def _get(self, timeout=None):
+        """Return the next item, or None if the queue was closed or timeout seconds passed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stopped.is_set():
+            wait = 1 if deadline is None else min(max(deadline - time.monotonic(), 0), 1)
+            try:
+                return self._queue.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+        return None
+
+    def _work(self):
+        if self._asynchronous:
+            loop = asyncio.new_event_loop()
+            handler = lambda msg, meta: loop.run_until_complete(self._handler(msg, meta))
+            batch_handler = lambda items: loop.run_until_complete(self._batch_handler(items))
+        else:
+            handler, batch_handler = self._handler, self._batch_handler
+        if self._batch_handler is not None and self._max_messages > 1:
+            self._work_batches(batch_handler)
+            return
+        while True:
+            item = self._get()
+            if item is None:
+                return
+            msg, meta = item
+            try:
+                if self._outbox is None:
+                    handler(msg, meta)
+                else:
+                    self._outbox.attempt(handler, msg, meta)
+            except Exception as exc_info:
+                # The thread must keep running, or the endpoint's queue stalls
+                DeliveryError(self.endpoint_name, exc_info, 1)
+            finally:
+                self._queue.task_done()
+
+    def _work_batches(self, batch_handler):
+        while True:
+            item = self._get()
+            if item is None:
+                return
+            items = [item]
+            deadline = time.monotonic() + self._max_delay
+            while len(items) < self._max_messages:
+                item = self._get(timeout=max(deadline - time.monotonic(), 0))
+                if item is None:
+                    break
+                items.append(item)
+            try:
+                if self._outbox is None:
+                    batch_handler(items)
+                else:
+                    self._outbox.attempt_batch(batch_handler, items)
+            except Exception as exc_info:
+                DeliveryError(self.endpoint_name, exc_info, len(items))
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    @property
+    def retrying(self):
+        """Return the number of alerts waiting to be retried."""
+        return 0 if self._outbox is None else len(self._outbox)
+
+    def join(self, timeout=None):
+        return self._queue.join(timeout)
+
+class DeliveryStage:
+    """Route alerts to the EndpointQueue of each endpoint."""
+
+    def __init__(self):
+        self._endpoints = {}
+        # Queues of removed endpoints, until their alerts are delivered
+        self._removed = {}
+        self._started = False
+
+    def add_endpoint(self, endpoint_name, handler, batch_handler=None, **options):
+        endpoint_queue = self._endpoints[endpoint_name] = EndpointQueue(endpoint_name, handler, batch_handler, **options)
+        # Endpoints added by a config reload start straight away
+        if self._started:
+            endpoint_queue.start()
+
+    def remove_endpoint(self, endpoint_name, drained=None):
+        """Stop routing alerts to an endpoint, and call drained() once the alerts already queued for it are handled."""
+        endpoint_queue = self._removed[endpoint_name] = self._endpoints.pop(endpoint_name)
+        if not self._started:
+            endpoint_queue.start()
+        def close():
+            endpoint_queue.close(drained)
+            if self._removed.get(endpoint_name) is endpoint_queue:
+                del self._removed[endpoint_name]
+        close_thread = threading.Thread(target=close)
+        close_thread.daemon = True
+        close_thread.start()
+
+    def start(self):
+        self._started = True
+        for endpoint_queue in self._endpoints.values():
+            endpoint_queue.start()
+
+    def stop(self, timeout=0):
+        """Stop every endpoint's threads, waiting up to timeout seconds for them to exit."""
+        deadline = time.monotonic() + timeout
+        for endpoint_queue in [*self._endpoints.values(), *self._removed.values()]:
+            endpoint_queue.stop(max(deadline - time.monotonic(), 0))
+
+    def submit(self, endpoint_name, msg, meta):
+        # Workflows compiled before a reload may still send to a removed endpoint
+        endpoint_queue = self._endpoints.get(endpoint_name) or self._removed[endpoint_name]
+        endpoint_queue.submit(msg, meta)
+
+    def depths(self):
+        """Return the number of queued alerts for each endpoint."""
+        return {name: endpoint_queue.depth for name, endpoint_queue in self._endpoints.items()}
+
+    def dropped(self):
+        """Return the number of alerts each endpoint has dropped because its queue was full."""
+        return {name: endpoint_queue.dropped for name, endpoint_queue in self._endpoints.items()}
+
+    def join(self, timeout=None):
+        """Block until every queued alert has been delivered or has failed, returning False if timeout seconds pass first."""
+        return join_all(list(self._endpoints.values()), timeout)
@@ -0,0 +1,104 @@
+"""Index the rules under a LogType so only rules that can match a message are evaluated."""
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+import re
+
+from plugin import Rule
+
+def _literal_runs(items):
+    """
+    Split parsed regex items into runs of literal text.
+
+    Return the runs and whether every item was a literal.
+    """
+    runs = [""]
+    complete = True
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            runs[-1] += chr(av)
+        elif op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+            # Capture groups without inline flags are transparent
+            sub_runs, sub_complete = _literal_runs(av[3])
+            if sub_complete:
+                runs[-1] += sub_runs[0]
+            else:
+                runs[-1] += sub_runs[0]
+                runs.extend(sub_runs[1:])
+                complete = False
+        elif op is sre_parse.AT and av is sre_parse.AT_BEGINNING and runs == [""]:
+            continue
+        else:
+            runs.append("")
+            complete = False
+    return runs, complete
+
+def literal_requirements(regex):
+    """
+    Return the literal prefix and longest literal substring required by regex.
+
+    Either value is an empty string if nothing can be guaranteed.
+    """
+    if isinstance(regex, re.Pattern):
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    else:
+        parsed = sre_parse.parse(regex)
+    if parsed.state.flags & re.IGNORECASE:
+        return "", ""
+    runs, _ = _literal_runs(parsed.data)
+    return runs[0], max(runs, key=len)
+
+class RuleIndex:
+    """
+    Prefilter for the Rule classes of a LogType.
+
+    Rules using the default __call__ method are indexed by their declared prefix,
+    or by the literal prefix or substring their regex requires. Rules that
+    override __call__ or only declare a matcher are always evaluated, and rules
+    without a prefix, matcher or regex are never evaluated because they can
+    never match.
+    """
+
+    def __init__(self, rule_classes):
+        self._all = list(range(len(rule_classes)))
+        self._always = []
+        self._prefixes = {}
+        self._substrings = []
+
+        for i, rule_cls in enumerate(rule_classes):
+            if rule_cls.__call__ is not Rule.__call__:
+                self._always.append(i)
+                continue
+            if rule_cls.prefix:
+                prefix, substring = rule_cls.prefix, ""
+            elif rule_cls.matcher is not None:
+                prefix, substring = "", ""
+            elif rule_cls._pattern is not None:
+                prefix, substring = literal_requirements(rule_cls._pattern)
+            else:
+                continue
+            if prefix:
+                self._prefixes.setdefault(prefix[0], []).append((prefix, i))
+            elif substring:
+                self._substrings.append((substring, i))
+            else:
+                self._always.append(i)
+
+    def candidates(self, message):
+        """Return the positions of the rules that can match message, in order."""
+        if type(message) is not str:
+            return self._all
+        if not self._prefixes and not self._substrings:
+            return self._always
+
+        hits = list(self._always)
+        for prefix, i in self._prefixes.get(message[:1], ()):
+            if message.startswith(prefix):
+                hits.append(i)
+        for substring, i in self._substrings:
+            if substring in message:
+                hits.append(i)
+        hits.sort()
+        return hits
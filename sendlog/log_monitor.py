@@ -1,26 +1,419 @@
+from collections import deque
+from fnmatch import fnmatchcase
 import inotify.adapters
+import inotify.calls
+import inotify.constants
 import os
+import time
+
+from utils.errors import CatchUpLimitError
+from utils.paths import is_pattern, pattern_depth, matches
+
+FILE_EVENTS = inotify.constants.IN_MODIFY | inotify.constants.IN_MOVE_SELF | inotify.constants.IN_DELETE_SELF
+DIR_EVENTS = inotify.constants.IN_CREATE | inotify.constants.IN_MOVED_TO
+
+CHUNK_SIZE = 65536
+
+def line_start(path, offset):
+    """Return the offset of the first line in path that starts at or after offset."""
+    if offset == 0:
+        return 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        position = offset - 1
+        while True:
+            chunk = os.pread(fd, CHUNK_SIZE, position)
+            if not chunk:
+                return position
+            index = chunk.find(b"\n")
+            if index != -1:
+                return position + index + 1
+            position += len(chunk)
+    finally:
+        os.close(fd)
+
+class LineBatch(list):
+    """List of lines read together, with the wall-clock time at which they were read."""
+    __slots__ = ["detected"]
+
+    def __init__(self, lines, detected):
+        super().__init__(lines)
+        self.detected = detected
+
+class TailedFile:
+    """
+    Open descriptor on one inode of a log file, and the offset read up to.
+
+    New data is read in fixed-size binary chunks, and the complete lines of
+    each chunk are returned together as a LineBatch. A trailing line without a
+    newline is held back until the rest of it is written.
+    """
+    def __init__(self, path, offset=None):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        stat = os.fstat(self.fd)
+        self.inode = stat.st_ino
+        self.offset = stat.st_size if offset is None else offset
+        self.last_read = time.monotonic()
+        self._partial = b""
+
+    @property
+    def line_offset(self):
+        """Return the offset just past the last complete line read."""
+        return self.offset - len(self._partial)
+
+    def read_batches(self):
+        """Yield lists of lines written since the last read, starting over if the file was truncated."""
+        if os.fstat(self.fd).st_size < self.offset:
+            self.offset = 0
+            self._partial = b""
+        while True:
+            chunk = os.pread(self.fd, CHUNK_SIZE, self.offset)
+            if not chunk:
+                return
+            self.offset += len(chunk)
+            self.last_read = time.monotonic()
+            detected = time.time()
+            *lines, self._partial = (self._partial + chunk).split(b"\n")
+            if lines:
+                yield LineBatch([line.decode("utf-8", errors="replace").strip() for line in lines], detected)
+
+    def close(self):
+        """Close the descriptor, yielding any unterminated last line as a batch."""
+        if self._partial:
+            yield LineBatch([self._partial.decode("utf-8", errors="replace").strip()], time.time())
+            self._partial = b""
+        os.close(self.fd)
 
 class LogMonitor:
-    """Wrapper for inotify that detects new lines only."""
-    def __init__(self, paths):
-        self.notifier = inotify.adapters.Inotify()
-        self.file_positions = {path: os.path.getsize(path) for path in paths}
+    """
+    Wrapper for inotify that detects new lines only.
+
+    Files are tracked by inode. When a file is rotated (moved or deleted and
+    recreated), the new file is read from the start, and the rotated file is
+    kept open and drained until nothing has been written to it for
+    drain_timeout seconds. Truncated files are read again from the start.
+
+    Files are read from their end, unless positions holds the (inode, offset)
+    at which a file was last processed. Lines written since then are read
+    first, or from the start of the file if it was rotated or truncated in
+    the meantime, but never more than max_catchup_bytes.
+
+    Paths may be glob patterns, whose wildcards never match across a '/'.
+    The directory before the first wildcard is watched, and files and
+    directories that match are followed as they are created, so new files
+    are read from the start.
+
+    monitor() blocks while waiting for events. An event loop can instead
+    create it with block_duration_s=0, watch fileno() for reads, and call
+    poll() when it is readable and about once per second. Functions passed to
+    call_soon(), e.g. from a signal handler, are run by monitor() or poll()
+    between batches, so they can safely add and remove watches. After stop(),
+    monitor() returns once the batch it is reading has been yielded.
+
+    Functions passed to on_forget() are called with each path that stops being
+    followed, after its last batch has been yielded: when the last file at a
+    path that was rotated or deleted has been drained, or when remove_watches()
+    stops following it. State kept per path can then be discarded, e.g. for
+    short-lived files matched by a pattern.
+    """
+    def __init__(self, paths, drain_timeout=30, block_duration_s=1, positions=None, max_catchup_bytes=None):
+        self.notifier = inotify.adapters.Inotify(block_duration_s=block_duration_s)
+        self.drain_timeout = drain_timeout
+        self.max_catchup_bytes = max_catchup_bytes
+        self._positions = positions or {}
+        self._catching_up = True
+        self._files = {}
+        self._dirs = {}
+        self._patterns = {}
+        self._rotated = []
+        self._last_check = time.monotonic()
+        self._callbacks = deque()
+        self._forget_callbacks = []
+        self._stopped = False
         self.add_watches(paths)
-    
+
+    @property
+    def file_positions(self):
+        return {path: tailed.offset for path, tailed in self._files.items()}
+
+    def position(self, path):
+        """Return the inode and line offset that the file at path has been read up to, or None."""
+        tailed = self._files.get(path)
+        if tailed is None:
+            return None
+        return tailed.inode, tailed.line_offset
+
+    def fileno(self):
+        """Return the inotify descriptor, which is readable when events are waiting."""
+        # The adapter keeps its descriptor private
+        return self.notifier._Inotify__inotify_fd
+
     def add_watches(self, paths):
+        """Follow paths, which may be glob patterns."""
+        for path in paths:
+            if is_pattern(path):
+                # Files that already exist are read from their end, so no lines are yielded
+                for _ in self._watch_pattern(path, pattern_depth(path), discovered=False):
+                    pass
+                continue
+            directory, name = os.path.split(path)
+            self._watch_dir(directory)
+            self._dirs[directory].add(name)
+            # Files that do not exist yet are opened when they are created
+            if os.path.exists(path):
+                self._open(path, self._start_offset(path))
+
+    def _watch_dir(self, directory, refresh=False):
+        if directory not in self._dirs or refresh:
+            self.notifier.add_watch(directory, mask=DIR_EVENTS)
+        self._dirs.setdefault(directory, set())
+        self._patterns.setdefault(directory, set())
+
+    def _watch_pattern(self, pattern, depth, directory=None, discovered=True):
+        """
+        Watch the directory that holds component depth of pattern, and follow
+        what matches it there: files if it is the last component, and
+        directories to watch for the next component otherwise.
+
+        Files discovered after the pattern was added are read from the start,
+        and their (path, batch) pairs are yielded.
+        """
+        if directory is None:
+            directory = os.sep.join(pattern.split(os.sep)[:depth]) or os.sep
+        # A discovered directory may replace one that was deleted along with its watch
+        self._watch_dir(directory, refresh=discovered)
+        self._patterns[directory].add((pattern, depth))
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return
+        for name in names:
+            yield from self._matched(directory, name, pattern, depth, discovered)
+
+    def _matched(self, directory, name, pattern, depth, discovered=True):
+        """Follow directory/name if it matches component depth of pattern."""
+        parts = pattern.split(os.sep)
+        if not fnmatchcase(name, parts[depth]):
+            return
+        path = os.path.join(directory, name)
+        if depth + 1 < len(parts):
+            if os.path.isdir(path):
+                yield from self._watch_pattern(pattern, depth + 1, path, discovered)
+        elif os.path.isfile(path):
+            if discovered:
+                yield from ((path, batch) for batch in self._created(path))
+            elif path not in self._files:
+                self._open(path, self._start_offset(path))
+
+    def remove_watches(self, paths):
+        """Stop following paths, which may be glob patterns, discarding lines that have not been read yet."""
         for path in paths:
-            self.notifier.add_watch(path)
-    
+            if is_pattern(path):
+                for directory, patterns in list(self._patterns.items()):
+                    patterns.difference_update({item for item in patterns if item[0] == path})
+                    self._unwatch_dir(directory)
+                followed = [file_path for file_path in self._files if matches(path, file_path)]
+                followed += [tailed.path for tailed in self._rotated if matches(path, tailed.path)]
+            else:
+                directory, name = os.path.split(path)
+                if directory in self._dirs:
+                    self._dirs[directory].discard(name)
+                    self._unwatch_dir(directory)
+                followed = [path]
+            for file_path in followed:
+                if not self._wanted(file_path):
+                    self._unfollow(file_path)
+
+    def _wanted(self, path):
+        """Return True if path is still followed by name or by a pattern."""
+        directory, name = os.path.split(path)
+        if name in self._dirs.get(directory, ()):
+            return True
+        patterns = {pattern for patterns in self._patterns.values() for pattern, _ in patterns}
+        return any(matches(pattern, path) for pattern in patterns)
+
+    def _unwatch_dir(self, directory):
+        if self._dirs.get(directory) or self._patterns.get(directory):
+            return
+        self._dirs.pop(directory, None)
+        self._patterns.pop(directory, None)
+        try:
+            self.notifier.remove_watch(directory)
+        except inotify.calls.InotifyError:
+            # The kernel already removed the watch of a deleted directory
+            pass
+
+    def _unfollow(self, path):
+        tailed = self._files.pop(path, None)
+        followed = tailed is not None
+        if tailed is not None:
+            try:
+                self.notifier.remove_watch(path)
+            except inotify.calls.InotifyError:
+                pass
+            os.close(tailed.fd)
+        for tailed in [tailed for tailed in self._rotated if tailed.path == path]:
+            self._rotated.remove(tailed)
+            os.close(tailed.fd)
+            followed = True
+        if followed:
+            self._forgotten(path)
+
+    def _forgotten(self, path):
+        """Call the on_forget() callbacks if no file at path is open any more."""
+        if path in self._files or any(tailed.path == path for tailed in self._rotated):
+            return
+        for callback in self._forget_callbacks:
+            callback(path)
+
+    def call_soon(self, callback):
+        """Run callback() on the monitoring thread before the next batch is read."""
+        self._callbacks.append(callback)
+
+    def on_forget(self, callback):
+        """Call callback(path) on the monitoring thread whenever path stops being followed."""
+        self._forget_callbacks.append(callback)
+
+    def stop(self):
+        """Make monitor() return, e.g. from a SIGTERM handler."""
+        self._stopped = True
+
+    def close(self):
+        """Close every descriptor, once monitor() has returned."""
+        for tailed in [*self._files.values(), *self._rotated]:
+            os.close(tailed.fd)
+        self._files.clear()
+        self._rotated.clear()
+        # The adapter closes its inotify descriptor once it is garbage collected
+        self.notifier = None
+
+    def _run_callbacks(self):
+        while self._callbacks:
+            self._callbacks.popleft()()
+
+    def _start_offset(self, path):
+        """Return the offset to start reading path from, or None for its end."""
+        saved = self._positions.get(path)
+        if saved is None:
+            return None
+        inode, offset = saved
+        stat = os.stat(path)
+        if stat.st_ino != inode or stat.st_size < offset:
+            # Rotated or truncated while stopped
+            offset = 0
+        if self.max_catchup_bytes is not None and stat.st_size - offset > self.max_catchup_bytes:
+            start = line_start(path, stat.st_size - self.max_catchup_bytes)
+            CatchUpLimitError(path, start - offset)
+            offset = start
+        return offset
+
+    def _open(self, path, offset=None):
+        self._files[path] = TailedFile(path, offset)
+        self.notifier.add_watch(path, mask=FILE_EVENTS)
+
+    def _rotate(self, path):
+        """Stop following the current file at path, but keep draining it."""
+        tailed = self._files.pop(path)
+        try:
+            self.notifier.remove_watch(path)
+        except inotify.calls.InotifyError:
+            # The kernel already removed the watch of a deleted file
+            pass
+        self._rotated.append(tailed)
+        yield from tailed.read_batches()
+
+    def _created(self, path):
+        """Follow a file created at path, reading it from the start."""
+        tailed = self._files.get(path)
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return
+        if tailed is not None:
+            if tailed.inode == inode:
+                return
+            yield from self._rotate(path)
+        self._open(path, offset=0)
+        yield from self._files[path].read_batches()
+
+    def _check(self):
+        """Catch rotations and deletions that produced no events, and drain rotated files."""
+        for path in list(self._files):
+            try:
+                rotated = os.stat(path).st_ino != self._files[path].inode
+            except FileNotFoundError:
+                # Deleted, which produces no event while the file is held open, so drain it as if rotated
+                yield from ((path, batch) for batch in self._rotate(path))
+                continue
+            if rotated:
+                yield from ((path, batch) for batch in self._created(path))
+
+        now = time.monotonic()
+        for tailed in list(self._rotated):
+            yield from ((tailed.path, batch) for batch in tailed.read_batches())
+            if now - tailed.last_read > self.drain_timeout:
+                self._rotated.remove(tailed)
+                yield from ((tailed.path, batch) for batch in tailed.close())
+                self._forgotten(tailed.path)
+        self._last_check = now
+
+    def _handle(self, event):
+        (_, event_types, path, filename) = event
+        if filename:
+            # Event from a watched directory
+            if "IN_CREATE" in event_types or "IN_MOVED_TO" in event_types:
+                if filename in self._dirs.get(path, ()):
+                    full_path = os.path.join(path, filename)
+                    yield from ((full_path, batch) for batch in self._created(full_path))
+                for pattern, depth in list(self._patterns.get(path, ())):
+                    yield from self._matched(path, filename, pattern, depth)
+        elif path in self._files:
+            if "IN_MODIFY" in event_types:
+                yield from ((path, batch) for batch in self._files[path].read_batches())
+            if "IN_MOVE_SELF" in event_types or "IN_DELETE_SELF" in event_types:
+                yield from ((path, batch) for batch in self._rotate(path))
+                # The replacement may have been created before this event was read
+                if os.path.exists(path):
+                    yield from ((path, batch) for batch in self._created(path))
+        if "IN_Q_OVERFLOW" in event_types:
+            # Events were lost, so read everything that may have changed
+            yield from self._read_all()
+
+    def _read_all(self):
+        for tailed in list(self._files.values()):
+            yield from ((tailed.path, batch) for batch in tailed.read_batches())
+
+    def _catch_up(self):
+        """Read lines written since the saved positions, once."""
+        if self._catching_up:
+            self._catching_up = False
+            yield from self._read_all()
+
     def monitor(self):
-        """Yield log message and origin when a change is detected."""
+        """Yield the origin and a batch of new log messages when a change is detected."""
+        for item in self._catch_up():
+            if self._stopped:
+                return
+            yield item
         while True:
-            for event in self.notifier.event_gen(yield_nones=False, timeout_s=1):
-                (_, event_types, path, _) = event
-                if "IN_MODIFY" in event_types and path in self.file_positions:
-                    with open(path, "r") as f:
-                        f.seek(self.file_positions[path])
-                        new_lines = f.readlines()
-                        self.file_positions[path] = f.tell()
-                        for line in new_lines:
-                            yield path, line.strip()
\ No newline at end of file
+            # None is yielded after each idle second, so rotated files are still drained
+            for event in self.notifier.event_gen(yield_nones=True, terminal_events=()):
+                if self._stopped:
+                    return
+                self._run_callbacks()
+                if event is not None:
+                    yield from self._handle(event)
+                if time.monotonic() - self._last_check >= 1:
+                    yield from self._check()
+
+    def poll(self):
+        """Return the (path, batch) pairs for events that are already waiting, without blocking."""
+        self._run_callbacks()
+        batches = list(self._catch_up())
+        # With no block duration, event_gen stops as soon as no event is waiting
+        for event in self.notifier.event_gen(timeout_s=0, yield_nones=False, terminal_events=()):
+            batches.extend(self._handle(event))
+        if time.monotonic() - self._last_check >= 1:
+            batches.extend(self._check())
+        return batches
@@ -1,56 +1,257 @@
 from config_handler import ConfigHandler
 from workflow_manager import WorkflowManager
 from log_monitor import LogMonitor
+from worker_pool import WorkerPool
+from delivery import DeliveryStage
+from async_runtime import AsyncDelivery, AsyncRuntime
+from supervisor import Supervisor, shard_paths
+from checkpoint import Checkpoint
+from metrics import Metrics, MetricsServer, AlertLatency
 
 from utils import log
+from bounded_queue import join_all
+from utils.errors import ConfigReloadError, ShutdownTimeoutError
+from functools import partial
+import asyncio
 import logging
+import multiprocessing
+import signal
 import threading
-import queue
 import time
 
 CONFIG_PATH = "/etc/sendlog/sendlog.yml"
+# Seconds allowed after SIGTERM for queued lines and alerts to be processed
+SHUTDOWN_TIMEOUT = 30
+# Seconds between checks for suppressed keys whose window has ended
+SUPPRESSION_SWEEP_INTERVAL = 10
 
-def process_workflows(workflow_queue):
-    while True:
-        workflow, msg = workflow_queue.get()
-        workflow(msg)
-        workflow_queue.task_done()
+def endpoint_definitions(config_handler, shard=None):
+    """
+    Yield the endpoints from config. Worker processes pass their shard index,
+    which is appended to spill and retry journal paths so that workers never
+    share one.
+    """
+    for *data, endpoint_options in config_handler.endpoints():
+        spill_path = endpoint_options["delivery"]["spill_path"]
+        if shard is not None and spill_path is not None:
+            endpoint_options["delivery"]["spill_path"] = f"{spill_path}.{shard}"
+        retry_options = endpoint_options["retry"]
+        if shard is not None and retry_options is not None and retry_options["journal_path"] is not None:
+            retry_options["journal_path"] = f"{retry_options['journal_path']}.{shard}"
+        yield (*data, endpoint_options)
 
-def main():
-
-    # Load config into ConfigHandler
-    config_handler = ConfigHandler(CONFIG_PATH)
-    
-    # Start logging
-    log.config(config_handler.log_path)
-    logger = logging.getLogger(__name__)
+def load_workflows(config_handler, delivery, paths=None, shard=None, open_endpoints=True, metrics=None, latency=None):
+    """
+    Create a WorkflowManager with the endpoints and file workflows from config.
 
-    # Create WorkflowManager
-    workflow_manager = WorkflowManager()
+    If paths is given, only the workflows of those files are loaded.
+    """
+    workflow_manager = WorkflowManager(delivery, open_endpoints, metrics, latency)
 
     # Load endpoints from config
-    for data in config_handler.endpoints():
+    for data in endpoint_definitions(config_handler, shard):
         workflow_manager.load_endpoint(*data)
 
     # Load file workflows from config
     for data in config_handler.files():
-        workflow_manager.load_file(*data)
-    
-    workflow_manager.display_worktrees()
+        if paths is None or data[0] in paths:
+            workflow_manager.load_file(*data)
+    for data in config_handler.suppressions():
+        if paths is None or data[0] in paths:
+            workflow_manager.load_suppression(*data)
+
+    return workflow_manager
+
+def reload_config(workflow_manager, log_monitor, paths=None, shard=None):
+    """
+    Read the config file again and apply changes to endpoints and file
+    workflows, keeping the current configuration if the new one fails to
+    load. Endpoints are then reopened, as on every SIGHUP.
+
+    Must run on the thread that monitors files, e.g. through
+    LogMonitor.call_soon(). Worker processes pass their paths, so that only
+    the workflows of their own files are reloaded.
+    """
+    try:
+        config_handler = ConfigHandler(CONFIG_PATH)
+        endpoints = list(endpoint_definitions(config_handler, shard))
+        files = [data for data in config_handler.files() if paths is None or data[0] in paths]
+        suppressions = [data for data in config_handler.suppressions() if paths is None or data[0] in paths]
+        added, removed = workflow_manager.reload(endpoints, files, suppressions)
+    except Exception as e:
+        # A bad config file must not stop sendlog
+        ConfigReloadError(CONFIG_PATH, e)
+    else:
+        log_monitor.remove_watches(removed)
+        log_monitor.add_watches(added)
+        log.write(logging.info, "CONFIG_RELOADED", f"Reloaded '{CONFIG_PATH}'", added_paths=added, removed_paths=removed)
+    workflow_manager.reopen_endpoints()
 
-    # Set up worker thread
-    workflow_queue = queue.Queue()
-    worker_thread = threading.Thread(target=process_workflows, args=(workflow_queue,))
-    worker_thread.daemon = True
-    worker_thread.start()
+def run_threads(config_handler, workflow_manager, delivery, log_monitor, checkpoint=None, latency=None, shard=None, reload=None,
+                metrics=None):
+    """
+    Monitor files on this thread, and run workflows and deliveries on worker threads.
+
+    On SIGHUP, reload() is run on this thread if given, and endpoints are
+    reopened otherwise. On SIGTERM, files stop being read, and the lines
+    already read are processed and their alerts delivered before returning.
+    """
+    queue_options = config_handler.workflow_queue
+    if shard is not None and queue_options["spill_path"] is not None:
+        queue_options["spill_path"] = f"{queue_options['spill_path']}.{shard}"
+
+    # Reload config and reopen endpoint files and connections on SIGHUP, e.g. after logrotate
+    hangup = reload or workflow_manager.reopen_endpoints
+    signal.signal(signal.SIGHUP, lambda signum, frame: log_monitor.call_soon(hangup))
+    # Stop reading files on SIGTERM, e.g. from systemctl stop, so that what was read is finished
+    signal.signal(signal.SIGTERM, lambda signum, frame: log_monitor.stop())
+
+    # Start endpoint delivery threads
+    delivery.start()
+
+    # Set up worker threads
+    worker_pool = WorkerPool(config_handler.workers, latency, resolve=workflow_manager.get_batch_workflow, checkpoint=checkpoint,
+                             **queue_options)
+    worker_pool.start()
+    if metrics is not None:
+        metrics.sample("worker_queue_batches", "gauge", "Batches of lines waiting for each worker thread.", "worker",
+                       lambda: dict(enumerate(worker_pool.depths())))
+    # Discard what is kept for files that are no longer followed, e.g. deleted files matched by a pattern
+    log_monitor.on_forget(workflow_manager.forget_path)
+    log_monitor.on_forget(worker_pool.forget)
 
     # Start file monitoring
-    paths = workflow_manager.get_paths()
-    log_monitor = LogMonitor(paths)
-    for path, msg in log_monitor.monitor():
-        workflow = workflow_manager.get_workflow(path)
-        workflow_queue.put((workflow, msg))
+    try:
+        for path, batch in log_monitor.monitor():
+            # The position is recorded once the batch has been processed
+            worker_pool.submit(path, workflow_manager.get_batch_workflow(path), batch, log_monitor.position(path))
+        # Deliver the alerts of every batch whose position is saved below
+        if not join_all([worker_pool, delivery], SHUTDOWN_TIMEOUT):
+            ShutdownTimeoutError(SHUTDOWN_TIMEOUT)
+    finally:
+        worker_pool.stop()
+
+def run_async(workflow_manager, delivery, log_monitor, checkpoint=None, latency=None, reload=None):
+    """Monitor files, run workflows and deliver alerts on one event loop."""
+    asyncio.run(AsyncRuntime(workflow_manager, delivery, log_monitor, checkpoint, latency, reload, SHUTDOWN_TIMEOUT).run())
+
+def serve(config_handler, paths=None, shard=None):
+    """Load the workflows of paths (or every file) and monitor them with the configured runtime."""
+    # Create WorkflowManager and the endpoint delivery stage
+    runtime = config_handler.runtime
+    delivery = AsyncDelivery() if runtime == "async" else DeliveryStage()
+    metrics_options = config_handler.metrics
+    metrics = latency = None
+    if metrics_options is not None:
+        metrics = Metrics()
+        latency = AlertLatency(metrics, metrics_options["slow_alert_ms"])
+    workflow_manager = load_workflows(config_handler, delivery, paths, shard, metrics=metrics, latency=latency)
+
+    if shard is None:
+        workflow_manager.display_worktrees()
+
+    # Report suppressed alerts once their burst ends, rather than when their rule next matches
+    stopped = threading.Event()
+    sweep_thread = threading.Thread(target=expire_suppressed_periodically, args=(workflow_manager, stopped))
+    sweep_thread.daemon = True
+    sweep_thread.start()
+
+    if metrics is not None:
+        metrics.sample("endpoint_queue_alerts", "gauge", "Alerts waiting to be sent to each endpoint.", "endpoint", delivery.depths)
+        metrics.sample("endpoint_dropped_alerts_total", "counter", "Alerts discarded because an endpoint's queue was full.", "endpoint",
+                       delivery.dropped)
+        start_metrics(metrics, metrics_options, shard)
+
+    # Resume from saved read positions
+    checkpoint_options = config_handler.checkpoint
+    checkpoint = None
+    monitor_options = {}
+    if checkpoint_options is not None:
+        checkpoint = Checkpoint(checkpoint_options["path"], checkpoint_options["interval"])
+        monitor_options = {"positions": checkpoint.load(), "max_catchup_bytes": checkpoint_options["max_catchup_bytes"]}
+        checkpoint.start()
+
+    try:
+        if runtime == "async":
+            log_monitor = LogMonitor(workflow_manager.get_paths(), block_duration_s=0, **monitor_options)
+            reload = partial(reload_config, workflow_manager, log_monitor, paths, shard)
+            run_async(workflow_manager, delivery, log_monitor, checkpoint, latency, reload)
+        else:
+            log_monitor = LogMonitor(workflow_manager.get_paths(), **monitor_options)
+            reload = partial(reload_config, workflow_manager, log_monitor, paths, shard)
+            run_threads(config_handler, workflow_manager, delivery, log_monitor, checkpoint, latency, shard, reload, metrics)
+    finally:
+        stopped.set()
+        workflow_manager.close_endpoints()
+        if checkpoint is not None:
+            checkpoint.close()
+
+def expire_suppressed_periodically(workflow_manager, stopped):
+    while not stopped.wait(SUPPRESSION_SWEEP_INTERVAL):
+        workflow_manager.expire_suppressed()
+
+def start_metrics(metrics, metrics_options, shard=None):
+    """Serve metrics over HTTP if a port is set, and dump them on SIGUSR1."""
+    port, dump_path = metrics_options["port"], metrics_options["dump_path"]
+    # Each worker process serves and dumps its own metrics
+    if shard is not None:
+        port = port and port + shard
+        dump_path = dump_path and f"{dump_path}.{shard}"
+    if port:
+        MetricsServer(metrics, metrics_options["host"], port).start()
+    # Dump from a thread, as logging from a signal handler can deadlock
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=metrics.dump, args=(dump_path,)).start())
+
+def run_worker(index, paths, log_queue):
+    """Entry point of a worker process that monitors one shard of the files."""
+    log.config_queue(log_queue)
+    serve(ConfigHandler(CONFIG_PATH), set(paths), index)
+
+def terminate(signum, frame):
+    """Exit the supervisor through its cleanup code on SIGTERM."""
+    # systemd signals every process in the service, so later SIGTERMs must not cut the cleanup short
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise SystemExit(0)
+
+def run_supervisor(config_handler):
+    """Split the files across worker processes and supervise them."""
+    context = multiprocessing.get_context("spawn")
+    log_queue = context.Queue()
+    listener = log.listen(config_handler.log_path, log_queue)
+    # Records from the supervisor itself are written by the same listener
+    log.config_queue(log_queue)
+
+    # Validate the endpoints and queue options here, rather than in every worker
+    list(config_handler.endpoints())
+    config_handler.workflow_queue
+    paths = list(dict.fromkeys(data[0] for data in config_handler.files()))
+    supervisor = Supervisor(run_worker, shard_paths(paths, config_handler.processes), log_queue, context=context)
+    # Workers reload their own workflows, reopen their own endpoints and dump their own metrics
+    signal.signal(signal.SIGHUP, lambda signum, frame: supervisor.signal(signal.SIGHUP))
+    signal.signal(signal.SIGUSR1, lambda signum, frame: supervisor.signal(signal.SIGUSR1))
+    # On SIGTERM, stop supervising, and send SIGTERM to the workers so they finish what they have read
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        # Allow workers time to close their endpoints and save their positions too
+        supervisor.run(stop_timeout=SHUTDOWN_TIMEOUT + 10)
+    finally:
+        listener.stop()
+
+def main():
+
+    # Load config into ConfigHandler
+    config_handler = ConfigHandler(CONFIG_PATH)
+
+    if config_handler.processes > 1:
+        run_supervisor(config_handler)
+        return
+
+    # Start logging
+    log.config(config_handler.log_path)
+    logger = logging.getLogger(__name__)
+
+    serve(config_handler)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
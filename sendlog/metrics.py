@@ -0,0 +1,325 @@
+"""Per-node call counts, outcomes and latencies for the workflow tree."""
+
+from bisect import bisect_left
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+
+from utils.errors import SlowAlertError
+
+# Upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float("inf"))
+
+class NodeMetrics:
+    """
+    Counters for one node of the workflow tree.
+
+    Counters are updated without a lock. Each file is processed by a single
+    worker, so only endpoints with a concurrency above 1 may lose an update.
+    """
+    __slots__ = ["kind", "name", "path", "calls", "matches", "misses", "errors", "seconds", "buckets"]
+
+    def __init__(self, kind, name, path=None):
+        self.kind = kind
+        self.name = name
+        self.path = path
+        self.calls = 0
+        self.matches = 0
+        self.misses = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self):
+        stats = {
+            "kind": self.kind,
+            "name": self.name,
+            "path": self.path,
+            "calls": self.calls,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "buckets": {str(bound): count for bound, count in zip(BUCKETS, self.buckets)}
+        }
+        if self.kind == "rule":
+            stats["matches"] = self.matches
+            stats["misses"] = self.misses
+        return stats
+
+class Histogram:
+    """Latency histogram for one stage of alert delivery, e.g. the alerts of one endpoint."""
+    __slots__ = ["stage", "name", "count", "seconds", "buckets"]
+
+    def __init__(self, stage, name):
+        self.stage = stage
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "name": self.name,
+            "count": self.count,
+            "seconds": self.seconds,
+            "buckets": {str(bound): count for bound, count in zip(BUCKETS, self.buckets)}
+        }
+
+def timed(call, node_metrics):
+    """Return a function that calls call and records its latency and errors."""
+    clock = time.perf_counter
+    def run(arg):
+        start = clock()
+        try:
+            return call(arg)
+        except Exception:
+            node_metrics.errors += 1
+            raise
+        finally:
+            node_metrics.observe(clock() - start)
+    return run
+
+def timed_rule(call, node_metrics):
+    """
+    Return a function that calls a rule and also records whether it matched.
+
+    Only lines the rule is called on are counted, so lines that the RuleIndex
+    skips for it are neither matches nor misses.
+    """
+    clock = time.perf_counter
+    def run(log_parts):
+        start = clock()
+        try:
+            outcome = call(log_parts)
+        except Exception:
+            node_metrics.errors += 1
+            raise
+        finally:
+            node_metrics.observe(clock() - start)
+        if outcome is False:
+            node_metrics.misses += 1
+        else:
+            node_metrics.matches += 1
+        return outcome
+    return run
+
+def timed_async(call, node_metrics):
+    """Return a coroutine function that awaits call and records its latency and errors."""
+    clock = time.perf_counter
+    async def run(arg):
+        start = clock()
+        try:
+            return await call(arg)
+        except Exception:
+            node_metrics.errors += 1
+            raise
+        finally:
+            node_metrics.observe(clock() - start)
+    return run
+
+class Metrics:
+    """
+    Registry of the NodeMetrics of every instrumented node, and of values
+    such as queue depths that are sampled whenever metrics are read.
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._latencies = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def node(self, kind, name, path=None):
+        """Return the metrics for a node, creating them the first time."""
+        key = (kind, name, path)
+        with self._lock:
+            node_metrics = self._nodes.get(key)
+            if node_metrics is None:
+                node_metrics = self._nodes[key] = NodeMetrics(kind, name, path)
+        return node_metrics
+
+    def latency(self, stage, name):
+        """Return the latency histogram for a stage, creating it the first time."""
+        key = (stage, name)
+        with self._lock:
+            histogram = self._latencies.get(key)
+            if histogram is None:
+                histogram = self._latencies[key] = Histogram(stage, name)
+        return histogram
+
+    def sample(self, name, metric_type, help_text, label, read):
+        """
+        Report read(), which returns a {label value: number} dict, as
+        sendlog_{name} whenever metrics are read.
+        """
+        with self._lock:
+            self._samples[name] = (metric_type, help_text, label, read)
+
+    def _read_samples(self):
+        with self._lock:
+            samples = list(self._samples.items())
+        return [(name, metric_type, help_text, label, read()) for name, (metric_type, help_text, label, read) in samples]
+
+    def to_dict(self):
+        with self._lock:
+            nodes = list(self._nodes.values())
+            latencies = list(self._latencies.values())
+        return {
+            "nodes": [node_metrics.to_dict() for node_metrics in nodes],
+            "latency": [histogram.to_dict() for histogram in latencies],
+            "samples": {name: {str(key): value for key, value in values.items()} for name, _, _, _, values in self._read_samples()}
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def dump(self, path=None):
+        """Write the metrics as JSON to path, or to sendlog's log if no path is given."""
+        if path is None:
+            logging.getLogger(__name__).info(self.to_dict())
+            return
+        with open(path, "w") as file:
+            file.write(self.to_json())
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            nodes = list(self._nodes.values())
+            latencies = list(self._latencies.values())
+        lines = []
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP sendlog_{name} {help_text}")
+            lines.append(f"# TYPE sendlog_{name} {metric_type}")
+        def labels(node_metrics, **extra):
+            pairs = {"kind": node_metrics.kind, "node": node_metrics.name, "file": node_metrics.path or "", **extra}
+            return ",".join(f'{key}="{escape(value)}"' for key, value in pairs.items())
+        def latency_labels(histogram, **extra):
+            pairs = {"stage": histogram.stage, "name": histogram.name, **extra}
+            return ",".join(f'{key}="{escape(value)}"' for key, value in pairs.items())
+        def histogram_lines(name, buckets, seconds, count, labels):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{{{labels(le=le)}}} {cumulative}")
+            lines.append(f"{name}_sum{{{labels()}}} {seconds}")
+            lines.append(f"{name}_count{{{labels()}}} {count}")
+
+        family("node_calls_total", "counter", "Number of times the node was called.")
+        lines.extend(f"sendlog_node_calls_total{{{labels(n)}}} {n.calls}" for n in nodes)
+        family("node_errors_total", "counter", "Number of calls that raised an exception.")
+        lines.extend(f"sendlog_node_errors_total{{{labels(n)}}} {n.errors}" for n in nodes)
+        family("node_matches_total", "counter", "Number of rule calls that matched.")
+        lines.extend(f"sendlog_node_matches_total{{{labels(n)}}} {n.matches}" for n in nodes if n.kind == "rule")
+        family("node_misses_total", "counter", "Number of rule calls that did not match, not counting lines the dispatch index skipped.")
+        lines.extend(f"sendlog_node_misses_total{{{labels(n)}}} {n.misses}" for n in nodes if n.kind == "rule")
+        family("node_seconds", "histogram", "Time spent in the node.")
+        for n in nodes:
+            histogram_lines("sendlog_node_seconds", n.buckets, n.seconds, n.calls, partial(labels, n))
+        family("latency_seconds", "histogram", "Time from reading a line to a stage of handling it.")
+        for h in latencies:
+            histogram_lines("sendlog_latency_seconds", h.buckets, h.seconds, h.count, partial(latency_labels, h))
+        for name, metric_type, help_text, label, values in self._read_samples():
+            family(name, metric_type, help_text)
+            lines.extend(f'sendlog_{name}{{{label}="{escape(key)}"}} {value}' for key, value in values.items())
+        return "\n".join(lines) + "\n"
+
+class AlertLatency:
+    """
+    Record how long alerts take to pass through sendlog in a Metrics registry.
+
+    Batches carry the wall-clock time at which their lines were read, and
+    alerts the time at which their rule matched, so latencies are still
+    measured for alerts that were spilled to disk. Histograms are kept for
+    these stages:
+
+    - queue: time batches waited for a worker, by worker (or file).
+    - match: time from reading a line to a rule matching it, by file.
+    - workflow: time from reading a line to delivering its alert, by file.
+    - endpoint: the same, by endpoint.
+
+    Alerts delivered more than slow_ms after their line was read are logged.
+    """
+
+    def __init__(self, metrics, slow_ms=None):
+        self._metrics = metrics
+        self._slow = None if slow_ms is None else slow_ms / 1000
+
+    def queued(self, name, seconds):
+        self._metrics.latency("queue", str(name)).observe(seconds)
+
+    def matched(self, path, detected, matched):
+        self._metrics.latency("match", path).observe(matched - detected)
+
+    def delivered(self, endpoint_name, log_line, path, trace_stack, timing):
+        """Record the delivery of an alert whose timing is (detected, matched)."""
+        detected, matched = timing
+        delivered = time.time()
+        total = delivered - detected
+        self._metrics.latency("workflow", path).observe(total)
+        self._metrics.latency("endpoint", endpoint_name).observe(total)
+        if self._slow is not None and total > self._slow:
+            SlowAlertError(endpoint_name, log_line, path, trace_stack, {
+                "detected_at": detected,
+                "match_s": matched - detected,
+                "delivery_s": delivered - matched,
+                "total_s": total
+            })
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsServer:
+    """Serve metrics over HTTP: Prometheus text at /metrics and JSON at /stats."""
+
+    def __init__(self, metrics, host="127.0.0.1", port=9464):
+        registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/stats":
+                    body, content_type = registry.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are not worth a line in sendlog's log
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        server_thread = threading.Thread(target=self._server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
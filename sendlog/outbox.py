@@ -0,0 +1,255 @@
+"""Retry failed deliveries in the background, with backoff and a circuit breaker per endpoint."""
+
+from itertools import count
+import heapq
+import json
+import os
+import random
+import threading
+import time
+
+from utils.errors import CircuitOpenError, RetryExhaustedError
+
+def backoff(attempts, base_delay, max_delay):
+    """Return a random delay of up to base_delay doubled for each attempt, capped at max_delay ("full jitter")."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempts - 1)))
+
+class CircuitBreaker:
+    """
+    Stop sending to an endpoint after threshold consecutive failures.
+
+    Once open, allow() refuses every send for reset seconds, then allows a
+    single probe. The circuit closes again if the probe succeeds, and stays
+    open for another reset seconds if it fails.
+    """
+
+    def __init__(self, endpoint_name, threshold=5, reset=30):
+        self.endpoint_name = endpoint_name
+        self._threshold = threshold
+        self._reset = reset
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened is not None
+
+    def retry_at(self):
+        """Return the monotonic time at which a probe will be allowed, or 0 if the circuit is closed."""
+        return 0 if self._opened is None else self._opened + self._reset
+
+    def allow(self):
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._probing or time.monotonic() < self._opened + self._reset:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened is None and self._failures >= self._threshold):
+                if self._opened is None:
+                    CircuitOpenError(self.endpoint_name, self._failures, self._reset)
+                self._opened = time.monotonic()
+                self._probing = False
+
+class Journal:
+    """
+    Append-only JSON lines record of the alerts waiting in an Outbox.
+
+    Each alert is written when it is added and marked when it is delivered
+    or abandoned, and the file is flushed to disk after every write. load()
+    returns the alerts that are still pending, and rewrites the file with
+    only those.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return [(entry_id, msg, meta, attempts)] for the alerts left pending by a previous run."""
+        pending = {}
+        try:
+            with open(self.path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A write was cut short; the alert it recorded is lost
+                        continue
+                    if entry["op"] == "add":
+                        pending[entry["id"]] = (entry["id"], entry["msg"], entry["meta"], entry["attempts"])
+                    else:
+                        pending.pop(entry["id"], None)
+        except FileNotFoundError:
+            return []
+        entries = list(pending.values())
+        # Compact the journal so that it only holds pending alerts
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            for entry_id, msg, meta, attempts in entries:
+                file.write(json.dumps({"op": "add", "id": entry_id, "msg": msg, "meta": meta, "attempts": attempts}, default=str) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        return entries
+
+    def add(self, entry_id, msg, meta, attempts):
+        self._write({"op": "add", "id": entry_id, "msg": msg, "meta": meta, "attempts": attempts})
+
+    def done(self, entry_id):
+        self._write({"op": "done", "id": entry_id})
+
+    def _write(self, entry):
+        with self._lock, open(self.path, "a") as file:
+            file.write(json.dumps(entry, default=str) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+class Outbox:
+    """
+    Alerts that failed to send to one endpoint, retried on a background thread.
+
+    Live alerts are sent with attempt() or attempt_batch(), where send(msg,
+    meta) returns True on success and send_batch(items) returns the items
+    that failed. Failed alerts are retried by send(msg, meta) after a
+    backoff() delay, up to max_attempts sends in total, so retries never
+    hold up live alerts. While the endpoint's CircuitBreaker is open, live
+    alerts are added to the outbox without being sent.
+
+    If journal_path is given, alerts in the outbox are recorded in a Journal,
+    and alerts left there by a previous run are retried on start().
+    """
+
+    def __init__(self, endpoint_name, send, max_attempts=5, base_delay_ms=1000, max_delay_ms=60000, breaker_threshold=5,
+                 breaker_reset_s=30, journal_path=None):
+        self.endpoint_name = endpoint_name
+        self._send = send
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay_ms / 1000
+        self._max_delay = max_delay_ms / 1000
+        self.breaker = CircuitBreaker(endpoint_name, breaker_threshold, breaker_reset_s)
+        self._journal = None if journal_path is None else Journal(journal_path)
+        self._ids = count()
+        self._heap = []
+        self._condition = threading.Condition()
+        self._stop = False
+        self.abandoned = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def start(self):
+        if self._journal is not None:
+            entries = self._journal.load()
+            self._ids = count(max((entry[0] for entry in entries), default=-1) + 1)
+            for entry_id, msg, meta, attempts in entries:
+                self._schedule(entry_id, msg, meta, attempts, time.monotonic())
+        retry_thread = threading.Thread(target=self._run)
+        retry_thread.daemon = True
+        retry_thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+
+    def attempt(self, send, msg, meta):
+        """Send a live alert now, or add it to the outbox if the circuit is open or sending fails."""
+        if not self.breaker.allow():
+            self.hold(msg, meta)
+            return
+        if send(msg, meta):
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+            self.failed(msg, meta)
+
+    def attempt_batch(self, send_batch, items):
+        """Send a list of live (msg, meta) items now, adding those that are not sent to the outbox."""
+        if not self.breaker.allow():
+            for msg, meta in items:
+                self.hold(msg, meta)
+            return
+        failed = send_batch(items)
+        if failed:
+            self.breaker.failure()
+            for msg, meta in failed:
+                self.failed(msg, meta)
+        else:
+            self.breaker.success()
+
+    def hold(self, msg, meta):
+        """Add an alert that was not sent because the circuit is open."""
+        self._add(msg, meta, 0)
+
+    def failed(self, msg, meta):
+        """Add an alert whose first send failed."""
+        self._add(msg, meta, 1)
+
+    def _add(self, msg, meta, attempts):
+        entry_id = next(self._ids)
+        if self._journal is not None:
+            self._journal.add(entry_id, msg, meta, attempts)
+        self._retry_later(entry_id, msg, meta, attempts)
+
+    def _retry_later(self, entry_id, msg, meta, attempts):
+        if attempts >= self._max_attempts:
+            self._finish(entry_id)
+            self.abandoned += 1
+            RetryExhaustedError(self.endpoint_name, attempts, *meta[:3])
+            return
+        delay = backoff(attempts, self._base_delay, self._max_delay) if attempts else 0
+        self._schedule(entry_id, msg, meta, attempts, time.monotonic() + delay)
+
+    def _schedule(self, entry_id, msg, meta, attempts, due):
+        with self._condition:
+            heapq.heappush(self._heap, (due, entry_id, msg, meta, attempts))
+            self._condition.notify()
+
+    def _finish(self, entry_id):
+        if self._journal is not None:
+            self._journal.done(entry_id)
+
+    def _next(self):
+        """Wait for the next alert that is due and may be sent, and return it, or None once stopped."""
+        with self._condition:
+            while not self._stop:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                wait = max(self._heap[0][0], self.breaker.retry_at()) - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                if not self.breaker.allow():
+                    # Another thread is probing the endpoint
+                    self._condition.wait(0.1)
+                    continue
+                return heapq.heappop(self._heap)
+        return None
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            _, entry_id, msg, meta, attempts = item
+            if self._send(msg, meta):
+                self.breaker.success()
+                self._finish(entry_id)
+            else:
+                self.breaker.failure()
+                self._retry_later(entry_id, msg, meta, attempts + 1)
@@ -1,4 +1,4 @@
-from utils.errors import PluginOverrideError, PluginInitError, PluginCallError
+from utils.errors import PluginOverrideError, PluginInitError, PluginCallError, PluginRegexError, PluginMatcherError
 from abc import ABC, ABCMeta, abstractmethod
 import sys
 import re
@@ -27,11 +27,37 @@ class _TransformerMeta(_NodeMeta):
     def __new__(cls, name, bases, dct):
         return super().__new__(cls, name, bases, dct)
 
-class _RuleMeta(_NodeMeta):
+class _MatcherMeta(_NodeMeta):
+    """Compile regexes and validate fast matchers when a plugin class is created."""
     def __new__(cls, name, bases, dct):
+        # Compile regex once so bad patterns are rejected when the plugin is loaded
+        if "regex" in dct:
+            regex = dct["regex"]
+            try:
+                dct["_pattern"] = re.compile(regex) if regex else None
+            except (re.error, TypeError) as e:
+                raise PluginRegexError(name, regex, e)
+        # Store fast matchers as static methods taking a single string
+        if "matcher" in dct and dct["matcher"] is not None:
+            matcher = dct["matcher"]
+            if isinstance(matcher, staticmethod):
+                matcher = matcher.__func__
+            if not callable(matcher):
+                raise PluginMatcherError(name, matcher)
+            try:
+                matcher_params = list(inspect.signature(matcher).parameters)
+            except (TypeError, ValueError):
+                matcher_params = [None]
+            if len(matcher_params) != 1:
+                raise PluginMatcherError(name, matcher_params)
+            dct["matcher"] = staticmethod(matcher)
         return super().__new__(cls, name, bases, dct)
 
-class _LogTypeMeta(_NodeMeta):
+class _RuleMeta(_MatcherMeta):
+    def __new__(cls, name, bases, dct):
+        return super().__new__(cls, name, bases, dct)
+
+class _LogTypeMeta(_MatcherMeta):
     def __new__(cls, name, bases, dct):
         return super().__new__(cls, name, bases, dct)
 
@@ -52,15 +78,28 @@ class Transformer(ABC, metaclass=_TransformerMeta):
 class Rule(ABC, metaclass=_RuleMeta):
 
     regex = None
+    matcher = None
+    prefix = None
     
     def __call__(self, log_parts):
         """Convert log message to structured JSON."""
-        if self.__class__.regex:
-            match = re.match(self.__class__.regex, log_parts["message"])
-            if match:
-                message_parts = match.groupdict()
-                return {**log_parts, "context": {**message_parts}}
-        return False
+        cls = self.__class__
+        if cls.prefix is None and cls.matcher is None and cls._pattern is None:
+            return False
+        message = log_parts["message"]
+        # Reject messages without the declared prefix before any matching
+        if cls.prefix is not None and not message.startswith(cls.prefix):
+            return False
+        if cls.matcher is not None:
+            message_parts = cls.matcher(message)
+        elif cls._pattern is not None:
+            match = cls._pattern.match(message)
+            message_parts = match.groupdict() if match else None
+        else:
+            message_parts = {}
+        if message_parts is None:
+            return False
+        return {**log_parts, "context": {**message_parts}}
 
 class LogType(ABC, metaclass=_LogTypeMeta):
     """
@@ -68,30 +107,65 @@ class LogType(ABC, metaclass=_LogTypeMeta):
     """
 
     regex = None
+    matcher = None
 
     def __call__(self, log_line):
         """
-        Convert log_line to structured JSON using regex.
+        Convert log_line to structured JSON using the matcher or regex.
         
         Must return a dictionary with the "message" key.
         """
-        if self.__class__.regex:
-            match = re.match(self.__class__.regex, log_line)
-            if match:
-                log_parts = match.groupdict()
-                return log_parts
-            else:
-                raise TypeError("Log line did not match the expected format.")
+        cls = self.__class__
+        if cls.matcher is not None:
+            log_parts = cls.matcher(log_line)
+        elif cls._pattern is not None:
+            match = cls._pattern.match(log_line)
+            log_parts = match.groupdict() if match else None
         else:
             return {"message": log_line}
+        if log_parts is None:
+            raise TypeError("Log line did not match the expected format.")
+        return log_parts
 
 class Channel(ABC, metaclass=_ChannelMeta):
+    """
+    Base class for a Channel plugin.
+
+    Variables are declared in __slots__, and optional variables are given a
+    value in defaults. Slots starting with an underscore hold internal state
+    and are not set from the configuration file.
+    """
     __slots__ = ["name"]
+    defaults = {}
+
     def __init__(self, name, **kwargs):
         self.name = name
 
-        for key, value in kwargs.items():
+        for key, value in {**self.defaults, **kwargs}.items():
             setattr(self, key, value)
+        self.open()
+
+    def open(self):
+        """Set up resources held by the endpoint once its variables are set."""
+        pass
+
+    def close(self):
+        """Release resources held by the endpoint."""
+        pass
+
+    def reopen(self):
+        """Reopen files or connections held by the endpoint, e.g. on SIGHUP."""
+        pass
+
+    def send_batch(self, msgs):
+        """
+        Deliver several payloads as a single message.
+
+        Channels that cannot combine payloads keep this default, and each
+        payload is delivered with __call__ instead.
+        """
+        for msg in msgs:
+            self(msg)
 
     @abstractmethod
     def __call__(self, msg):
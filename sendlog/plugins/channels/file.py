@@ -2,9 +2,97 @@
 
 from plugin import Channel
 
+import json
+import os
+import threading
+
 class File(Channel):
-    __slots__ = ["path"]
+    """Channel plugin class for appending alerts to a file.
+
+    The file is kept open, and by default each batch of alerts is written
+    through as soon as it is sent. With flush_every set to 0 or more than 1,
+    alerts are instead held in a write buffer that is flushed every
+    flush_interval seconds, after every flush_every alerts, and when sendlog
+    stops; alerts still buffered when the process is killed are lost. The
+    file is reopened on SIGHUP, or when a flush finds that the path now
+    points to a different file (e.g. after logrotate). Dictionary and list
+    payloads are written as JSON lines.
+
+    required_vars:
+        - path: Path of the file that alerts are appended to.
+
+    optional_vars:
+        - buffer_size: Size (in bytes) of the write buffer (default 65536).
+        - flush_interval: Seconds between flushes (default 1).
+        - flush_every: Flush after this many alerts; 0 to only flush on the interval (default 1).
+    """
+    __slots__ = ["path", "buffer_size", "flush_interval", "flush_every",
+                 "_file", "_inode", "_lock", "_pending", "_reopen", "_stop"]
+    defaults = {"buffer_size": 65536, "flush_interval": 1, "flush_every": 1}
+
+    def open(self):
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._reopen = False
+        self._open_file()
+        # Flush in the background so buffered alerts reach the disk promptly
+        self._stop = threading.Event()
+        flush_thread = threading.Thread(target=self._flush_periodically)
+        flush_thread.daemon = True
+        flush_thread.start()
 
     def __call__(self, msg):
-        with open(self.path, "a") as file:
-            file.write(msg)
\ No newline at end of file
+        self.send_batch([msg])
+
+    def send_batch(self, msgs):
+        text = "".join(self._serialize(msg) for msg in msgs)
+        with self._lock:
+            if self._reopen:
+                self._reopen_file()
+            self._file.write(text)
+            self._pending += len(msgs)
+            if self.flush_every and self._pending >= self.flush_every:
+                self._flush()
+
+    def reopen(self):
+        # Only set a flag, as this may be called from a signal handler
+        self._reopen = True
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    @staticmethod
+    def _serialize(msg):
+        if isinstance(msg, (dict, list)):
+            return json.dumps(msg, default=str) + "\n"
+        return str(msg)
+
+    def _open_file(self):
+        self._file = open(self.path, "a", buffering=self.buffer_size)
+        self._inode = os.fstat(self._file.fileno()).st_ino
+
+    def _reopen_file(self):
+        self._flush()
+        self._file.close()
+        self._open_file()
+        self._reopen = False
+
+    def _flush(self):
+        self._file.flush()
+        self._pending = 0
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                if self._file.closed:
+                    return
+                self._flush()
+                try:
+                    rotated = os.stat(self.path).st_ino != self._inode
+                except FileNotFoundError:
+                    rotated = True
+                if rotated or self._reopen:
+                    self._reopen_file()
@@ -2,13 +2,18 @@
 
 from plugin import Channel
 
-from email.mime.text import MIMEText
 import smtplib
 import ssl
+import threading
+import time
 from email.mime.text import MIMEText
 
 class SMTP(Channel):
     """Channel plugin class for SMTP services.
+
+    The SSL context and an authenticated connection are kept between alerts.
+    The connection is re-established if the server drops it, and closed once it
+    has not been used for idle_timeout seconds.
     
     required_vars:
         - ip: SMTP server IP address or hostname.
@@ -18,8 +23,21 @@ class SMTP(Channel):
         - sender: Sender's email address.
         - recipient: Recipient's email address.
         - timeout: Timeout duration (in seconds) for establishing the SMTP connection. 
+
+    optional_vars:
+        - idle_timeout: Seconds an unused connection is kept open (default 60).
     """
-    __slots__ = ["ip", "port", "username", "password", "sender", "recipient", "timeout"]
+    __slots__ = ["ip", "port", "username", "password", "sender", "recipient", "timeout", "idle_timeout",
+                 "_context", "_server", "_lock", "_last_used", "_idle_timer"]
+    defaults = {"idle_timeout": 60}
+
+    def open(self):
+        self._context = ssl.create_default_context()
+        self._server = None
+        self._lock = threading.Lock()
+        self._last_used = 0
+        self._idle_timer = None
+
     def __call__(self, payload):
 
         # Extract information from payload
@@ -30,10 +48,67 @@ class SMTP(Channel):
         email = MIMEText(body)
         email["Subject"] = subject
         email["From"] = self.sender
-        
-        # Inititate SSL and connect to SMTP Server
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(self.ip, self.port, context=context, timeout=self.timeout) as server:
-            # Log in and send email
+
+        with self._lock:
+            try:
+                self._send(email)
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the connection since the last alert
+                self._disconnect()
+                self._send(email)
+            except smtplib.SMTPResponseException:
+                # The server rejected the email, but the connection is still usable
+                raise
+            except Exception:
+                self._disconnect()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+            self._schedule_idle_close()
+
+    def send_batch(self, payloads):
+        """Send several payloads as one email with the bodies joined together."""
+        subject = payloads[0].get("subject", None)
+        if subject and len(payloads) > 1:
+            subject = f"{subject} (+{len(payloads) - 1} more)"
+        body = "\n\n".join(payload["body"] for payload in payloads)
+        self({"subject": subject, "body": body})
+
+    def close(self):
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            self._disconnect()
+
+    def _send(self, email):
+        if self._server is None:
+            # Connect to SMTP Server and log in
+            server = smtplib.SMTP_SSL(self.ip, self.port, context=self._context, timeout=self.timeout)
             server.login(self.username, self.password)
-            server.sendmail(self.sender, self.recipient, email.as_string())
+            self._server = server
+        self._server.sendmail(self.sender, self.recipient, email.as_string())
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+    def _schedule_idle_close(self, delay=None):
+        if self._idle_timer is None:
+            self._idle_timer = threading.Timer(delay or self.idle_timeout, self._close_if_idle)
+            self._idle_timer.daemon = True
+            self._idle_timer.start()
+
+    def _close_if_idle(self):
+        with self._lock:
+            self._idle_timer = None
+            idle = time.monotonic() - self._last_used
+            if idle >= self.idle_timeout:
+                self._disconnect()
+            elif self._server is not None:
+                self._schedule_idle_close(self.idle_timeout - idle)
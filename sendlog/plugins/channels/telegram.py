@@ -1,11 +1,63 @@
+"""Sendlog Channel plugin module for the Telegram Bot API."""
+
 from plugin import Channel
+from utils.text import pack
+
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+
+def retry_after(response, default=1):
+    """Return the seconds that a 429 response from the Bot API asks to wait before sending again."""
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return default
 
 class Telegram(Channel):
-    __slots__ = ["chat_id", "token"]
+    """Channel plugin class for the Telegram Bot API.
+
+    Requests are sent through one keep-alive session per endpoint, so
+    connections to the API are reused between alerts. Error responses raise
+    requests.HTTPError, so the alert can be retried. After a 429 response,
+    alerts fail without being sent until the retry_after period it gives has
+    passed.
+
+    required_vars:
+        - chat_id: ID of the chat that receives alerts.
+        - token: Bot API token.
+
+    optional_vars:
+        - pool_size: Maximum number of connections kept open to the API (default 4).
+        - timeout: Timeout duration (in seconds) for each request (default 10).
+        - api_url: Base URL of the Bot API (default https://api.telegram.org).
+    """
+    __slots__ = ["chat_id", "token", "pool_size", "timeout", "api_url", "_session", "_url", "_retry_at"]
+    defaults = {"pool_size": 4, "timeout": 10, "api_url": "https://api.telegram.org"}
+
+    def open(self):
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._url = f"{self.api_url}/bot{self.token}/sendMessage"
+        self._retry_at = 0
 
     def __call__(self, msg):
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            raise requests.HTTPError(f"Rate limited by the Bot API for another {wait:.0f} second(s)")
         params = {"chat_id": self.chat_id, "text": msg}
-        response = requests.post(url, params=params,)
+        response = self._session.post(self._url, params=params, timeout=self.timeout)
+        if response.status_code == 429:
+            self._retry_at = time.monotonic() + retry_after(response)
+        response.raise_for_status()
+
+    def send_batch(self, msgs):
+        # Telegram rejects messages longer than 4096 characters
+        for text in pack([str(msg) for msg in msgs], 4096):
+            self(text)
+
+    def close(self):
+        self._session.close()
@@ -1,11 +1,17 @@
 """Sendlog Channel plugin module for Twilio SMS."""
 
 from plugin import Channel
+from utils.text import pack
 
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 
 class TwilioSMS(Channel):
     """Channel plugin class for Twilio SMS.
+
+    The Twilio client and its keep-alive connection pool are created once per
+    endpoint and reused between alerts.
     
     required_vars:
         - account_sid: Twilio account SID.
@@ -13,15 +19,30 @@ class TwilioSMS(Channel):
         - sender: Sender's phone number (with country code).
         - recipient: Recipient's phone number (with country code).
         - timeout: Timeout duration (in seconds) for establishing the connection. 
+
+    optional_vars:
+        - pool_size: Maximum number of connections kept open to Twilio (default 4).
     """
-    __slots__ = ["account_sid", "auth_token", "sender", "recipient", "timeout"]
+    __slots__ = ["account_sid", "auth_token", "sender", "recipient", "timeout", "pool_size", "_client"]
+    defaults = {"pool_size": 4}
+
+    def open(self):
+        http_client = TwilioHttpClient(pool_connections=True, timeout=self.timeout)
+        http_client.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+        self._client = Client(self.account_sid, self.auth_token, http_client=http_client)
+
     def __call__(self, payload):
-        # Set up SMS objects
-        client = Client(self.account_sid, self.auth_token)
-        client.http_client.timeout = self.timeout
-        message = client.messages \
+        message = self._client.messages \
                         .create(
                             body=payload,
                             from_=self.sender,
                             to=self.recipient
                         )
+
+    def send_batch(self, payloads):
+        # Twilio rejects message bodies longer than 1600 characters
+        for body in pack([str(payload) for payload in payloads], 1600):
+            self(body)
+
+    def close(self):
+        self._client.http_client.session.close()
@@ -5,6 +5,17 @@ from datetime import datetime
 class Pacman(LogType):
     regex = r"\[(?P<timestamp>.*?)\] \[(?P<application>.*?)\] (?P<message>.*)"
 
+    @staticmethod
+    def matcher(log_line):
+        """Split the fixed '[timestamp] [application] message' layout without regex."""
+        if not log_line.startswith("["):
+            return None
+        timestamp, timestamp_sep, rest = log_line[1:].partition("] [")
+        application, application_sep, message = rest.partition("] ")
+        if not timestamp_sep or not application_sep:
+            return None
+        return {"timestamp": timestamp, "application": application, "message": message}
+
     class RunCommand(Rule):
         regex = r"Running\s+'(?P<command>[^']+)'"
 
@@ -12,7 +23,7 @@ class Pacman(LogType):
             def __call__(self, parts):
                 context = parts["context"]
                 timestamp = datetime.strptime(parts["timestamp"], "%Y-%m-%dT%H:%M:%S%z")
-                return f"Command '{context["command"]}' detected at {timestamp.strftime("%Y-%m-%d %H:%M")}."
+                return f"Command '{context['command']}' detected at {timestamp.strftime('%Y-%m-%d %H:%M')}."
         
         class JSONL(Transformer):
             def __call__(self, parts):
@@ -0,0 +1,103 @@
+"""Spread monitored files across worker processes, and restart workers that exit."""
+
+import multiprocessing
+import os
+import time
+
+from utils.errors import WorkerExitError
+
+def shard_paths(paths, count):
+    """Split paths into at most count non-empty lists, dealing them out in order."""
+    shards = [list(paths[i::count]) for i in range(count)]
+    return [shard for shard in shards if shard]
+
+class Supervisor:
+    """
+    Run target(index, paths, log_queue) in a worker process for each shard of
+    paths, and restart workers that exit.
+
+    Workers send their log records to log_queue for the parent to write. A
+    worker that exits is restarted after restart_delay seconds, doubling up
+    to max_restart_delay each time it exits again within max_restart_delay
+    seconds of starting.
+    """
+
+    def __init__(self, target, shards, log_queue, restart_delay=1, max_restart_delay=60, context=None):
+        self._target = target
+        self._shards = shards
+        self._log_queue = log_queue
+        self._restart_delay = restart_delay
+        self._max_restart_delay = max_restart_delay
+        self._context = context or multiprocessing.get_context("spawn")
+        self._processes = [None] * len(shards)
+        self._started = [0] * len(shards)
+        self._delays = [restart_delay] * len(shards)
+        self._restart_at = [None] * len(shards)
+        self.restarts = 0
+
+    @property
+    def pids(self):
+        return [process.pid for process in self._processes if process is not None]
+
+    def start(self):
+        for index in range(len(self._shards)):
+            self._start(index)
+
+    def _start(self, index):
+        process = self._context.Process(
+            target=self._target,
+            args=(index, self._shards[index], self._log_queue),
+            name=f"sendlog-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+
+    def check(self):
+        """Log workers that have exited, and restart those whose delay has passed."""
+        now = time.monotonic()
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            if self._restart_at[index] is None:
+                if now - self._started[index] > self._max_restart_delay:
+                    self._delays[index] = self._restart_delay
+                delay = self._delays[index]
+                WorkerExitError(index, process.exitcode, self._shards[index], delay)
+                self._restart_at[index] = now + delay
+                self._delays[index] = min(max(delay * 2, self._restart_delay), self._max_restart_delay)
+            if now >= self._restart_at[index]:
+                self._restart_at[index] = None
+                self.restarts += 1
+                self._start(index)
+
+    def run(self, interval=1, stop_timeout=None):
+        """Start the workers and supervise them until interrupted, then stop them within stop_timeout seconds."""
+        self.start()
+        try:
+            while True:
+                time.sleep(interval)
+                self.check()
+        finally:
+            self.stop(stop_timeout)
+
+    def signal(self, signum):
+        """Send a signal to every running worker, e.g. to forward SIGHUP."""
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signum)
+
+    def stop(self, timeout=None):
+        """Send SIGTERM to every running worker and wait for it to exit, killing it after timeout seconds."""
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
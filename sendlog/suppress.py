@@ -0,0 +1,91 @@
+"""Suppress repeated matches of a rule before they are transformed and delivered."""
+
+from collections import OrderedDict
+import threading
+import time
+
+from utils.errors import SuppressedAlertsError
+
+class Suppressor:
+    """
+    Token bucket limit on the alerts of one rule, for each key built from
+    fields of the rule's context (e.g. the source IP and user of a failed
+    login).
+
+    Each key may raise up to burst alerts at once, and earns another every
+    interval_s seconds. Further matches are suppressed, and the next alert
+    allowed for the key carries the number suppressed before it under
+    'suppressed', so transformers can include it.
+
+    A key is forgotten once it has not matched for long enough to fill its
+    bucket again, and at most max_keys are remembered, evicting the least
+    recently matched. Keys forgotten with matches suppressed since their last
+    alert are logged. Expired keys are checked for when the rule matches, and
+    by expire(), so that the count is reported after a burst ends even if the
+    rule does not match again.
+    """
+
+    def __init__(self, rule_name, file_path, key=(), burst=1, interval_s=60, max_keys=10000):
+        self.rule_name = rule_name
+        self.file_path = file_path
+        self._fields = tuple(key)
+        self._burst = burst
+        self._interval = interval_s
+        self._ttl = burst * interval_s
+        self._max_keys = max_keys
+        # {key: [tokens, last_match, suppressed]}, least recently matched first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def key(self, outcome):
+        """Return the values of the key fields in the context of a rule outcome."""
+        context = outcome.get("context") if type(outcome) is dict else None
+        if type(context) is not dict:
+            return (None,) * len(self._fields)
+        return tuple(context.get(field) for field in self._fields)
+
+    def __call__(self, outcome):
+        """Return True if the alert for a rule outcome may be sent, or False if it is suppressed."""
+        key = self.key(outcome)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self._burst, now, 0]
+                if len(self._buckets) > self._max_keys:
+                    self._forget(*self._buckets.popitem(last=False))
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self._burst, bucket[0] + (now - bucket[1]) / self._interval)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed and type(outcome) is dict:
+            outcome["suppressed"] = suppressed
+        return True
+
+    def expire(self):
+        """Forget the keys that have not matched for long enough to fill their bucket again."""
+        with self._lock:
+            self._expire(time.monotonic())
+
+    def _expire(self, now):
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self._ttl:
+                return
+            del self._buckets[key]
+            self._forget(key, bucket)
+
+    def _forget(self, key, bucket):
+        if bucket[2]:
+            SuppressedAlertsError(self.rule_name, self.file_path, dict(zip(self._fields, key)), bucket[2])
@@ -0,0 +1,17 @@
+import sys
+import types
+from unittest.mock import patch
+
+def patch_plugins(name, logs=(), channels=()):
+    """
+    Return a patch of sys.modules that makes the LogType classes in logs
+    importable as the log plugin '_{name}', and the Channel classes in
+    channels as the channel plugin '_{name}'.
+    """
+    modules = {}
+    for kind, classes in (("logs", logs), ("channels", channels)):
+        module = types.ModuleType(f"plugins.{kind}._{name}")
+        for cls in classes:
+            setattr(module, cls.__name__, cls)
+        modules[module.__name__] = module
+    return patch.dict(sys.modules, modules)
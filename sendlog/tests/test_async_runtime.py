@@ -0,0 +1,124 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from tests import patch_plugins
+from plugin import LogType, Rule, Transformer, Channel
+from workflow_manager import WorkflowManager
+from log_monitor import LogMonitor
+from delivery import DeliveryStage
+from async_runtime import AsyncDelivery, AsyncEndpointQueue, AsyncRuntime
+
+SENT = []
+
+class AsyncLogType(LogType):
+    regex = r"(?P<message>.*)"
+
+    class Failure(Rule):
+        prefix = "FAILED"
+
+        class Line(Transformer):
+            def __call__(self, parts):
+                return parts["message"]
+
+class AsyncRecorder(Channel):
+    __slots__ = []
+    async def __call__(self, msg):
+        await asyncio.sleep(0)
+        SENT.append((self.name, msg))
+
+class ThreadRecorder(Channel):
+    __slots__ = []
+    def __call__(self, msg):
+        SENT.append((self.name, msg, threading.current_thread() is threading.main_thread()))
+
+class AsyncRuntimeTest(unittest.TestCase):
+    def setUp(self):
+        SENT.clear()
+        self.modules = patch_plugins("async", [AsyncLogType], [AsyncRecorder, ThreadRecorder])
+        self.modules.start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "app.log")
+        open(self.path, "w").close()
+
+    def tearDown(self):
+        self.modules.stop()
+        self.tmp.cleanup()
+
+    def load(self, delivery, channel_name):
+        workflow_manager = WorkflowManager(delivery)
+        workflow_manager.load_endpoint("_async", channel_name, "out", {})
+        workflow_manager.load_file(self.path, "_async", "AsyncLogType", "Failure", "Line", "out")
+        return workflow_manager
+
+    def run_lines(self, channel_name, text, count):
+        async def scenario():
+            delivery = AsyncDelivery()
+            workflow_manager = self.load(delivery, channel_name)
+            log_monitor = LogMonitor(workflow_manager.get_paths(), block_duration_s=0)
+            runtime = AsyncRuntime(workflow_manager, delivery, log_monitor)
+            task = asyncio.create_task(runtime.run())
+            await asyncio.sleep(0.05)
+            with open(self.path, "a") as file:
+                file.write(text)
+            for _ in range(500):
+                if len(SENT) >= count:
+                    break
+                await asyncio.sleep(0.01)
+            await runtime.join()
+            task.cancel()
+        asyncio.run(scenario())
+
+    def test_async_channel(self):
+        self.run_lines("AsyncRecorder", "ok\nFAILED one\nFAILED two\n", 2)
+        self.assertEqual(SENT, [("out", "FAILED one"), ("out", "FAILED two")])
+
+    def test_sync_channel_runs_off_the_loop(self):
+        self.run_lines("ThreadRecorder", "FAILED one\n", 1)
+        self.assertEqual(SENT, [("out", "FAILED one", False)])
+
+    def test_async_channel_with_threads(self):
+        delivery = DeliveryStage()
+        workflow_manager = self.load(delivery, "AsyncRecorder")
+        delivery.start()
+        workflow_manager.get_batch_workflow(self.path)(["FAILED one", "fine"])
+        delivery.join()
+        self.assertEqual(SENT, [("out", "FAILED one")])
+
+    def test_deleted_file_is_forgotten(self):
+        async def scenario():
+            delivery = AsyncDelivery()
+            workflow_manager = self.load(delivery, "AsyncRecorder")
+            log_monitor = LogMonitor(workflow_manager.get_paths(), drain_timeout=0, block_duration_s=0)
+            runtime = AsyncRuntime(workflow_manager, delivery, log_monitor)
+            task = asyncio.create_task(runtime.run())
+            await asyncio.sleep(0.05)
+            with open(self.path, "a") as file:
+                file.write("FAILED one\n")
+            for _ in range(500):
+                if SENT:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertIn(self.path, workflow_manager._workflows)
+            os.remove(self.path)
+            for _ in range(500):
+                if not runtime._tasks:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(runtime.depths(), {})
+            self.assertEqual(runtime._tasks, [])
+            self.assertNotIn(self.path, workflow_manager._workflows)
+            task.cancel()
+        asyncio.run(scenario())
+
+    def test_drop_oldest(self):
+        endpoint_queue = AsyncEndpointQueue("out", None, queue_size=2, policy="drop_oldest")
+        for i in range(3):
+            endpoint_queue.submit(i, None)
+        self.assertEqual(endpoint_queue.depth, 2)
+        self.assertEqual(endpoint_queue.dropped, 1)
+        with self.assertLogs(level="WARNING") as logs:
+            endpoint_queue.summarise()
+        self.assertEqual(logs.records[-1].msg["data"], {"endpoint_name": "out", "policy": "drop_oldest", "dropped": 1})
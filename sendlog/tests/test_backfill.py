@@ -0,0 +1,118 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import yaml
+
+from tests import patch_plugins
+from plugin import LogType, Rule, Transformer, Channel
+from backfill import read_batches, split_file, workflow_path, run, report
+import backfill
+
+class AuthLog(LogType):
+    regex = r"(?P<message>.*)"
+
+    class Failure(Rule):
+        prefix = "Failed password"
+
+        class Line(Transformer):
+            def __call__(self, parts):
+                return parts["message"]
+
+class Unused(Channel):
+    __slots__ = ["path"]
+    def open(self):
+        raise AssertionError("endpoints are not opened for a dry run")
+    def __call__(self, msg):
+        pass
+
+LINES = [f"Failed password for root from 10.0.0.{i}" if i % 3 == 0 else f"Accepted key {i}" for i in range(3000)]
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.modules = patch_plugins("backfill", [AuthLog], [Unused])
+        self.modules.start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "auth.log")
+        with open(self.log_path, "w") as file:
+            file.write("".join(f"{line}\n" for line in LINES))
+        self.config_path = os.path.join(self.tmp.name, "sendlog.yml")
+        self.write_config(self.log_path)
+
+    def write_config(self, file_path):
+        config = {
+            "files": {file_path: {"plugin": "_backfill", "log_type": "AuthLog", "rules": {
+                "Failure": {"transformers": {"Line": {"endpoints": ["unused"]}}}}}},
+            "endpoints": {"unused": {"plugin": "_backfill", "channel": "Unused", "vars": {"path": "/nowhere"}}}
+        }
+        with open(self.config_path, "w") as file:
+            yaml.safe_dump(config, file)
+
+    def tearDown(self):
+        self.modules.stop()
+        self.tmp.cleanup()
+
+    def test_dry_run_counts_alerts(self):
+        rotated = self.log_path + ".1.gz"
+        with gzip.open(rotated, "wt") as file:
+            file.write("Failed password for admin\n")
+        lines, counts, elapsed = run([self.log_path, rotated], self.config_path)
+        self.assertEqual(lines, {self.log_path: 3000, rotated: 1})
+        self.assertEqual(sum(counts.values()), 1001)
+        (trace_stack,) = counts
+        self.assertTrue(trace_stack[-1].endswith("Unused:unused"))
+
+        out = io.StringIO()
+        report(lines, counts, elapsed, out)
+        self.assertIn("3001 lines", out.getvalue())
+        self.assertIn("1001 alerts", out.getvalue())
+
+    def test_pattern_workflow(self):
+        self.write_config(os.path.join(self.tmp.name, "*.log"))
+        rotated = self.log_path + ".1.gz"
+        with gzip.open(rotated, "wt") as file:
+            file.write("Failed password for admin\n")
+        lines, counts, elapsed = run([self.log_path, rotated], self.config_path)
+        self.assertEqual(lines, {self.log_path: 3000, rotated: 1})
+        self.assertEqual(sum(counts.values()), 1001)
+
+    def test_unconfigured_file(self):
+        with self.assertRaises(ValueError):
+            run([os.path.join(self.tmp.name, "other.log")], self.config_path)
+
+    def test_deliver_needs_one_job(self):
+        with self.assertRaises(ValueError):
+            run([self.log_path], self.config_path, jobs=2, deliver=True)
+
+    def test_delivery_keeps_alerts_in_memory(self):
+        forward = MagicMock()
+        delivery = backfill.CountingDelivery(forward)
+        retry = {"max_attempts": 3, "journal_path": "/var/lib/sendlog/out.journal"}
+        delivery.add_endpoint("out", None, policy="spill", spill_path="/var/lib/sendlog/out.spill", retry=retry)
+        options = forward.add_endpoint.call_args[1]
+        self.assertEqual((options["policy"], options["spill_path"]), ("block", None))
+        self.assertEqual(options["retry"], {"max_attempts": 3, "journal_path": None})
+        self.assertEqual(retry["journal_path"], "/var/lib/sendlog/out.journal")
+
+    def test_workflow_path(self):
+        configured = {"/var/log/auth.log"}
+        self.assertEqual(workflow_path("/var/log/auth.log.2.gz", configured), "/var/log/auth.log")
+        self.assertEqual(workflow_path("/var/log/auth.log-20250101", configured), "/var/log/auth.log")
+        self.assertIsNone(workflow_path("/var/log/syslog", configured))
+        self.assertEqual(workflow_path("/tmp/copy.log", configured, "/var/log/auth.log"), "/var/log/auth.log")
+
+    def test_workflow_path_pattern(self):
+        configured = {"/var/log/nginx/*.log"}
+        self.assertEqual(workflow_path("/var/log/nginx/access.log", configured), "/var/log/nginx/access.log")
+        self.assertEqual(workflow_path("/var/log/nginx/error.log.3.gz", configured), "/var/log/nginx/error.log")
+        self.assertIsNone(workflow_path("/var/log/nginx/old/access.log", configured))
+
+    def test_split_ranges_cover_every_line_once(self):
+        with patch.object(backfill, "MIN_CHUNK_SIZE", 1000):
+            ranges = split_file(self.log_path, 4)
+        self.assertEqual(len(ranges), 4)
+        lines = [line for start, end in ranges for batch in read_batches(self.log_path, start, end) for line in batch]
+        self.assertEqual(lines, LINES)
@@ -0,0 +1,39 @@
+import unittest
+
+from benchmarks.suite import generate_lines, run_suite, median_result, compare, failed_cases
+
+class SuiteTest(unittest.TestCase):
+    def test_generated_lines_are_reproducible(self):
+        lines = generate_lines(1000, 0.25, seed=3)
+        self.assertEqual(lines, generate_lines(1000, 0.25, seed=3))
+        matches = sum("Running" in line for line in lines)
+        self.assertTrue(200 < matches < 300)
+
+    def test_suite_reports_every_case(self):
+        report = run_suite(["workflow", "batch", "pipeline"], [1, 5], [0.1], line_count=2000)
+        self.assertEqual(len(report["results"]), 6)
+        expected = sum("Running" in line for line in generate_lines(2000, 0.1))
+        for result in report["results"]:
+            self.assertEqual(result["alerts"], expected)
+            self.assertFalse(result["timed_out"])
+            self.assertGreater(result["lines_per_sec"], 0)
+            self.assertLessEqual(result["latency_us"]["p50"], result["latency_us"]["p99"])
+
+    def test_median_of_repeated_runs(self):
+        runs = [{"lines_per_sec": rate, "timed_out": False} for rate in (900, 300, 1000)]
+        self.assertEqual(median_result(runs)["lines_per_sec"], 900)
+        self.assertEqual(median_result(runs)["runs_lines_per_sec"], [900, 300, 1000])
+        runs.append({"lines_per_sec": None, "timed_out": True})
+        self.assertTrue(median_result(runs)["timed_out"])
+
+    def test_compare_flags_throughput_drops(self):
+        baseline = {"results": [{"scenario": "batch", "rules": 1, "match_ratio": 0.1, "lines_per_sec": 1000}]}
+        report = {"results": [{"scenario": "batch", "rules": 1, "match_ratio": 0.1, "lines_per_sec": 700}]}
+        self.assertEqual(len(compare(report, baseline, 0.2)), 1)
+        self.assertEqual(compare(report, baseline, 0.5), [])
+
+    def test_timed_out_cases_fail(self):
+        baseline = {"results": [{"scenario": "pipeline", "rules": 1, "match_ratio": 0.1, "lines_per_sec": 1000}]}
+        report = {"results": [{"scenario": "pipeline", "rules": 1, "match_ratio": 0.1, "lines_per_sec": None, "timed_out": True}]}
+        self.assertEqual(len(compare(report, baseline, 0.5)), 1)
+        self.assertEqual(len(failed_cases(report)), 1)
@@ -0,0 +1,106 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+
+from bounded_queue import BoundedQueue
+
+class BoundedQueueTest(unittest.TestCase):
+    def test_block_waits_for_space(self):
+        bounded_queue = BoundedQueue(1, "block")
+        bounded_queue.put(1)
+        putter = threading.Thread(target=bounded_queue.put, args=(2,))
+        putter.start()
+        putter.join(0.1)
+        self.assertTrue(putter.is_alive())
+        self.assertEqual(bounded_queue.get(), 1)
+        putter.join(1)
+        self.assertEqual(bounded_queue.get(), 2)
+
+    def test_drop_oldest(self):
+        bounded_queue = BoundedQueue(2, "drop_oldest")
+        for i in range(5):
+            bounded_queue.put(i)
+        self.assertEqual([bounded_queue.get(), bounded_queue.get()], [3, 4])
+        self.assertEqual(bounded_queue.dropped, 3)
+        with self.assertRaises(queue.Empty):
+            bounded_queue.get(timeout=0.01)
+
+    def test_drop(self):
+        dropped = []
+        bounded_queue = BoundedQueue(2, "drop", on_drop=dropped.append)
+        for i in range(5):
+            bounded_queue.put(i)
+        self.assertEqual([bounded_queue.get(), bounded_queue.get()], [0, 1])
+        self.assertEqual(dropped, [2, 3, 4])
+        self.assertEqual(bounded_queue.dropped, 3)
+
+    def test_sample(self):
+        bounded_queue = BoundedQueue(2, "sample", sample_every=3)
+        for i in range(8):
+            bounded_queue.put(i)
+        # Items 4 and 7 were kept in place of the oldest; the rest of 2-7 were dropped
+        self.assertEqual([bounded_queue.get(), bounded_queue.get()], [4, 7])
+        self.assertEqual(bounded_queue.dropped, 6)
+
+    def test_spill_preserves_order_and_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spill_path = os.path.join(tmp, "spill.jsonl")
+            bounded_queue = BoundedQueue(2, "spill", spill_path)
+            for i in range(6):
+                bounded_queue.put(["msg", i])
+            self.assertEqual(bounded_queue.qsize(), 6)
+            self.assertEqual([bounded_queue.get()[1] for _ in range(3)], [0, 1, 2])
+
+            # Items still on disk are recovered by a new queue; items 2 and 3
+            # were already read back into memory
+            restarted_queue = BoundedQueue(2, "spill", spill_path)
+            self.assertEqual(restarted_queue.qsize(), 2)
+            self.assertEqual([restarted_queue.get()[1] for _ in range(2)], [4, 5])
+            self.assertEqual(os.path.getsize(spill_path), 0)
+
+    def test_truncated_spill_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spill_path = os.path.join(tmp, "spill.jsonl")
+            bounded_queue = BoundedQueue(1, "spill", spill_path)
+            for i in range(3):
+                bounded_queue.put(i)
+            self.assertEqual(bounded_queue.get(), 0)
+            bounded_queue.task_done()
+            open(spill_path, "w").close()
+            # The spilled items are lost, so get() waits rather than failing
+            with self.assertRaises(queue.Empty):
+                bounded_queue.get(timeout=0.1)
+            self.assertTrue(bounded_queue.join(timeout=1))
+            bounded_queue.put(3)
+            self.assertEqual(bounded_queue.get(timeout=1), 3)
+
+    def test_spill_encoding(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bounded_queue = BoundedQueue(1, "spill", os.path.join(tmp, "spill.jsonl"),
+                                         encode=lambda item: item["n"], decode=lambda n: {"n": n})
+            for i in range(3):
+                bounded_queue.put({"n": i})
+            self.assertEqual([bounded_queue.get() for _ in range(3)], [{"n": 0}, {"n": 1}, {"n": 2}])
+            self.assertEqual(bounded_queue.spilled_total, 2)
+
+    def test_spilled_items_are_read_back_as_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bounded_queue = BoundedQueue(1, "spill", os.path.join(tmp, "spill.jsonl"))
+            bounded_queue.put(("first", 1))
+            bounded_queue.put(("second", {"n": 2}))
+            self.assertEqual([bounded_queue.get(), bounded_queue.get()], [("first", 1), ["second", {"n": 2}]])
+
+    def test_unserializable_item_is_not_spilled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bounded_queue = BoundedQueue(1, "spill", os.path.join(tmp, "spill.jsonl"))
+            bounded_queue.put("first")
+            with self.assertRaises(TypeError):
+                bounded_queue.put(object())
+            self.assertEqual((bounded_queue.qsize(), bounded_queue.spilled_total), (1, 0))
+            bounded_queue.put("second")
+            self.assertEqual([bounded_queue.get(), bounded_queue.get()], ["first", "second"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+import json
+import os
+import smtplib
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from delivery import EndpointQueue
+from workflow_manager import EndpointNode, deliver
+from plugins.channels.file import File
+from plugins.channels.smtp import SMTP
+from plugins.channels.telegram import Telegram
+from plugins.channels.twilio_sms import TwilioSMS
+from utils.text import pack
+
+SMTP_VARS = {
+    "ip": "smtp.example.com",
+    "port": 465,
+    "username": "user",
+    "password": "pass",
+    "sender": "sendlog@example.com",
+    "recipient": "oncall@example.com",
+    "timeout": 5
+}
+
+class SMTPTest(unittest.TestCase):
+    @patch("smtplib.SMTP_SSL")
+    def test_connection_reused(self, mock_smtp_ssl):
+        smtp = SMTP("email", **SMTP_VARS)
+        for i in range(3):
+            smtp({"subject": "Alert", "body": f"alert {i}"})
+        smtp.close()
+        mock_smtp_ssl.assert_called_once()
+        server = mock_smtp_ssl.return_value
+        server.login.assert_called_once_with("user", "pass")
+        self.assertEqual(server.sendmail.call_count, 3)
+        server.quit.assert_called_once()
+
+    @patch("smtplib.SMTP_SSL")
+    def test_reconnect_after_disconnect(self, mock_smtp_ssl):
+        stale, fresh = MagicMock(), MagicMock()
+        stale.sendmail.side_effect = [None, smtplib.SMTPServerDisconnected()]
+        mock_smtp_ssl.side_effect = [stale, fresh]
+        smtp = SMTP("email", **SMTP_VARS)
+        smtp({"body": "first"})
+        smtp({"body": "second"})
+        smtp.close()
+        self.assertEqual(mock_smtp_ssl.call_count, 2)
+        fresh.sendmail.assert_called_once()
+
+    @patch("smtplib.SMTP_SSL")
+    def test_idle_connection_closed(self, mock_smtp_ssl):
+        smtp = SMTP("email", **SMTP_VARS, idle_timeout=0.05)
+        smtp({"body": "alert"})
+        time.sleep(0.2)
+        mock_smtp_ssl.return_value.quit.assert_called_once()
+        smtp({"body": "alert"})
+        smtp.close()
+        self.assertEqual(mock_smtp_ssl.call_count, 2)
+
+    @patch("smtplib.SMTP_SSL")
+    def test_send_batch_combines_emails(self, mock_smtp_ssl):
+        smtp = SMTP("email", **SMTP_VARS)
+        smtp.send_batch([{"subject": "Failed login", "body": "one"}, {"subject": "Failed login", "body": "two"}])
+        smtp.close()
+        sendmail = mock_smtp_ssl.return_value.sendmail
+        sendmail.assert_called_once()
+        email = sendmail.call_args[0][2]
+        self.assertIn("Subject: Failed login (+1 more)", email)
+        self.assertIn("one\n\ntwo", email)
+
+class TelegramTest(unittest.TestCase):
+    @patch("requests.Session")
+    def test_session_reused(self, mock_session):
+        telegram = Telegram("telegram", chat_id=1, token="TOKEN", timeout=3)
+        telegram("one")
+        telegram("two")
+        telegram.close()
+        mock_session.assert_called_once()
+        session = mock_session.return_value
+        self.assertEqual(session.post.call_count, 2)
+        session.post.assert_called_with(
+            "https://api.telegram.org/botTOKEN/sendMessage",
+            params={"chat_id": 1, "text": "two"},
+            timeout=3
+        )
+        session.close.assert_called_once()
+
+    @patch("requests.Session")
+    def test_error_response_is_retried(self, mock_session):
+        response = requests.Response()
+        response.status_code = 500
+        mock_session.return_value.post.return_value = response
+        endpoint_node = EndpointNode(Telegram, {"chat_id": 1, "token": "TOKEN"}, "telegram")
+        endpoint_queue = EndpointQueue("telegram", lambda msg, meta: deliver(endpoint_node, msg, *meta), retry={"base_delay_ms": 60000})
+        endpoint_queue.start()
+        with self.assertLogs(level="ERROR"):
+            endpoint_queue.submit("alert", ("line", "/auth.log", ["Log", "Rule", "Transformer", "Telegram:telegram"], None))
+            endpoint_queue.join()
+        self.assertEqual(endpoint_queue.retrying, 1)
+
+    @patch("requests.Session")
+    def test_rate_limit_waits_for_retry_after(self, mock_session):
+        response = requests.Response()
+        response.status_code = 429
+        response._content = b'{"ok": false, "error_code": 429, "parameters": {"retry_after": 30}}'
+        session = mock_session.return_value
+        session.post.return_value = response
+        telegram = Telegram("telegram", chat_id=1, token="TOKEN")
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                telegram("alert")
+        session.post.assert_called_once()
+
+TWILIO_VARS = {
+    "account_sid": "SID",
+    "auth_token": "TOKEN",
+    "sender": "+15550000000",
+    "recipient": "+15551111111",
+    "timeout": 5
+}
+
+class TwilioSMSTest(unittest.TestCase):
+    @patch("plugins.channels.twilio_sms.Client")
+    def test_client_reused(self, mock_client):
+        twilio_sms = TwilioSMS("sms", **TWILIO_VARS)
+        twilio_sms("one")
+        twilio_sms("two")
+        twilio_sms.close()
+        mock_client.assert_called_once()
+        self.assertEqual(mock_client.call_args[0], ("SID", "TOKEN"))
+        create = mock_client.return_value.messages.create
+        self.assertEqual(create.call_count, 2)
+        create.assert_called_with(body="two", from_="+15550000000", to="+15551111111")
+        mock_client.return_value.http_client.session.close.assert_called_once()
+
+    @patch("plugins.channels.twilio_sms.Client")
+    def test_connection_pool_size(self, mock_client):
+        twilio_sms = TwilioSMS("sms", **TWILIO_VARS, pool_size=2)
+        http_client = mock_client.call_args[1]["http_client"]
+        self.assertEqual(http_client.session.get_adapter("https://api.twilio.com")._pool_maxsize, 2)
+        twilio_sms.close()
+
+    @patch("plugins.channels.twilio_sms.Client")
+    def test_send_batch_packs_bodies(self, mock_client):
+        twilio_sms = TwilioSMS("sms", **TWILIO_VARS)
+        twilio_sms.send_batch(["a" * 1000, "b" * 1000, "c"])
+        twilio_sms.close()
+        bodies = [call[1]["body"] for call in mock_client.return_value.messages.create.call_args_list]
+        self.assertEqual(bodies, ["a" * 1000, "b" * 1000 + "\n\nc"])
+
+class FileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "alerts.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, path=None):
+        with open(path or self.path) as file:
+            return file.read()
+
+    def test_written_through_by_default(self):
+        file = File("file", path=self.path)
+        file("plain text\n")
+        self.assertEqual(self.read(), "plain text\n")
+        file.close()
+
+    def test_buffered_until_flush(self):
+        file = File("file", path=self.path, flush_interval=60, flush_every=0)
+        file({"command": "pacman -Syu"})
+        file("plain text\n")
+        self.assertEqual(self.read(), "")
+        file.close()
+        self.assertEqual(self.read(), '{"command": "pacman -Syu"}\nplain text\n')
+
+    def test_flush_every(self):
+        file = File("file", path=self.path, flush_interval=60, flush_every=2)
+        file.send_batch([{"n": 1}, {"n": 2}])
+        self.assertEqual([json.loads(line) for line in self.read().splitlines()], [{"n": 1}, {"n": 2}])
+        file.close()
+
+    def test_reopen_after_rotation(self):
+        file = File("file", path=self.path, flush_interval=0.05)
+        file("before\n")
+        time.sleep(0.2)
+        os.rename(self.path, self.path + ".1")
+        time.sleep(0.2)
+        file("after\n")
+        file.close()
+        self.assertEqual(self.read(self.path + ".1"), "before\n")
+        self.assertEqual(self.read(), "after\n")
+
+    def test_reopen_on_request(self):
+        file = File("file", path=self.path, flush_interval=60)
+        file("before\n")
+        os.rename(self.path, self.path + ".1")
+        file.reopen()
+        file("after\n")
+        file.close()
+        self.assertEqual(self.read(self.path + ".1"), "before\n")
+        self.assertEqual(self.read(), "after\n")
+
+class PackTest(unittest.TestCase):
+    def test_pack(self):
+        self.assertEqual(list(pack(["aaa", "bbb", "ccc"], 8, "\n")), ["aaa\nbbb", "ccc"])
+        self.assertEqual(list(pack(["toolongtext", "a"], 5, "\n")), ["toolongtext", "a"])
+
+if __name__ == "__main__":
+    unittest.main()
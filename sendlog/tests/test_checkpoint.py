@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+import unittest
+
+from checkpoint import Checkpoint
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "state.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_and_load(self):
+        checkpoint = Checkpoint(self.path)
+        self.assertEqual(checkpoint.load(), {})
+        checkpoint.update("/var/log/auth.log", 12, 345)
+        checkpoint.save()
+        self.assertEqual(Checkpoint(self.path).load(), {"/var/log/auth.log": (12, 345)})
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_processes_share_state_file(self):
+        first, second = Checkpoint(self.path), Checkpoint(self.path)
+        first.update("/a.log", 1, 10)
+        first.save()
+        second.update("/b.log", 2, 20)
+        second.save()
+        first.update("/a.log", 1, 30)
+        first.save()
+        with open(self.path) as file:
+            self.assertEqual(json.load(file), {"/a.log": {"inode": 1, "offset": 30}, "/b.log": {"inode": 2, "offset": 20}})
+
+    def test_failed_save_is_retried(self):
+        checkpoint = Checkpoint(os.path.join(self.tmp.name, "missing", "state.json"))
+        checkpoint.update("/a.log", 1, 10)
+        with self.assertLogs(level="ERROR"):
+            checkpoint.save()
+        checkpoint.path = self.path
+        checkpoint.save()
+        self.assertEqual(Checkpoint(self.path).load(), {"/a.log": (1, 10)})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
 from config_handler import ConfigHandler
+from utils.errors import ConfigKeyError, ConfigTypeError, ConfigValueError
 
 class TestConfigHandler(unittest.TestCase):
 
@@ -68,5 +69,146 @@ class TestConfigHandler(unittest.TestCase):
         mock_open.assert_called_with("test_config.yml", "r")
         mock_safe_load.assert_called_once()
 
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_workers(self, mock_safe_load, mock_open):
+        mock_safe_load.return_value = {}
+        self.assertEqual(ConfigHandler("test_config.yml").workers, 1)
+
+        mock_safe_load.return_value = {"workers": 4}
+        self.assertEqual(ConfigHandler("test_config.yml").workers, 4)
+
+        with self.assertLogs(level="CRITICAL"):
+            mock_safe_load.return_value = {"workers": 0}
+            with self.assertRaises(ConfigValueError):
+                ConfigHandler("test_config.yml").workers
+
+            mock_safe_load.return_value = {"workers": "4"}
+            with self.assertRaises(ConfigTypeError):
+                ConfigHandler("test_config.yml").workers
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_runtime(self, mock_safe_load, mock_open):
+        mock_safe_load.return_value = {}
+        self.assertEqual(ConfigHandler("test_config.yml").runtime, "threads")
+
+        mock_safe_load.return_value = {"runtime": "async"}
+        self.assertEqual(ConfigHandler("test_config.yml").runtime, "async")
+
+        with self.assertLogs(level="CRITICAL"):
+            mock_safe_load.return_value = {"runtime": "greenlets"}
+            with self.assertRaises(ConfigValueError):
+                ConfigHandler("test_config.yml").runtime
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_processes(self, mock_safe_load, mock_open):
+        mock_safe_load.return_value = {}
+        self.assertEqual(ConfigHandler("test_config.yml").processes, 1)
+
+        mock_safe_load.return_value = {"processes": 8}
+        self.assertEqual(ConfigHandler("test_config.yml").processes, 8)
+
+        with self.assertLogs(level="CRITICAL"):
+            mock_safe_load.return_value = {"processes": 0}
+            with self.assertRaises(ConfigValueError):
+                ConfigHandler("test_config.yml").processes
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_checkpoint(self, mock_safe_load, mock_open):
+        mock_safe_load.return_value = {}
+        self.assertIsNone(ConfigHandler("test_config.yml").checkpoint)
+
+        mock_safe_load.return_value = {"checkpoint": {"path": "/var/lib/sendlog/state.json"}}
+        self.assertEqual(ConfigHandler("test_config.yml").checkpoint,
+                         {"path": "/var/lib/sendlog/state.json", "interval": 5, "max_catchup_bytes": None})
+
+        with self.assertLogs(level="CRITICAL"):
+            mock_safe_load.return_value = {"checkpoint": {"interval": 5}}
+            with self.assertRaises(ConfigKeyError):
+                ConfigHandler("test_config.yml").checkpoint
+
+            mock_safe_load.return_value = {"checkpoint": {"path": "state.json", "max_catchup_bytes": -1}}
+            with self.assertRaises(ConfigValueError):
+                ConfigHandler("test_config.yml").checkpoint
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_metrics(self, mock_safe_load, mock_open):
+        mock_safe_load.return_value = {}
+        self.assertIsNone(ConfigHandler("test_config.yml").metrics)
+
+        mock_safe_load.return_value = {"metrics": {"port": 9464}}
+        self.assertEqual(ConfigHandler("test_config.yml").metrics,
+                         {"host": "127.0.0.1", "port": 9464, "dump_path": None, "slow_alert_ms": None})
+
+        with self.assertLogs(level="CRITICAL"):
+            mock_safe_load.return_value = {"metrics": {"port": "9464"}}
+            with self.assertRaises(ConfigTypeError):
+                ConfigHandler("test_config.yml").metrics
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_workflow_queue(self, mock_safe_load, mock_open):
+        mock_safe_load.return_value = {}
+        self.assertEqual(ConfigHandler("test_config.yml").workflow_queue,
+                         {"queue_size": 1000, "policy": "block", "spill_path": None, "sample_every": 10, "summary_interval": 60})
+
+        mock_safe_load.return_value = {"workflow_queue": {"queue_size": 50, "policy": "sample", "sample_every": 4}}
+        queue_options = ConfigHandler("test_config.yml").workflow_queue
+        self.assertEqual((queue_options["queue_size"], queue_options["policy"], queue_options["sample_every"]), (50, "sample", 4))
+
+        with self.assertLogs(level="CRITICAL"):
+            mock_safe_load.return_value = {"workflow_queue": {"policy": "spill"}}
+            with self.assertRaises(ConfigKeyError):
+                ConfigHandler("test_config.yml").workflow_queue
+
+            mock_safe_load.return_value = {"workflow_queue": {"policy": "discard"}}
+            with self.assertRaises(ConfigValueError):
+                ConfigHandler("test_config.yml").workflow_queue
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_retry_options(self, mock_safe_load, mock_open):
+        endpoint = {"plugin": "telegram", "channel": "Bot", "vars": {}}
+        mock_safe_load.return_value = {"endpoints": {"bot": endpoint}}
+        (*_, endpoint_options), = ConfigHandler("test_config.yml").endpoints()
+        self.assertIsNone(endpoint_options["retry"])
+
+        endpoint["retry"] = {"max_attempts": 8, "journal_path": "/var/spool/sendlog/bot.journal"}
+        (*_, endpoint_options), = ConfigHandler("test_config.yml").endpoints()
+        self.assertEqual(endpoint_options["retry"], {
+            "max_attempts": 8,
+            "base_delay_ms": 1000,
+            "max_delay_ms": 60000,
+            "breaker_threshold": 5,
+            "breaker_reset_s": 30,
+            "journal_path": "/var/spool/sendlog/bot.journal"
+        })
+
+        with self.assertLogs(level="CRITICAL"):
+            endpoint["retry"] = {"max_attempts": 0}
+            with self.assertRaises(ConfigValueError):
+                list(ConfigHandler("test_config.yml").endpoints())
+
+    @patch('builtins.open', create=True)
+    @patch('yaml.safe_load')
+    def test_suppressions(self, mock_safe_load, mock_open):
+        rule = {"transformers": {"Human": {"endpoints": ["bot"]}}}
+        mock_safe_load.return_value = {"files": {"/var/log/auth.log": {"plugin": "sshd", "log_type": "Auth", "rules": {"Failed": rule}}}}
+        self.assertEqual(list(ConfigHandler("test_config.yml").suppressions()), [])
+
+        rule["suppress"] = {"key": ["ip", "user"], "interval_s": 300}
+        self.assertEqual(list(ConfigHandler("test_config.yml").suppressions()), [
+            ("/var/log/auth.log", "Failed", {"key": ["ip", "user"], "burst": 1, "interval_s": 300, "max_keys": 10000})
+        ])
+
+        with self.assertLogs(level="CRITICAL"):
+            rule["suppress"] = {"burst": 0}
+            with self.assertRaises(ConfigValueError):
+                list(ConfigHandler("test_config.yml").suppressions())
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from plugin import Rule
+from dispatch import RuleIndex, literal_requirements
+
+class Prefixed(Rule):
+    regex = r"Accepted password for (?P<user>\S+)"
+
+class Substring(Rule):
+    regex = r".*session opened for user (?P<user>\S+)"
+
+class Unindexable(Rule):
+    regex = r"(?i)failed password"
+
+class Custom(Rule):
+    def __call__(self, log_parts):
+        return log_parts
+
+class NoRegex(Rule):
+    pass
+
+class DispatchTest(unittest.TestCase):
+    def test_literal_requirements(self):
+        self.assertEqual(literal_requirements(r"^Running\s+'(?P<command>[^']+)'"), ("Running", "Running"))
+        self.assertEqual(literal_requirements(r"(?P<a>\w+) : TTY=(?P<tty>\S+)"), ("", " : TTY="))
+        self.assertEqual(literal_requirements(r"(?i)abc"), ("", ""))
+
+    def test_candidates(self):
+        index = RuleIndex([Prefixed, Substring, Unindexable, Custom, NoRegex])
+        self.assertEqual(index.candidates("Accepted password for root"), [0, 2, 3])
+        self.assertEqual(index.candidates("pam_unix: session opened for user root"), [1, 2, 3])
+        self.assertEqual(index.candidates("something else"), [2, 3])
+        self.assertEqual(index.candidates(None), [0, 1, 2, 3, 4])
+
+    def test_candidates_preserve_results(self):
+        rules = [Prefixed(), Substring(), Unindexable()]
+        index = RuleIndex([rule.__class__ for rule in rules])
+        for message in ["Accepted password for root", "FAILED PASSWORD", "x session opened for user bob", "nope"]:
+            log_parts = {"message": message}
+            expected = [i for i, rule in enumerate(rules) if rule(log_parts) is not False]
+            candidates = index.candidates(message)
+            self.assertTrue(set(expected) <= set(candidates))
+
+if __name__ == "__main__":
+    unittest.main()
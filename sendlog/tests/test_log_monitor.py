@@ -0,0 +1,188 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+
+from log_monitor import LogMonitor, TailedFile
+
+def append(path, text):
+    with open(path, "a") as file:
+        file.write(text)
+
+class LogMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "auth.log")
+        append(self.path, "old line\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def start(self, paths, **kwargs):
+        self.batches = []
+        lines = queue.Queue()
+        log_monitor = self.log_monitor = LogMonitor(paths, **kwargs)
+        def run():
+            for path, batch in log_monitor.monitor():
+                self.batches.append(batch)
+                for line in batch:
+                    lines.put((path, line))
+        threading.Thread(target=run, daemon=True).start()
+        return lines
+
+    def collect(self, lines, count):
+        return [lines.get(timeout=5) for _ in range(count)]
+
+    def test_new_lines_only(self):
+        lines = self.start([self.path])
+        append(self.path, "first\nsecond\n")
+        self.assertEqual(self.collect(lines, 2), [(self.path, "first"), (self.path, "second")])
+
+    def test_follows_rotation_and_drains_rotated_file(self):
+        lines = self.start([self.path])
+        append(self.path, "before\n")
+        self.assertEqual(self.collect(lines, 1), [(self.path, "before")])
+
+        # logrotate 'create' style: move the file away, then recreate it
+        os.rename(self.path, self.path + ".1")
+        append(self.path + ".1", "late write to rotated file\n")
+        append(self.path, "after\n")
+        received = self.collect(lines, 2)
+        self.assertCountEqual(received, [(self.path, "late write to rotated file"), (self.path, "after")])
+
+        append(self.path, "again\n")
+        self.assertEqual(self.collect(lines, 1), [(self.path, "again")])
+
+    def test_truncation(self):
+        lines = self.start([self.path])
+        append(self.path, "before\n")
+        self.assertEqual(self.collect(lines, 1), [(self.path, "before")])
+        # logrotate 'copytruncate' style
+        with open(self.path, "w"):
+            pass
+        append(self.path, "after\n")
+        self.assertEqual(self.collect(lines, 1), [(self.path, "after")])
+
+    def test_file_created_later(self):
+        missing_path = os.path.join(self.tmp.name, "new.log")
+        lines = self.start([missing_path])
+        append(missing_path, "created\n")
+        append(missing_path, "appended\n")
+        self.assertEqual(self.collect(lines, 2), [(missing_path, "created"), (missing_path, "appended")])
+
+    def test_partial_line_held_until_complete(self):
+        lines = self.start([self.path])
+        append(self.path, "first half, ")
+        time.sleep(0.3)
+        self.assertTrue(lines.empty())
+        append(self.path, "second half\nnext\n")
+        self.assertEqual(self.collect(lines, 2), [(self.path, "first half, second half"), (self.path, "next")])
+
+    def test_large_write_read_in_chunks(self):
+        lines = self.start([self.path])
+        expected = [f"line {i} " + "x" * 100 for i in range(5000)]
+        append(self.path, "".join(f"{line}\n" for line in expected))
+        self.assertEqual([line for _, line in self.collect(lines, 5000)], expected)
+        # Lines are delivered in one batch per chunk rather than one at a time
+        self.assertLess(len(self.batches), 20)
+
+    def test_resume_from_saved_position(self):
+        inode = os.stat(self.path).st_ino
+        saved = os.path.getsize(self.path)
+        append(self.path, "written while stopped\n")
+        lines = self.start([self.path], positions={self.path: (inode, saved)})
+        self.assertEqual(self.collect(lines, 1), [(self.path, "written while stopped")])
+
+    def test_resume_after_rotation_while_stopped(self):
+        inode = os.stat(self.path).st_ino
+        os.rename(self.path, self.path + ".1")
+        append(self.path, "new file\n")
+        lines = self.start([self.path], positions={self.path: (inode, 9)})
+        self.assertEqual(self.collect(lines, 1), [(self.path, "new file")])
+
+    def test_catch_up_limit(self):
+        inode = os.stat(self.path).st_ino
+        append(self.path, "".join(f"missed {i}\n" for i in range(100)))
+        with self.assertLogs(level="WARNING"):
+            lines = self.start([self.path], positions={self.path: (inode, 0)}, max_catchup_bytes=15)
+            # Only whole lines within the last 15 bytes are read
+            self.assertEqual(self.collect(lines, 1), [(self.path, "missed 99")])
+        time.sleep(0.1)
+        self.assertTrue(lines.empty())
+
+    def test_watches_changed_between_batches(self):
+        other_path = os.path.join(self.tmp.name, "other.log")
+        append(other_path, "")
+        lines = self.start([self.path])
+        changed = threading.Event()
+        def change_watches():
+            self.log_monitor.remove_watches([self.path])
+            self.log_monitor.add_watches([other_path])
+            changed.set()
+        self.log_monitor.call_soon(change_watches)
+        self.assertTrue(changed.wait(5))
+        append(self.path, "no longer followed\n")
+        append(other_path, "now followed\n")
+        self.assertEqual(self.collect(lines, 1), [(other_path, "now followed")])
+        self.assertNotIn(self.path, self.log_monitor.file_positions)
+
+    def test_pattern_discovers_new_files(self):
+        pattern = os.path.join(self.tmp.name, "*.access.log")
+        existing = os.path.join(self.tmp.name, "a.access.log")
+        append(existing, "old line\n")
+        lines = self.start([pattern])
+        created = os.path.join(self.tmp.name, "b.access.log")
+        append(created, "written before the watch\n")
+        append(os.path.join(self.tmp.name, "b.error.log"), "not matched\n")
+        self.assertEqual(self.collect(lines, 1), [(created, "written before the watch")])
+        append(existing, "appended\n")
+        self.assertEqual(self.collect(lines, 1), [(existing, "appended")])
+        time.sleep(0.1)
+        self.assertTrue(lines.empty())
+
+    def test_pattern_discovers_new_directories(self):
+        pattern = os.path.join(self.tmp.name, "*", "app.log")
+        lines = self.start([pattern])
+        os.mkdir(os.path.join(self.tmp.name, "container"))
+        path = os.path.join(self.tmp.name, "container", "app.log")
+        append(path, "started\n")
+        self.assertEqual(self.collect(lines, 1), [(path, "started")])
+        done = threading.Event()
+        self.log_monitor.call_soon(lambda: (self.log_monitor.remove_watches([pattern]), done.set()))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(self.log_monitor.file_positions, {})
+
+    def test_forgets_deleted_file_once_drained(self):
+        forgotten = queue.Queue()
+        lines = self.start([self.path], drain_timeout=0)
+        self.log_monitor.on_forget(forgotten.put)
+        append(self.path, "last\n")
+        self.assertEqual(self.collect(lines, 1), [(self.path, "last")])
+        os.remove(self.path)
+        self.assertEqual(forgotten.get(timeout=5), self.path)
+        self.assertEqual(self.log_monitor.file_positions, {})
+
+    def test_forgets_removed_watch(self):
+        forgotten = queue.Queue()
+        self.start([self.path])
+        self.log_monitor.on_forget(forgotten.put)
+        self.log_monitor.call_soon(lambda: self.log_monitor.remove_watches([self.path]))
+        self.assertEqual(forgotten.get(timeout=5), self.path)
+
+class TailedFileTest(unittest.TestCase):
+    def test_read_lines(self):
+        with tempfile.NamedTemporaryFile("w", delete=False) as file:
+            file.write("existing\n")
+        try:
+            tailed = TailedFile(file.name)
+            append(file.name, "a\nb")
+            self.assertEqual(list(tailed.read_batches()), [["a"]])
+            self.assertEqual(tailed.offset, 12)
+            self.assertEqual(list(tailed.close()), [["b"]])
+        finally:
+            os.unlink(file.name)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+import unittest
+
+import yaml
+
+from checkpoint import Checkpoint
+
+def serve_config(config_path):
+    """Worker target that runs sendlog with the config at config_path."""
+    import main
+    from config_handler import ConfigHandler
+    main.serve(ConfigHandler(config_path))
+
+class ShutdownTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "pacman.log")
+        self.alerts_path = os.path.join(self.tmp.name, "alerts.log")
+        self.buffered_path = os.path.join(self.tmp.name, "buffered.log")
+        self.checkpoint_path = os.path.join(self.tmp.name, "positions.json")
+        self.config_path = os.path.join(self.tmp.name, "sendlog.yml")
+        open(self.log_path, "w").close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_config(self, runtime):
+        config = {
+            "log_path": os.path.join(self.tmp.name, "sendlog.log"),
+            "runtime": runtime,
+            # Positions are only saved on shutdown
+            "checkpoint": {"path": self.checkpoint_path, "interval": 3600},
+            "files": {self.log_path: {"plugin": "pacman", "log_type": "Pacman", "rules": {
+                "RunCommand": {"transformers": {"JSONL": {"endpoints": ["alerts", "buffered"]}}}
+            }}},
+            "endpoints": {
+                "alerts": {"plugin": "file", "channel": "File", "vars": {"path": self.alerts_path}},
+                # Only flushed when sendlog stops
+                "buffered": {"plugin": "file", "channel": "File", "vars": {
+                    "path": self.buffered_path, "flush_interval": 3600, "flush_every": 0
+                }}
+            }
+        }
+        with open(self.config_path, "w") as file:
+            yaml.safe_dump(config, file)
+
+    def write_line(self, i):
+        with open(self.log_path, "a") as file:
+            file.write(f"[2025-01-01T00:00:00+0000] [ALPM] Running 'command {i}'\n")
+
+    def serve_until_sigterm(self, runtime):
+        self.write_config(runtime)
+        context = multiprocessing.get_context("spawn")
+        process = context.Process(target=serve_config, args=(self.config_path,))
+        process.start()
+        try:
+            # Lines written before the file is watched are skipped, so write until alerts arrive
+            deadline = time.monotonic() + 30
+            i = 0
+            while not (os.path.exists(self.alerts_path) and os.path.getsize(self.alerts_path)):
+                self.assertLess(time.monotonic(), deadline)
+                self.write_line(i)
+                i += 1
+                time.sleep(0.2)
+            os.kill(process.pid, signal.SIGTERM)
+            process.join(timeout=30)
+        finally:
+            if process.is_alive():
+                process.kill()
+        self.assertEqual(process.exitcode, 0)
+        stat = os.stat(self.log_path)
+        self.assertEqual(Checkpoint(self.checkpoint_path).load(), {self.log_path: (stat.st_ino, stat.st_size)})
+        with open(self.alerts_path) as alerts, open(self.buffered_path) as buffered:
+            self.assertEqual(buffered.read(), alerts.read())
+
+    def test_sigterm_saves_positions_and_flushes_endpoints(self):
+        self.serve_until_sigterm("threads")
+
+    def test_sigterm_saves_positions_and_flushes_endpoints_async(self):
+        self.serve_until_sigterm("async")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import urllib.request
+
+from tests import patch_plugins
+from plugin import LogType, Rule, Transformer, Channel
+from workflow_manager import WorkflowManager
+from delivery import DeliveryStage
+from log_monitor import LineBatch
+from worker_pool import WorkerPool
+from metrics import Metrics, MetricsServer, AlertLatency
+
+SENT = []
+
+class MetricsLog(LogType):
+    regex = r"\[(?P<application>.*?)\] (?P<message>.*)"
+
+    class Failure(Rule):
+        regex = r"failed (?P<user>\w+)"
+
+        class User(Transformer):
+            def __call__(self, parts):
+                if parts["context"]["user"] == "broken":
+                    raise ValueError("cannot transform")
+                return parts["context"]["user"]
+
+class Recorder(Channel):
+    __slots__ = []
+    def __call__(self, msg):
+        SENT.append(msg)
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        SENT.clear()
+        self.modules = patch_plugins("metrics", [MetricsLog], [Recorder])
+        self.modules.start()
+        self.metrics = Metrics()
+        self.workflow_manager = WorkflowManager(metrics=self.metrics)
+        self.workflow_manager.load_endpoint("_metrics", "Recorder", "out", {})
+        self.workflow_manager.load_file("/auth.log", "_metrics", "MetricsLog", "Failure", "User", "out")
+
+    def tearDown(self):
+        self.modules.stop()
+
+    def stats(self):
+        return {(node["kind"], node["name"].rsplit(".", 1)[-1]): node for node in self.metrics.to_dict()["nodes"]}
+
+    def test_counts(self):
+        workflow = self.workflow_manager.get_workflow("/auth.log")
+        for line in ["[sshd] failed root", "[sshd] failed admin", "[sshd] failed !"]:
+            workflow(line)
+        stats = self.stats()
+        self.assertEqual(stats[("log_type", "MetricsLog")]["calls"], 3)
+        rule = stats[("rule", "Failure")]
+        self.assertEqual((rule["calls"], rule["matches"], rule["misses"]), (3, 2, 1))
+        self.assertEqual(rule["path"], "/auth.log")
+        self.assertEqual(sum(rule["buckets"].values()), 3)
+        self.assertEqual(stats[("transformer", "User")]["calls"], 2)
+        self.assertEqual(stats[("endpoint", "out")]["calls"], 2)
+        self.assertEqual(SENT, ["root", "admin"])
+
+    def test_skipped_lines_are_not_misses(self):
+        workflow = self.workflow_manager.get_workflow("/auth.log")
+        # The dispatch index skips the rule for lines without 'failed '
+        for line in ["[sshd] failed root", "[sshd] accepted root", "[sshd] failed !"]:
+            workflow(line)
+        stats = self.stats()
+        self.assertEqual(stats[("log_type", "MetricsLog")]["calls"], 3)
+        rule = stats[("rule", "Failure")]
+        self.assertEqual((rule["calls"], rule["matches"], rule["misses"]), (2, 1, 1))
+
+    def test_errors(self):
+        workflow = self.workflow_manager.get_workflow("/auth.log")
+        with self.assertLogs(level="ERROR"):
+            workflow("[sshd] failed broken")
+        transformer = self.stats()[("transformer", "User")]
+        self.assertEqual((transformer["calls"], transformer["errors"]), (1, 1))
+
+    def test_disabled(self):
+        workflow_manager = WorkflowManager()
+        workflow_manager.load_endpoint("_metrics", "Recorder", "out", {})
+        workflow_manager.load_file("/auth.log", "_metrics", "MetricsLog", "Failure", "User", "out")
+        log_node = workflow_manager._files["/auth.log"]
+        self.assertIs(log_node.call, log_node.plugin_obj)
+
+    def test_prometheus(self):
+        self.workflow_manager.get_workflow("/auth.log")("[sshd] failed root")
+        text = self.metrics.to_prometheus()
+        log_type = f"{MetricsLog.__module__}.MetricsLog"
+        self.assertIn('sendlog_node_matches_total{kind="rule",node="%s.Failure",file="/auth.log"} 1' % log_type, text)
+        self.assertIn('sendlog_node_seconds_bucket{kind="endpoint",node="out",file="",le="+Inf"} 1', text)
+        self.assertIn('sendlog_node_seconds_count{kind="log_type",node="%s",file="/auth.log"} 1' % log_type, text)
+
+    def test_samples(self):
+        depths = [3, 0]
+        self.metrics.sample("worker_queue_batches", "gauge", "Batches waiting.", "worker", lambda: dict(enumerate(depths)))
+        depths[1] = 2
+        self.assertEqual(self.metrics.to_dict()["samples"], {"worker_queue_batches": {"0": 3, "1": 2}})
+        text = self.metrics.to_prometheus()
+        self.assertIn("# TYPE sendlog_worker_queue_batches gauge", text)
+        self.assertIn('sendlog_worker_queue_batches{worker="1"} 2', text)
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            self.metrics.dump(path)
+            with open(path) as file:
+                self.assertEqual(len(json.load(file)["nodes"]), 4)
+
+    def test_server(self):
+        self.workflow_manager.get_workflow("/auth.log")("[sshd] failed root")
+        server = MetricsServer(self.metrics, port=0)
+        server.start()
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/stats") as response:
+                self.assertEqual(json.load(response), self.metrics.to_dict())
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                self.assertIn(b"sendlog_node_calls_total", response.read())
+        finally:
+            server.stop()
+
+class AlertLatencyTest(unittest.TestCase):
+    def setUp(self):
+        SENT.clear()
+        self.modules = patch_plugins("metrics", [MetricsLog], [Recorder])
+        self.modules.start()
+        self.metrics = Metrics()
+        self.latency = AlertLatency(self.metrics, slow_ms=1000)
+        self.delivery = DeliveryStage()
+        self.workflow_manager = WorkflowManager(self.delivery, latency=self.latency)
+        self.workflow_manager.load_endpoint("_metrics", "Recorder", "out", {})
+        self.workflow_manager.load_file("/auth.log", "_metrics", "MetricsLog", "Failure", "User", "out")
+        self.delivery.start()
+
+    def tearDown(self):
+        self.modules.stop()
+
+    def latencies(self):
+        return {(histogram["stage"], histogram["name"]): histogram for histogram in self.metrics.to_dict()["latency"]}
+
+    def test_delivery_latency(self):
+        worker_pool = WorkerPool(1, self.latency)
+        worker_pool.start()
+        batch = LineBatch(["[sshd] failed root", "[sshd] accepted root"], time.time())
+        worker_pool.submit("/auth.log", self.workflow_manager.get_batch_workflow("/auth.log"), batch)
+        worker_pool.join()
+        self.delivery.join()
+        latencies = self.latencies()
+        self.assertEqual(latencies[("queue", "0")]["count"], 1)
+        self.assertEqual(latencies[("match", "/auth.log")]["count"], 1)
+        self.assertEqual(latencies[("workflow", "/auth.log")]["count"], 1)
+        self.assertEqual(latencies[("endpoint", "out")]["count"], 1)
+        self.assertIn('sendlog_latency_seconds_count{stage="endpoint",name="out"} 1', self.metrics.to_prometheus())
+
+    def test_slow_alert_logged(self):
+        workflow_batch = self.workflow_manager.get_batch_workflow("/auth.log")
+        with self.assertLogs(level="WARNING") as logs:
+            workflow_batch(LineBatch(["[sshd] failed root"], time.time() - 5))
+            self.delivery.join()
+        (record,) = logs.records
+        self.assertEqual(record.msg["code "], "EVENT.SLOW_ALERT")
+        self.assertGreater(record.msg["data"]["latency"]["total_s"], 5)
+
+    def test_untimed_lines(self):
+        # Lines that were not read by LogMonitor carry no read time
+        self.workflow_manager.get_batch_workflow("/auth.log")(["[sshd] failed root"])
+        self.delivery.join()
+        self.assertEqual(SENT, ["root"])
+        self.assertEqual(self.latencies(), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from outbox import backoff, CircuitBreaker, Journal, Outbox
+from delivery import EndpointQueue
+
+META = ("line", "/auth.log", ["Log", "Rule", "Transformer", "Channel:out"], None)
+
+class Flaky:
+    """Send function that fails a given number of times before succeeding."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+        self.attempts = 0
+        self.done = threading.Event()
+
+    def __call__(self, msg, meta):
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            return False
+        self.sent.append(msg)
+        self.done.set()
+        return True
+
+class OutboxTest(unittest.TestCase):
+    def test_backoff_is_capped_and_jittered(self):
+        delays = [backoff(attempts, 1, 8) for attempts in range(1, 10) for _ in range(20)]
+        self.assertTrue(all(0 <= delay <= 8 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+        with patch("random.uniform", lambda low, high: high):
+            self.assertEqual([backoff(attempts, 1, 8) for attempts in range(1, 6)], [1, 2, 4, 8, 8])
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker("out", threshold=2, reset=0.05)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        with self.assertLogs(level="WARNING"):
+            breaker.failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        # A single probe is allowed once the reset time has passed
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_alert_is_retried(self):
+        send = Flaky(2)
+        outbox = Outbox("out", send, base_delay_ms=1, max_delay_ms=5)
+        outbox.start()
+        outbox.attempt(send, "alert", META)
+        self.assertTrue(send.done.wait(5))
+        self.assertEqual((send.sent, send.attempts), (["alert"], 3))
+        outbox.stop()
+
+    def test_gives_up_after_max_attempts(self):
+        send = Flaky(10)
+        outbox = Outbox("out", send, max_attempts=3, base_delay_ms=1, max_delay_ms=5, breaker_threshold=10)
+        outbox.start()
+        with self.assertLogs(level="ERROR") as logs:
+            outbox.attempt(send, "alert", META)
+            deadline = time.monotonic() + 5
+            while not outbox.abandoned and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual((outbox.abandoned, send.attempts), (1, 3))
+        self.assertEqual(logs.records[-1].msg["code "], "RUNTIME.RETRY_EXHAUSTED")
+        outbox.stop()
+
+    def test_open_circuit_holds_live_alerts(self):
+        send = Flaky(1)
+        outbox = Outbox("out", send, breaker_threshold=1, breaker_reset_s=60)
+        with self.assertLogs(level="WARNING"):
+            outbox.attempt(send, "first", META)
+        outbox.attempt(send, "second", META)
+        self.assertEqual((send.attempts, len(outbox)), (1, 2))
+
+    def test_journal_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal_path = os.path.join(tmp, "out.journal")
+            outbox = Outbox("out", Flaky(0), breaker_threshold=1, breaker_reset_s=60, journal_path=journal_path)
+            with self.assertLogs(level="WARNING"):
+                outbox.attempt(Flaky(1), "first", META)
+            outbox.attempt(Flaky(0), "second", META)
+
+            send = Flaky(0)
+            restarted = Outbox("out", send, journal_path=journal_path)
+            restarted.start()
+            deadline = time.monotonic() + 5
+            while len(send.sent) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(send.sent, ["first", "second"])
+            restarted.stop()
+            self.assertEqual(Journal(journal_path).load(), [])
+
+    def test_endpoint_queue_retries_without_blocking(self):
+        send = Flaky(1)
+        sent = []
+        def handler(msg, meta):
+            # The first alert fails once; later alerts go straight through
+            return send(msg, meta) if msg == "first" else sent.append(msg) is None
+        endpoint_queue = EndpointQueue("out", handler, retry={"base_delay_ms": 50, "max_delay_ms": 50})
+        endpoint_queue.start()
+        endpoint_queue.submit("first", META)
+        endpoint_queue.submit("second", META)
+        endpoint_queue.join()
+        self.assertEqual(sent, ["second"])
+        self.assertTrue(send.done.wait(5))
+        self.assertEqual(endpoint_queue.retrying, 0)
+
+if __name__ == "__main__":
+    unittest.main()
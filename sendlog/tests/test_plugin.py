@@ -1,6 +1,9 @@
+import re
 import unittest
 
 from plugin import LogType, Rule, Transformer
+from plugins.logs.pacman import Pacman
+from utils.errors import PluginRegexError, PluginMatcherError
 
 class TestLogType(LogType):
     regex = r"\[(?P<timestamp>.*?)\] \[(?P<application>.*?)\] (?P<message>.*)"
@@ -42,6 +45,40 @@ class PluginTest(unittest.TestCase):
         self.assertEqual(enriched_log, expected_step2)
         self.assertEqual(final_output, expected_output)
 
+    def test_regex_compiled_on_class_creation(self):
+        self.assertIsInstance(TestLogType._pattern, re.Pattern)
+        self.assertIsInstance(TestRule._pattern, re.Pattern)
+        self.assertIsNone(LogType._pattern)
+
+    def test_invalid_regex_rejected(self):
+        with self.assertLogs(level="CRITICAL"), self.assertRaises(PluginRegexError):
+            class BadRule(Rule):
+                regex = r"(?P<unclosed"
+
+    def test_invalid_matcher_rejected(self):
+        with self.assertLogs(level="CRITICAL"), self.assertRaises(PluginMatcherError):
+            class BadLogType(LogType):
+                def matcher(log_line, extra):
+                    return None
+
+    def test_prefix_rule(self):
+        class PrefixRule(Rule):
+            prefix = "Running "
+
+        self.assertEqual(PrefixRule()({"message": "Running x"}), {"message": "Running x", "context": {}})
+        self.assertFalse(PrefixRule()({"message": "Stopping x"}))
+
+    def test_pacman_matcher_matches_regex(self):
+        lines = [
+            "[2025-03-28T14:32:59+0000] [PACMAN] Running 'pacman -Syu'",
+            "[2025-03-28T14:33:01+0000] [ALPM] upgraded linux (6.13.7-1 -> 6.13.8-1)",
+            "[2025-03-28T14:33:01+0000] [ALPM] [hook] message",
+            "not a pacman line",
+        ]
+        for line in lines:
+            match = Pacman._pattern.match(line)
+            self.assertEqual(Pacman.matcher(line), match.groupdict() if match else None)
+
 
 if __name__ == "__main__":
     unittest.main()
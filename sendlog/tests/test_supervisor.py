@@ -0,0 +1,92 @@
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+import unittest
+
+from supervisor import Supervisor, shard_paths
+from utils import log
+
+def record_and_exit(index, paths, log_queue):
+    """Worker target that records its start and exits with an error."""
+    log.config_queue(log_queue)
+    logging.getLogger().error({"worker": index, "paths": paths})
+    with open(paths[0], "a") as file:
+        file.write(f"{index}\n")
+    raise SystemExit(1)
+
+def record_sigterm(index, paths, log_queue):
+    """Worker target that waits for SIGTERM, then records that it stopped cleanly."""
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    with open(paths[0], "w") as file:
+        file.write("started\n")
+    while not stopped:
+        time.sleep(0.01)
+    with open(paths[0], "a") as file:
+        file.write("stopped\n")
+
+class ShardTest(unittest.TestCase):
+    def test_shards_are_balanced(self):
+        paths = [f"/var/log/{i}.log" for i in range(7)]
+        shards = shard_paths(paths, 3)
+        self.assertEqual([len(shard) for shard in shards], [3, 2, 2])
+        self.assertEqual(sorted(path for shard in shards for path in shard), sorted(paths))
+
+    def test_no_empty_shards(self):
+        self.assertEqual(shard_paths(["/a.log"], 4), [["/a.log"]])
+
+class SupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "starts")
+        self.context = multiprocessing.get_context("spawn")
+        self.log_queue = self.context.Queue()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_restarts_exited_worker_and_forwards_logs(self):
+        supervisor = Supervisor(record_and_exit, [[self.path]], self.log_queue, restart_delay=0, context=self.context)
+        supervisor.start()
+        try:
+            with self.assertLogs(level="ERROR") as logs:
+                deadline = time.monotonic() + 30
+                while supervisor.restarts < 2 and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    supervisor.check()
+        finally:
+            supervisor.stop()
+        self.assertGreaterEqual(supervisor.restarts, 2)
+        self.assertTrue(any("WORKER_EXIT" in line for line in logs.output))
+
+        record = self.log_queue.get(timeout=5)
+        self.assertEqual(record.msg, {"worker": 0, "paths": [self.path]})
+        with open(self.path) as file:
+            self.assertGreaterEqual(len(file.readlines()), 2)
+
+    def test_restart_delay_backs_off(self):
+        supervisor = Supervisor(record_and_exit, [[self.path]], self.log_queue, restart_delay=1, max_restart_delay=60, context=self.context)
+        supervisor.start()
+        try:
+            with self.assertLogs(level="ERROR"):
+                supervisor._processes[0].join(timeout=30)
+                supervisor.check()
+        finally:
+            supervisor.stop()
+        # The worker exited straight away, so the next exit waits twice as long
+        self.assertEqual(supervisor.restarts, 0)
+        self.assertEqual(supervisor._delays[0], 2)
+
+    def test_stop_sends_sigterm_and_waits(self):
+        supervisor = Supervisor(record_sigterm, [[self.path]], self.log_queue, context=self.context)
+        supervisor.start()
+        deadline = time.monotonic() + 30
+        while not os.path.exists(self.path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        supervisor.stop(timeout=10)
+        self.assertEqual(supervisor._processes[0].exitcode, 0)
+        with open(self.path) as file:
+            self.assertEqual(file.read(), "started\nstopped\n")
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+
+from suppress import Suppressor
+
+def outcome(ip, user="root"):
+    return {"message": "failed", "context": {"ip": ip, "user": user}}
+
+class SuppressorTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.clock = patch("time.monotonic", lambda: self.now)
+        self.clock.start()
+
+    def tearDown(self):
+        self.clock.stop()
+
+    def test_duplicates_suppressed_per_key(self):
+        suppress = Suppressor("Failed", "/auth.log", key=["ip"], interval_s=60)
+        self.assertEqual([suppress(outcome("10.0.0.1")) for _ in range(3)], [True, False, False])
+        self.assertTrue(suppress(outcome("10.0.0.2")))
+        self.assertEqual(suppress.suppressed, 2)
+
+    def test_next_alert_carries_suppressed_count(self):
+        suppress = Suppressor("Failed", "/auth.log", key=["ip", "user"], burst=2, interval_s=60)
+        for _ in range(5):
+            suppress(outcome("10.0.0.1"))
+        self.now += 30
+        self.assertFalse(suppress(outcome("10.0.0.1")))
+        self.now += 30
+        parts = outcome("10.0.0.1")
+        self.assertTrue(suppress(parts))
+        self.assertEqual(parts["suppressed"], 4)
+
+    def test_expired_key_logs_summary(self):
+        suppress = Suppressor("Failed", "/auth.log", key=["ip"], interval_s=60)
+        suppress(outcome("10.0.0.1"))
+        suppress(outcome("10.0.0.1"))
+        self.now += 61
+        with self.assertLogs(level="WARNING") as logs:
+            self.assertTrue(suppress(outcome("10.0.0.2")))
+        self.assertEqual(logs.records[0].msg["code "], "EVENT.SUPPRESSED")
+        self.assertEqual(logs.records[0].msg["data"]["key"], {"ip": "10.0.0.1"})
+        self.assertEqual(len(suppress), 1)
+
+    def test_expire_reports_ended_burst(self):
+        suppress = Suppressor("Failed", "/auth.log", key=["ip"], interval_s=60)
+        for _ in range(3):
+            suppress(outcome("10.0.0.1"))
+        self.now += 30
+        suppress.expire()
+        self.assertEqual(len(suppress), 1)
+        self.now += 31
+        with self.assertLogs(level="WARNING") as logs:
+            suppress.expire()
+        self.assertEqual(logs.records[0].msg["data"]["suppressed"], 2)
+        self.assertEqual(len(suppress), 0)
+
+    def test_keys_bounded(self):
+        suppress = Suppressor("Failed", "/auth.log", key=["ip"], max_keys=100)
+        for i in range(1000):
+            suppress(outcome(f"10.0.{i // 256}.{i % 256}"))
+        self.assertEqual(len(suppress), 100)
+        # The most recently matched keys are kept
+        self.assertFalse(suppress(outcome("10.0.3.231")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from checkpoint import Checkpoint
+from log_monitor import LineBatch
+from worker_pool import WorkerPool
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_lines_stay_in_order_per_path(self):
+        pool = WorkerPool(3)
+        pool.start()
+        results = {}
+        def workflow(msg):
+            path, i = msg
+            results.setdefault(path, []).append(i)
+
+        paths = [f"/var/log/{i}.log" for i in range(5)]
+        for i in range(200):
+            for path in paths:
+                pool.submit(path, workflow, (path, i))
+        pool.join()
+
+        for path in paths:
+            self.assertEqual(results[path], list(range(200)))
+
+    def test_paths_spread_across_shards(self):
+        pool = WorkerPool(2)
+        self.assertEqual([pool.shard(path) for path in ["/a", "/b", "/c", "/a"]], [0, 1, 0, 0])
+
+    def test_forgotten_path_is_unpinned(self):
+        pool = WorkerPool(2)
+        self.assertEqual([pool.shard(path) for path in ["/a", "/b"]], [0, 1])
+        pool.forget("/a")
+        self.assertNotIn("/a", pool._shards)
+        # Paths keep being spread in turn
+        self.assertEqual([pool.shard(path) for path in ["/c", "/a"]], [0, 1])
+
+    def test_slow_file_does_not_block_others(self):
+        pool = WorkerPool(2)
+        pool.start()
+        release = threading.Event()
+        done = threading.Event()
+        pool.submit("/slow.log", lambda msg: release.wait(5), None)
+        pool.submit("/fast.log", lambda msg: done.set(), None)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(pool.depths(), [0, 0])
+        release.set()
+        pool.join()
+
+    def test_drop_is_summarised(self):
+        pool = WorkerPool(1, queue_size=1, policy="drop")
+        pool.start()
+        release = threading.Event()
+        pool.submit("/slow.log", lambda msg: release.wait(5), ["a"])
+        # Wait until the worker has taken the first batch, leaving one free slot
+        while pool.depths() != [0]:
+            time.sleep(0.01)
+        for _ in range(3):
+            pool.submit("/slow.log", lambda msg: None, ["b", "c"])
+        self.assertEqual((pool.dropped_batches, pool.dropped_lines), (2, 4))
+        with self.assertLogs(level="WARNING") as logs:
+            pool.stop()
+        self.assertEqual(logs.records[0].msg["data"]["dropped_lines"], 4)
+        release.set()
+        pool.join()
+
+    def test_spilled_batches_use_resolved_workflow(self):
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            spill_path = os.path.join(tmp, "workflows")
+            resolve = lambda path: lambda msg: results.append((path, list(msg), msg.detected))
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=spill_path, resolve=resolve)
+            for i in range(3):
+                pool.submit("/auth.log", lambda msg: results.append(("submitted", list(msg), msg.detected)), LineBatch([str(i)], i))
+            self.assertEqual(pool.spilled_batches, 2)
+            self.assertTrue(os.path.exists(f"{spill_path}.0"))
+            pool.start()
+            pool.join()
+        self.assertEqual(results, [("submitted", ["0"], 0), ("/auth.log", ["1"], 1), ("/auth.log", ["2"], 2)])
+
+    def test_spilled_batches_record_positions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spill_path = os.path.join(tmp, "workflows")
+            checkpoint = Checkpoint(os.path.join(tmp, "positions.json"))
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=spill_path, resolve=lambda path: lambda msg: None,
+                              checkpoint=checkpoint)
+            for i in range(3):
+                pool.submit("/auth.log", lambda msg: None, LineBatch([str(i)], i), (7, i + 1))
+            self.assertEqual(pool.spilled_batches, 2)
+            pool.start()
+            pool.join()
+        self.assertEqual(checkpoint._positions, {"/auth.log": (7, 3)})
+
+    def test_spill_files_kept_without_checkpoint(self):
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            spill_path = os.path.join(tmp, "workflows")
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=spill_path)
+            for i in range(3):
+                pool.submit("/auth.log", None, LineBatch([str(i)], i))
+            # Batches spilled before a restart are processed after it
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=spill_path, resolve=lambda path: results.extend)
+            pool.start()
+            pool.join()
+        self.assertEqual(results, ["1", "2"])
+
+    def test_spill_files_cleared_with_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spill_path = os.path.join(tmp, "workflows")
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=spill_path)
+            for i in range(3):
+                pool.submit("/auth.log", None, LineBatch([str(i)], i))
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=spill_path, checkpoint=Checkpoint(os.path.join(tmp, "p.json")))
+            self.assertEqual(pool.depths(), [0])
+
+    def test_spilled_batches_of_removed_file_are_skipped(self):
+        def resolve(path):
+            raise KeyError(path)
+        with tempfile.TemporaryDirectory() as tmp:
+            pool = WorkerPool(1, queue_size=1, policy="spill", spill_path=os.path.join(tmp, "workflows"), resolve=resolve)
+            for i in range(3):
+                pool.submit("/auth.log", lambda msg: None, LineBatch([str(i)], i))
+            pool.start()
+            self.assertTrue(pool.join(5))
+
+    def test_error_does_not_stop_worker(self):
+        results = []
+        def fail(msg):
+            raise ValueError("broken plugin")
+        pool = WorkerPool(1)
+        pool.start()
+        with self.assertLogs(level="ERROR") as logs:
+            pool.submit("/auth.log", fail, ["a", "b"])
+            pool.submit("/auth.log", results.extend, ["c"])
+            self.assertTrue(pool.join(5))
+        self.assertEqual(results, ["c"])
+        self.assertEqual(logs.records[0].msg["code "], "RUNTIME.BATCH_ERROR")
+
+if __name__ == "__main__":
+    unittest.main()
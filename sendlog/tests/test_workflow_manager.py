@@ -0,0 +1,305 @@
+import threading
+import time
+import unittest
+
+from tests import patch_plugins
+from plugin import LogType, Rule, Transformer, Channel
+from workflow_manager import WorkflowManager
+from delivery import DeliveryStage
+
+CALLS = {"parse": 0, "sent": [], "closed": []}
+RELEASE = threading.Event()
+
+class TestLogType(LogType):
+    regex = r"\[(?P<application>.*?)\] (?P<message>.*)"
+
+    def __call__(self, log_line):
+        CALLS["parse"] += 1
+        return super().__call__(log_line)
+
+    class RunCommand(Rule):
+        regex = r"Running\s+'(?P<command>[^']+)'"
+
+        class Command(Transformer):
+            def __call__(self, parts):
+                return parts["context"]["command"]
+
+    class Upgrade(Rule):
+        regex = r"upgraded (?P<package>\S+)"
+
+        class Package(Transformer):
+            def __call__(self, parts):
+                return parts["context"]["package"]
+
+    class Anything(Rule):
+        regex = r".*"
+
+        class Message(Transformer):
+            pass
+
+class Recorder(Channel):
+    __slots__ = []
+    def __call__(self, msg):
+        CALLS["sent"].append((self.name, msg))
+
+class BatchRecorder(Recorder):
+    __slots__ = []
+    def send_batch(self, msgs):
+        CALLS["sent"].append((self.name, list(msgs)))
+
+class Blocking(Recorder):
+    __slots__ = []
+    def __call__(self, msg):
+        RELEASE.wait(5)
+        super().__call__(msg)
+
+    def close(self):
+        CALLS["closed"].append(self.name)
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+class WorkflowManagerTest(unittest.TestCase):
+    def setUp(self):
+        CALLS["parse"] = 0
+        CALLS["sent"] = []
+        CALLS["closed"] = []
+        RELEASE.clear()
+        self.modules = patch_plugins("test", [TestLogType], [Recorder, BatchRecorder, Blocking])
+        self.modules.start()
+        self.workflow_manager = WorkflowManager()
+        self.workflow_manager.load_endpoint("_test", "Recorder", "out", {})
+        for rule_name, transformer_name in [("RunCommand", "Command"), ("Upgrade", "Package"), ("Anything", "Message")]:
+            self.workflow_manager.load_file("/test.log", "_test", "TestLogType", rule_name, transformer_name, "out")
+
+    def tearDown(self):
+        self.modules.stop()
+
+    def test_line_parsed_once(self):
+        workflow = self.workflow_manager.get_workflow("/test.log")
+        workflow("[PACMAN] Running 'pacman -Syu'")
+        self.assertEqual(CALLS["parse"], 1)
+        self.assertEqual(CALLS["sent"], [("out", "pacman -Syu"), ("out", "Running 'pacman -Syu'")])
+
+    def test_batch_workflow(self):
+        workflow_batch = self.workflow_manager.get_batch_workflow("/test.log")
+        workflow_batch(["[PACMAN] Running 'a'", "[ALPM] upgraded linux"])
+        self.assertEqual(CALLS["parse"], 2)
+        self.assertEqual([msg for _, msg in CALLS["sent"]], ["a", "Running 'a'", "linux", "upgraded linux"])
+
+    def test_workflow_cached_until_reload(self):
+        workflow = self.workflow_manager.get_workflow("/test.log")
+        self.assertIs(workflow, self.workflow_manager.get_workflow("/test.log"))
+        self.workflow_manager.load_file("/test.log", "_test", "TestLogType", "Upgrade", "Package", "out")
+        self.assertIsNot(workflow, self.workflow_manager.get_workflow("/test.log"))
+
+    def test_endpoint_shared_between_workflows(self):
+        self.workflow_manager.load_file("/other.log", "_test", "TestLogType", "Upgrade", "Package", "out")
+        endpoint_nodes = [
+            endpoint_node
+            for logtype_node in self.workflow_manager._files.values()
+            for rule_node in logtype_node
+            for transformer_node in rule_node
+            for endpoint_node in transformer_node
+        ]
+        self.assertEqual(len(endpoint_nodes), 4)
+        self.assertEqual(len({id(endpoint_node.plugin_obj) for endpoint_node in endpoint_nodes}), 1)
+        # Loading the same workflow again does not send its alerts twice
+        self.workflow_manager.load_file("/other.log", "_test", "TestLogType", "Upgrade", "Package", "out")
+        self.workflow_manager.get_workflow("/other.log")("[ALPM] upgraded linux")
+        self.assertEqual(CALLS["sent"], [("out", "linux")])
+
+    def test_pattern_shares_worktree(self):
+        self.workflow_manager.load_file("/var/log/nginx/*.access.log", "_test", "TestLogType", "Upgrade", "Package", "out")
+        workflow_a = self.workflow_manager.get_workflow("/var/log/nginx/a.access.log")
+        workflow_b = self.workflow_manager.get_workflow("/var/log/nginx/b.access.log")
+        self.assertIsNot(workflow_a, workflow_b)
+        self.assertEqual(list(self.workflow_manager._plans), ["/var/log/nginx/*.access.log"])
+        workflow_b("[ALPM] upgraded linux")
+        self.assertEqual(CALLS["sent"], [("out", "linux")])
+        # Literal paths win over patterns, and wildcards do not match across directories
+        self.assertIsNot(self.workflow_manager.get_workflow("/test.log"), workflow_a)
+        with self.assertRaises(KeyError):
+            self.workflow_manager.get_workflow("/var/log/nginx/old/a.access.log")
+
+    def test_forgotten_path_is_evicted(self):
+        self.workflow_manager.load_file("/var/log/nginx/*.access.log", "_test", "TestLogType", "Upgrade", "Package", "out")
+        workflow = self.workflow_manager.get_workflow("/var/log/nginx/a.access.log")
+        self.workflow_manager.forget_path("/var/log/nginx/a.access.log")
+        self.assertNotIn("/var/log/nginx/a.access.log", self.workflow_manager._workflows)
+        self.assertNotIn("/var/log/nginx/a.access.log", self.workflow_manager._resolved)
+        # The pattern's plan is kept for files that match it later
+        self.assertIn("/var/log/nginx/*.access.log", self.workflow_manager._plans)
+        self.assertIsNot(self.workflow_manager.get_workflow("/var/log/nginx/a.access.log"), workflow)
+
+    def test_suppressed_rule(self):
+        self.workflow_manager.load_suppression("/test.log", "RunCommand", {"key": ["command"], "interval_s": 60})
+        workflow = self.workflow_manager.get_workflow("/test.log")
+        for command in ["ls", "ls", "ls", "pwd"]:
+            workflow(f"[PACMAN] Running '{command}'")
+        commands = [msg for _, msg in CALLS["sent"] if not msg.startswith("Running")]
+        self.assertEqual(commands, ["ls", "pwd"])
+        # Other rules for the same line are not suppressed
+        self.assertEqual(len(CALLS["sent"]), 6)
+
+    def test_expire_suppressed(self):
+        self.workflow_manager.load_suppression("/test.log", "RunCommand", {"key": ["command"], "interval_s": 0.05})
+        workflow = self.workflow_manager.get_workflow("/test.log")
+        for _ in range(3):
+            workflow("[PACMAN] Running 'ls'")
+        time.sleep(0.1)
+        with self.assertLogs(level="WARNING") as logs:
+            self.workflow_manager.expire_suppressed()
+        self.assertEqual(logs.records[0].msg["data"]["suppressed"], 2)
+
+    def test_reload_rebuilds_changed_files_only(self):
+        self.workflow_manager.load_file("/other.log", "_test", "TestLogType", "Upgrade", "Package", "out")
+        other_workflow = self.workflow_manager.get_workflow("/other.log")
+        command_node = next(iter(next(iter(next(iter(self.workflow_manager._files["/test.log"]))))))
+        added, removed = self.workflow_manager.reload(
+            [("_test", "Recorder", "out", {}, None)],
+            [("/other.log", "_test", "TestLogType", "Upgrade", "Package", "out"),
+             ("/test.log", "_test", "TestLogType", "RunCommand", "Command", "out"),
+             ("/new.log", "_test", "TestLogType", "Anything", "Message", "out")]
+        )
+        self.assertEqual((added, removed), (["/new.log"], []))
+        self.assertIs(self.workflow_manager.get_workflow("/other.log"), other_workflow)
+        # The unchanged endpoint keeps its channel
+        self.assertIs(next(iter(next(iter(next(iter(self.workflow_manager._files["/test.log"])))))), command_node)
+        self.workflow_manager.get_workflow("/test.log")("[PACMAN] Running 'ls'")
+        self.assertEqual(CALLS["sent"], [("out", "ls")])
+
+    def test_reload_changed_endpoint_and_removed_file(self):
+        endpoint_node = next(self.workflow_manager._iter_endpoint_nodes())
+        added, removed = self.workflow_manager.reload(
+            [("_test", "BatchRecorder", "out", {}, None)],
+            [("/new.log", "_test", "TestLogType", "RunCommand", "Command", "out")]
+        )
+        self.assertEqual((added, removed), (["/new.log"], ["/test.log"]))
+        self.assertIsNot(next(self.workflow_manager._iter_endpoint_nodes()), endpoint_node)
+        self.assertIs(next(self.workflow_manager._iter_endpoint_nodes()).plugin_cls, BatchRecorder)
+        self.assertEqual(self.workflow_manager.get_paths(), ["/new.log"])
+
+    def test_failed_reload_changes_nothing(self):
+        workflow = self.workflow_manager.get_workflow("/test.log")
+        with self.assertLogs(level="CRITICAL"), self.assertRaises(Exception):
+            self.workflow_manager.reload(
+                [("_test", "Recorder", "out", {}, None)],
+                [("/test.log", "_test", "TestLogType", "RunCommand", "Command", "missing")]
+            )
+        self.assertIs(self.workflow_manager.get_workflow("/test.log"), workflow)
+        workflow("[PACMAN] Running 'ls'")
+        self.assertEqual(CALLS["sent"], [("out", "ls"), ("out", "Running 'ls'")])
+
+    def test_unparsable_line_is_logged(self):
+        workflow = self.workflow_manager.get_workflow("/test.log")
+        with self.assertLogs(level="ERROR"):
+            workflow("no brackets here")
+        self.assertEqual(CALLS["sent"], [])
+
+    def test_delivery_stage(self):
+        delivery = DeliveryStage()
+        workflow_manager = WorkflowManager(delivery)
+        workflow_manager.load_endpoint("_test", "Recorder", "out", {}, {"delivery": {"queue_size": 10, "concurrency": 1}})
+        workflow_manager.load_file("/test.log", "_test", "TestLogType", "RunCommand", "Command", "out")
+        delivery.start()
+
+        workflow = workflow_manager.get_workflow("/test.log")
+        for i in range(5):
+            workflow(f"[PACMAN] Running 'cmd {i}'")
+        delivery.join()
+        self.assertEqual(CALLS["sent"], [("out", f"cmd {i}") for i in range(5)])
+        self.assertEqual(delivery.depths(), {"out": 0})
+
+    def test_batched_delivery(self):
+        delivery = DeliveryStage()
+        workflow_manager = WorkflowManager(delivery)
+        batch_options = {"batch": {"max_messages": 3, "max_delay_ms": 50}}
+        workflow_manager.load_endpoint("_test", "BatchRecorder", "batched", {}, batch_options)
+        workflow_manager.load_endpoint("_test", "Recorder", "looped", {}, batch_options)
+        workflow_manager.load_file("/test.log", "_test", "TestLogType", "RunCommand", "Command", "batched")
+        workflow_manager.load_file("/test.log", "_test", "TestLogType", "Upgrade", "Package", "looped")
+
+        workflow = workflow_manager.get_workflow("/test.log")
+        for i in range(4):
+            workflow(f"[PACMAN] Running 'cmd {i}'")
+        workflow("[ALPM] upgraded linux")
+        delivery.start()
+        delivery.join()
+
+        self.assertEqual(sorted(CALLS["sent"], key=str), sorted([
+            ("batched", ["cmd 0", "cmd 1", "cmd 2"]),
+            ("batched", ["cmd 3"]),
+            ("looped", "linux")
+        ], key=str))
+
+    def test_reload_delivers_alerts_queued_for_removed_endpoint(self):
+        delivery = DeliveryStage()
+        workflow_manager = WorkflowManager(delivery)
+        workflow_manager.load_endpoint("_test", "Recorder", "out", {})
+        workflow_manager.load_endpoint("_test", "Blocking", "slow", {})
+        workflow_manager.load_file("/test.log", "_test", "TestLogType", "RunCommand", "Command", "slow")
+        delivery.start()
+        workflow = workflow_manager.get_workflow("/test.log")
+        for i in range(3):
+            workflow(f"[PACMAN] Running 'cmd {i}'")
+        workflow_manager.reload(
+            [("_test", "Recorder", "out", {}, None)],
+            [("/test.log", "_test", "TestLogType", "RunCommand", "Command", "out")]
+        )
+        self.assertEqual(delivery.depths(), {"out": 0})
+        # The channel stays open while it is sending
+        self.assertEqual(CALLS["closed"], [])
+        RELEASE.set()
+        wait_until(lambda: CALLS["closed"])
+        self.assertEqual(CALLS["sent"], [("slow", f"cmd {i}") for i in range(3)])
+        self.assertEqual(CALLS["closed"], ["slow"])
+
+    def test_reload_closes_replaced_channel_after_send(self):
+        delivery = DeliveryStage()
+        workflow_manager = WorkflowManager(delivery)
+        workflow_manager.load_endpoint("_test", "Blocking", "out", {})
+        workflow_manager.load_file("/test.log", "_test", "TestLogType", "RunCommand", "Command", "out")
+        delivery.start()
+        workflow = workflow_manager.get_workflow("/test.log")
+        workflow("[PACMAN] Running 'first'")
+        wait_until(lambda: workflow_manager._endpoint_nodes["out"].users)
+        workflow_manager.reload(
+            [("_test", "Recorder", "out", {}, None)],
+            [("/test.log", "_test", "TestLogType", "RunCommand", "Command", "out")]
+        )
+        workflow_manager.get_workflow("/test.log")("[PACMAN] Running 'second'")
+        self.assertEqual(CALLS["closed"], [])
+        RELEASE.set()
+        delivery.join()
+        self.assertEqual(CALLS["closed"], ["out"])
+        self.assertEqual(CALLS["sent"], [("out", "first"), ("out", "second")])
+
+    def test_delivery_error_does_not_stop_thread(self):
+        delivery = DeliveryStage()
+        workflow_manager = WorkflowManager(delivery)
+        workflow_manager.load_endpoint("_test", "Recorder", "out", {})
+        delivery.start()
+        with self.assertLogs(level="ERROR") as logs:
+            delivery.submit("out", "lost", None)
+            delivery.join()
+        self.assertIn("DELIVERY_ERROR", logs.output[0])
+        delivery.submit("out", "sent", ("line", "/test.log", [], None))
+        delivery.join()
+        self.assertEqual(CALLS["sent"], [("out", "sent")])
+
+    def test_dropped_alerts_are_summarised(self):
+        delivery = DeliveryStage()
+        delivery.add_endpoint("out", lambda msg, meta: True, queue_size=1, policy="drop")
+        for msg in range(3):
+            delivery.submit("out", msg, None)
+        self.assertEqual(delivery.dropped(), {"out": 2})
+        with self.assertLogs(level="WARNING") as logs:
+            delivery.stop()
+        self.assertEqual(logs.records[-1].msg["code "], "EVENT.ALERTS_DROPPED")
+        self.assertEqual(logs.records[-1].msg["data"]["dropped"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -148,6 +148,16 @@ class ConfigTypeError(ConfigError):
             "recieved_type": received_type}
         self.log()
 
+class ConfigValueError(ConfigError):
+    def __init__(self, key, value, expected):
+        super().__init__()
+        self.code = "VALUE"
+        self.message = f"Expected key '{key}' to be {expected} but received '{value}' instead"
+        self.data = {
+            "key": key,
+            "value": value,
+            "expected": expected}
+        self.log()
 
 # Plugin definition errors
 
@@ -191,6 +201,29 @@ class PluginCallError(PluginError):
         }
         self.log()
 
+class PluginRegexError(PluginError):
+    def __init__(self, plugin_class_name, regex, exc_info):
+        super().__init__()
+        self.code = "REGEX_VALIDATION"
+        self.message =  f"Plugin subclass '{plugin_class_name}' was rejected because the 'regex' attribute '{regex}' could not be compiled: '{type(exc_info).__name__}: {exc_info}'"
+        self.data = {
+            "plugin_class_name": plugin_class_name,
+            "regex": regex,
+            "exc_info": exc_info
+        }
+        self.log()
+
+class PluginMatcherError(PluginError):
+    def __init__(self, plugin_class_name, matcher):
+        super().__init__()
+        self.code = "MATCHER_VALIDATION"
+        self.message =  f"Plugin subclass '{plugin_class_name}' was rejected because the 'matcher' attribute must be a callable taking exactly one parameter; got '{matcher}' instead"
+        self.data = {
+            "plugin_class_name": plugin_class_name,
+            "matcher": matcher
+        }
+        self.log()
+
 # Workflow-fatal runtime errors
 
 class RuntimeError(SendlogError, ABC):
@@ -200,6 +233,20 @@ class RuntimeError(SendlogError, ABC):
         self.message = "An error occurred that prevented an alert from sending"
         self._level = logging.error
 
+class LogTypeError(RuntimeError, ABC):
+    def __init__(self, plugin_class_name, exc_info, log_line, file_path, workflow_tracestack):
+        super().__init__()
+        self.code = "LOGTYPE_ERROR"
+        self.message =  f"LogType plugin subclass '{plugin_class_name}' encountered the following error when processing the log line '{log_line}' from file '{file_path}': '{type(exc_info).__name__}: {exc_info}'"
+        self.data = {
+            "plugin_class_name": plugin_class_name,
+            "log_line": log_line,
+            "workflow_trace_stack": workflow_tracestack,
+            "file_path": file_path,
+            "exc_info": exc_info
+        }
+        self.log()
+
 class RuleError(RuntimeError, ABC):
     def __init__(self, plugin_class_name, exc_info, log_line, file_path, workflow_tracestack):
         super().__init__()
@@ -241,4 +288,180 @@ class EndpointError(RuntimeError, ABC):
             "file_path": file_path,
             "exc_info": exc_info
         }
-        self.log()
\ No newline at end of file
+        self.log()
+
+class RetryExhaustedError(RuntimeError, ABC):
+    def __init__(self, endpoint_name, attempts, log_line, file_path, workflow_tracestack):
+        super().__init__()
+        self.code = "RETRY_EXHAUSTED"
+        self.message = f"Gave up sending the alert for the log line '{log_line}' from file '{file_path}' to endpoint '{endpoint_name}' after {attempts} attempt(s)"
+        self.data = {
+            "endpoint_name": endpoint_name,
+            "attempts": attempts,
+            "log_line": log_line,
+            "workflow_trace_stack": workflow_tracestack,
+            "file_path": file_path
+        }
+        self.log()
+
+class DeliveryError(RuntimeError, ABC):
+    def __init__(self, endpoint_name, exc_info, alerts):
+        super().__init__()
+        self.code = "DELIVERY_ERROR"
+        self.message = f"{alerts} alert(s) queued for endpoint '{endpoint_name}' were discarded after an unexpected error: '{type(exc_info).__name__}: {exc_info}'"
+        self.data = {
+            "endpoint_name": endpoint_name,
+            "alerts": alerts,
+            "exc_info": exc_info
+        }
+        self.log()
+
+class BatchError(RuntimeError, ABC):
+    def __init__(self, file_path, exc_info, lines):
+        super().__init__()
+        self.code = "BATCH_ERROR"
+        self.message = f"{lines} line(s) read from file '{file_path}' were discarded after an unexpected error: '{type(exc_info).__name__}: {exc_info}'"
+        self.data = {
+            "file_path": file_path,
+            "lines": lines,
+            "exc_info": exc_info
+        }
+        self.log()
+
+# Runtime events that do not prevent alerts from sending
+
+class RuntimeEvent(SendlogError, ABC):
+    def __init__(self):
+        super().__init__()
+        self.code = "EVENT"
+        self.message = "An event occurred while monitoring logs"
+        self._level = logging.warning
+
+class WorkerExitError(RuntimeEvent, ABC):
+    def __init__(self, worker_index, exit_code, file_paths, restart_delay):
+        super().__init__()
+        self.code = "WORKER_EXIT"
+        self.message = f"Worker process {worker_index} monitoring {len(file_paths)} file(s) exited with code {exit_code}, and will be restarted in {restart_delay} second(s)"
+        self.data = {
+            "worker_index": worker_index,
+            "exit_code": exit_code,
+            "file_paths": file_paths,
+            "restart_delay": restart_delay
+        }
+        self._level = logging.error
+        self.log()
+
+class CheckpointError(RuntimeEvent, ABC):
+    def __init__(self, checkpoint_path, exc_info):
+        super().__init__()
+        self.code = "CHECKPOINT_ERROR"
+        self.message = f"Read positions could not be saved to '{checkpoint_path}': '{type(exc_info).__name__}: {exc_info}'"
+        self.data = {
+            "checkpoint_path": checkpoint_path,
+            "exc_info": exc_info
+        }
+        self._level = logging.error
+        self.log()
+
+class CatchUpLimitError(RuntimeEvent, ABC):
+    def __init__(self, file_path, skipped_bytes):
+        super().__init__()
+        self.code = "CATCHUP_LIMIT"
+        self.message = f"Skipped {skipped_bytes} byte(s) written to '{file_path}' while sendlog was stopped, as they exceed the catch-up limit"
+        self.data = {
+            "file_path": file_path,
+            "skipped_bytes": skipped_bytes
+        }
+        self.log()
+
+class SlowAlertError(RuntimeEvent, ABC):
+    def __init__(self, endpoint_name, log_line, file_path, workflow_tracestack, latency):
+        super().__init__()
+        self.code = "SLOW_ALERT"
+        self.message = f"Alert for the log line '{log_line}' from file '{file_path}' reached endpoint '{endpoint_name}' {latency['total_s']:.3f}s after the line was read"
+        self.data = {
+            "endpoint_name": endpoint_name,
+            "log_line": log_line,
+            "workflow_trace_stack": workflow_tracestack,
+            "file_path": file_path,
+            "latency": latency
+        }
+        self.log()
+
+class OverloadError(RuntimeEvent, ABC):
+    def __init__(self, policy, dropped_batches, dropped_lines, spilled_batches):
+        super().__init__()
+        self.code = "OVERLOAD"
+        self.message = f"Workflow queues were full: dropped {dropped_batches} batch(es) of {dropped_lines} line(s) and spilled {spilled_batches} batch(es) to disk since the last summary"
+        self.data = {
+            "policy": policy,
+            "dropped_batches": dropped_batches,
+            "dropped_lines": dropped_lines,
+            "spilled_batches": spilled_batches
+        }
+        self.log()
+
+class AlertsDroppedError(RuntimeEvent, ABC):
+    def __init__(self, endpoint_name, policy, dropped):
+        super().__init__()
+        self.code = "ALERTS_DROPPED"
+        self.message = f"Delivery queue for endpoint {endpoint_name} was full: dropped {dropped} alert(s) since the last summary"
+        self.data = {
+            "endpoint_name": endpoint_name,
+            "policy": policy,
+            "dropped": dropped
+        }
+        self.log()
+
+class CircuitOpenError(RuntimeEvent, ABC):
+    def __init__(self, endpoint_name, failures, reset_s):
+        super().__init__()
+        self.code = "CIRCUIT_OPEN"
+        self.message = f"Endpoint '{endpoint_name}' failed {failures} time(s) in a row, so alerts for it will be held for {reset_s}s before it is tried again"
+        self.data = {
+            "endpoint_name": endpoint_name,
+            "failures": failures,
+            "reset_s": reset_s
+        }
+        self.log()
+
+class ConfigReloadError(RuntimeEvent, ABC):
+    def __init__(self, config_path, exc_info):
+        super().__init__()
+        self.code = "CONFIG_RELOAD"
+        self.message = f"The configuration file '{config_path}' could not be reloaded, so the previous configuration is still in use: '{type(exc_info).__name__}: {exc_info}'"
+        self.data = {
+            "config_path": config_path,
+            "exc_info": exc_info
+        }
+        self._level = logging.error
+        self.log()
+
+class RestartRequiredError(RuntimeEvent, ABC):
+    def __init__(self, setting):
+        super().__init__()
+        self.code = "RESTART_REQUIRED"
+        self.message = f"Changes to '{setting}' were not applied when the configuration was reloaded, and take effect once sendlog is restarted"
+        self.data = {"setting": setting}
+        self.log()
+
+class SuppressedAlertsError(RuntimeEvent, ABC):
+    def __init__(self, rule_name, file_path, key, suppressed):
+        super().__init__()
+        self.code = "SUPPRESSED"
+        self.message = f"Suppressed {suppressed} alert(s) from rule '{rule_name}' for file '{file_path}' with key '{key}' since its last alert"
+        self.data = {
+            "rule_name": rule_name,
+            "file_path": file_path,
+            "key": key,
+            "suppressed": suppressed
+        }
+        self.log()
+
+class ShutdownTimeoutError(RuntimeEvent, ABC):
+    def __init__(self, timeout):
+        super().__init__()
+        self.code = "SHUTDOWN_TIMEOUT"
+        self.message = f"Lines and alerts still queued after {timeout} second(s) were not processed before stopping, and lines whose position was not saved are read again on the next start"
+        self.data = {"timeout": timeout}
+        self.log()
@@ -1,21 +1,68 @@
+import copy
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pythonjsonlogger.json import JsonFormatter
 
-def config(path: str):
-    """Configure the root logger for use across the program."""
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+def handlers(path: str):
+    """Return the handlers that write sendlog's own log."""
     # Set the formatter
     formatter = JsonFormatter("{asctime}{levelname}", style="{")
+    handlers = []
 
     if path:
         file_handler = logging.FileHandler(path)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
 
     stdout_handler = logging.StreamHandler()
     stdout_handler.setFormatter(formatter)
-    logger.addHandler(stdout_handler)
+    handlers.append(stdout_handler)
+    return handlers
+
+def config(path: str):
+    """Configure the root logger for use across the program."""
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    for handler in handlers(path):
+        logger.addHandler(handler)
+
+def config_queue(log_queue):
+    """Configure the root logger of a worker process to send records to log_queue."""
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(RecordQueueHandler(log_queue))
+
+def listen(path: str, log_queue):
+    """Start writing the records that worker processes send to log_queue, and return the listener."""
+    listener = QueueListener(log_queue, *handlers(path))
+    listener.start()
+    return listener
+
+def portable(value):
+    """Return value with anything that may not pickle converted to a string."""
+    if isinstance(value, dict):
+        return {key: portable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [portable(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+class RecordQueueHandler(QueueHandler):
+    """QueueHandler that keeps dictionary messages intact, so they are still written as JSON fields."""
+
+    def prepare(self, record):
+        if not isinstance(record.msg, dict):
+            return super().prepare(record)
+        record = copy.copy(record)
+        record.msg = portable(record.msg)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.args = None
+        record.exc_info = None
+        return record
 
 def write(logger_func, code: str, message: str, **kwargs):
     """Write a log message in a standardised format."""
@@ -0,0 +1,23 @@
+"""Utility functions for paths in the 'files' section, which may be glob patterns."""
+
+from fnmatch import fnmatchcase
+import os
+import re
+
+MAGIC = re.compile(r"[*?[]")
+
+def is_pattern(path):
+    """Return True if path contains glob wildcards."""
+    return MAGIC.search(path) is not None
+
+def pattern_depth(pattern):
+    """Return the index of the first component of pattern that contains wildcards."""
+    return next(i for i, part in enumerate(pattern.split(os.sep)) if is_pattern(part))
+
+def matches(pattern, path):
+    """Return True if path matches pattern, where wildcards never match across a '/' (as with glob)."""
+    pattern_parts = pattern.split(os.sep)
+    path_parts = path.split(os.sep)
+    if len(pattern_parts) != len(path_parts):
+        return False
+    return all(fnmatchcase(part, pattern_part) for part, pattern_part in zip(path_parts, pattern_parts))
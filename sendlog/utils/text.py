@@ -0,0 +1,16 @@
+"""Utility functions for combining alert payloads into fewer messages."""
+
+def pack(texts, limit, separator="\n\n"):
+    """
+    Join texts into as few messages as possible, each at most limit characters.
+
+    A text that is longer than limit on its own is yielded unchanged.
+    """
+    message = ""
+    for text in texts:
+        if message and len(message) + len(separator) + len(text) > limit:
+            yield message
+            message = ""
+        message = f"{message}{separator}{text}" if message else text
+    if message:
+        yield message
@@ -0,0 +1,188 @@
+"""Run workflows on a pool of worker threads while keeping each file's lines in order."""
+
+from functools import partial
+import os
+import queue
+import threading
+import time
+
+from bounded_queue import BoundedQueue, join_all
+from log_monitor import LineBatch
+from utils.errors import OverloadError, BatchError
+
+def encode(item):
+    """Return a queued item in a form that can be spilled as JSON."""
+    path, _, msg, enqueued, position = item
+    return [path, list(msg), getattr(msg, "detected", None), enqueued, position]
+
+def decode(item):
+    """Return a spilled item, without its workflow, which is looked up when it is run."""
+    path, lines, detected, enqueued, position = item
+    msg = lines if detected is None else LineBatch(lines, detected)
+    return path, None, msg, enqueued, None if position is None else tuple(position)
+
+class WorkerPool:
+    """
+    Fixed pool of worker threads, each consuming its own queue (shard).
+
+    Every path is pinned to one shard the first time it is submitted, so lines
+    from the same file are processed in order while different files are
+    processed in parallel. Paths are spread across shards in round-robin order.
+    Items are usually batches of lines, so depths are counted in batches.
+
+    Each shard is a BoundedQueue holding up to queue_size items, which follows
+    policy when it is full. Workflow functions cannot be written to disk, so
+    with 'spill', spilled batches are run with the function returned by
+    resolve(path) on the worker thread, instead of the function they were
+    submitted with, and each shard spills to '{spill_path}.{shard}'. Batches
+    whose path no longer resolves, e.g. after a reload removed its file, are
+    skipped. If a Checkpoint is given, the position submitted with each batch
+    is recorded once it has been processed, and spill files are cleared on
+    start, as the batches left over from a previous run are read again from
+    the saved positions. Otherwise, they are processed after the start.
+
+    A batch whose workflow raises is logged and discarded, so the worker
+    thread keeps running.
+
+    While items are being shed, a summary of the batches dropped or spilled
+    is logged every summary_interval seconds.
+
+    If an AlertLatency is given, the time each item waits in its queue is
+    recorded under the index of its shard.
+    """
+
+    def __init__(self, size, latency=None, queue_size=1000, policy="block", spill_path=None, sample_every=10, resolve=None,
+                 summary_interval=60, checkpoint=None):
+        self._resolve = resolve
+        self._checkpoint = checkpoint
+        self._queues = []
+        for shard in range(size):
+            shard_spill_path = None
+            if policy == "spill":
+                shard_spill_path = f"{spill_path}.{shard}"
+                for stale_path in (shard_spill_path, f"{shard_spill_path}.offset"):
+                    if checkpoint is not None and os.path.exists(stale_path):
+                        os.remove(stale_path)
+            self._queues.append(BoundedQueue(queue_size, policy, shard_spill_path, sample_every, self._dropped, encode, decode))
+        self._shards = {}
+        self._assigned = 0
+        self._lock = threading.Lock()
+        self._latency = latency
+        self._policy = policy
+        self._summary_interval = summary_interval
+        self._stop = threading.Event()
+        self._closed = threading.Event()
+        self._threads = []
+        self.dropped_batches = 0
+        self.dropped_lines = 0
+        self._reported = (0, 0, 0)
+
+    @property
+    def size(self):
+        return len(self._queues)
+
+    def start(self):
+        for shard, workflow_queue in enumerate(self._queues):
+            queued = None if self._latency is None else partial(self._latency.queued, shard)
+            worker_thread = threading.Thread(target=self._process, args=(workflow_queue, queued))
+            worker_thread.daemon = True
+            worker_thread.start()
+            self._threads.append(worker_thread)
+        if self._policy != "block":
+            summary_thread = threading.Thread(target=self._summarise_periodically)
+            summary_thread.daemon = True
+            summary_thread.start()
+
+    def stop(self):
+        """Stop logging summaries, after logging one for anything shed since the last."""
+        self._stop.set()
+        self.summarise()
+
+    def close(self, timeout=0):
+        """Stop the worker threads once they finish their current item, waiting up to timeout seconds for them to exit."""
+        self._closed.set()
+        deadline = time.monotonic() + timeout
+        for worker_thread in self._threads:
+            worker_thread.join(max(deadline - time.monotonic(), 0))
+
+    def shard(self, path):
+        """Return the index of the shard that processes path."""
+        shard = self._shards.get(path)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(path)
+                if shard is None:
+                    shard = self._shards[path] = self._assigned % len(self._queues)
+                    self._assigned += 1
+        return shard
+
+    def forget(self, path):
+        """
+        Unpin path from its shard once its file is no longer followed. Batches
+        already queued for it are still processed, and a file created at path
+        later is pinned to a shard again.
+        """
+        with self._lock:
+            self._shards.pop(path, None)
+
+    def submit(self, path, workflow, msg, position=None):
+        """Queue msg to be run with workflow, then record the (inode, offset) position of path if given."""
+        self._queues[self.shard(path)].put((path, workflow, msg, time.monotonic(), position))
+
+    def depths(self):
+        """Return the number of queued items in each shard."""
+        return [workflow_queue.qsize() for workflow_queue in self._queues]
+
+    def join(self, timeout=None):
+        """Block until every queued item has been processed, returning False if timeout seconds pass first."""
+        return join_all(self._queues, timeout)
+
+    @property
+    def spilled_batches(self):
+        return sum(workflow_queue.spilled_total for workflow_queue in self._queues)
+
+    def _dropped(self, item):
+        # Called by a full queue for each item it discards
+        self.dropped_batches += 1
+        msg = item[2]
+        self.dropped_lines += len(msg) if isinstance(msg, list) else 1
+
+    def _process(self, workflow_queue, queued=None):
+        while not self._closed.is_set():
+            try:
+                path, workflow, msg, enqueued, position = workflow_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                if queued is not None:
+                    queued(time.monotonic() - enqueued)
+                if workflow is None:
+                    workflow = self._lookup(path)
+                if workflow is not None:
+                    workflow(msg)
+                if self._checkpoint is not None and position is not None:
+                    self._checkpoint.update(path, *position)
+            except Exception as e:
+                BatchError(path, e, len(msg) if isinstance(msg, list) else 1)
+            finally:
+                workflow_queue.task_done()
+
+    def _lookup(self, path):
+        """Return the workflow that spilled batches of path are run with, or None if it has none any more."""
+        try:
+            return self._resolve(path)
+        except KeyError:
+            # The file was removed from the configuration by a reload
+            return None
+
+    def _summarise_periodically(self):
+        while not self._stop.wait(self._summary_interval):
+            self.summarise()
+
+    def summarise(self):
+        """Log the number of batches shed since the last summary, if any were."""
+        shed = (self.dropped_batches, self.dropped_lines, self.spilled_batches)
+        dropped_batches, dropped_lines, spilled_batches = (now - before for now, before in zip(shed, self._reported))
+        self._reported = shed
+        if dropped_batches or spilled_batches:
+            OverloadError(self._policy, dropped_batches, dropped_lines, spilled_batches)
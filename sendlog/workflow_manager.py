@@ -1,19 +1,30 @@
 from abc import ABC, abstractmethod
 from importlib import import_module
+from functools import partial
+import asyncio
+import inspect
 import logging
+import threading
+import time
 
 from utils import log
 from plugin import LogType, Rule, Transformer, Channel
+from dispatch import RuleIndex
+from suppress import Suppressor
+from metrics import timed, timed_rule, timed_async
 from utils import clsi
+from utils.paths import is_pattern, matches
 from utils.errors import (
     PluginClassNotFoundError,
     PluginModuleNotFoundError,
     PluginInheritanceError,
     EndpointUndefinedError,
     EndpointVariableMismatchError,
+    LogTypeError,
     RuleError,
     TransformerError,
-    EndpointError
+    EndpointError,
+    RestartRequiredError
     )
 
 PLUGIN_HIERARCHY = {0: LogType,
@@ -34,6 +45,87 @@ def import_plugin(plugin_name, plugin_type):
     except ModuleNotFoundError as e:
         raise PluginModuleNotFoundError(plugin_fullname)
 
+def is_async_channel(channel_cls):
+    """Return True if a Channel class sends alerts with an async __call__."""
+    return inspect.iscoroutinefunction(channel_cls.__call__)
+
+def endpoint_error(endpoint_node, exc_info, log_line, path, trace_stack):
+    EndpointError(
+        endpoint_node.endpoint_name,
+        clsi.cls_fullname(endpoint_node.plugin_cls),
+        exc_info,
+        log_line,
+        path,
+        trace_stack
+    )
+
+def delivered(endpoint_node, log_line, path, trace_stack, timing):
+    """Record the latency of a delivered alert if it was timed."""
+    if timing is not None and endpoint_node.latency is not None:
+        endpoint_node.latency.delivered(endpoint_node.endpoint_name, log_line, path, trace_stack, timing)
+
+def deliver(endpoint_node, msg, log_line, path, trace_stack, timing=None):
+    """
+    Send msg to an endpoint and handle any exceptions, returning True if it was sent.
+
+    For an async channel, return a coroutine that sends msg instead.
+    """
+    if is_async_channel(endpoint_node.plugin_cls):
+        return deliver_async(endpoint_node, msg, log_line, path, trace_stack, timing)
+    try:
+        endpoint_node.call(msg)
+    except Exception as exc_info:
+        endpoint_error(endpoint_node, exc_info, log_line, path, trace_stack)
+        return False
+    delivered(endpoint_node, log_line, path, trace_stack, timing)
+    return True
+
+def deliver_batch(endpoint_node, items):
+    """
+    Send a list of (msg, meta) items to an endpoint as one message and handle
+    any exceptions, returning the items that were not sent.
+
+    For an async channel, return a coroutine that sends them instead.
+    """
+    if is_async_channel(endpoint_node.plugin_cls):
+        return deliver_batch_async(endpoint_node, items)
+    channel = endpoint_node.plugin_obj
+    # Without a batch implementation, send each alert on its own
+    if type(channel).send_batch is Channel.send_batch:
+        return [(msg, meta) for msg, meta in items if not deliver(endpoint_node, msg, *meta)]
+    try:
+        endpoint_node.call_batch([msg for msg, _ in items])
+    except Exception as exc_info:
+        for _, meta in items:
+            endpoint_error(endpoint_node, exc_info, *meta[:3])
+        return items
+    for _, meta in items:
+        delivered(endpoint_node, *meta)
+    return []
+
+async def deliver_async(endpoint_node, msg, log_line, path, trace_stack, timing=None):
+    try:
+        await endpoint_node.call(msg)
+    except Exception as exc_info:
+        endpoint_error(endpoint_node, exc_info, log_line, path, trace_stack)
+        return False
+    delivered(endpoint_node, log_line, path, trace_stack, timing)
+    return True
+
+async def deliver_batch_async(endpoint_node, items):
+    channel = endpoint_node.plugin_obj
+    if type(channel).send_batch is Channel.send_batch:
+        return [(msg, meta) for msg, meta in items if not await deliver_async(endpoint_node, msg, *meta)]
+    try:
+        await endpoint_node.call_batch([msg for msg, _ in items])
+    except Exception as exc_info:
+        for _, meta in items:
+            endpoint_error(endpoint_node, exc_info, *meta[:3])
+        return items
+    for _, meta in items:
+        delivered(endpoint_node, *meta)
+    return []
+
 class WorkflowNode(ABC):
     """
     Wrapper for plugin classes.
@@ -46,6 +138,7 @@ class WorkflowNode(ABC):
         self._level = level
         self._plugin_cls = plugin_cls
         self._subnodes = []
+        self._call = None
         # Validate plugin class
         if not issubclass(self.plugin_cls, self.base_cls):
             raise PluginInheritanceError(clsi.cls_fullname(self.plugin_cls), self.base_cls.__name__, clsi.cls_bases(self.plugin_cls))
@@ -60,6 +153,15 @@ class WorkflowNode(ABC):
     def plugin_obj(self):
         return self._plugin_obj
 
+    @property
+    def call(self):
+        """Return the function that executes the node: the plugin object, or a timed wrapper of it."""
+        return self._call or self._plugin_obj
+
+    def instrument(self, node_metrics):
+        """Record call counts, latency and errors for the node in node_metrics."""
+        self._call = timed(self._plugin_obj, node_metrics)
+
     @property
     def base_cls(self):
         return PLUGIN_HIERARCHY[self._level]
@@ -82,14 +184,31 @@ class LogTypeNode(WorkflowNode):
 
     def __init__(self, plugin_cls):
         self._level = 0
+        self._rule_index = None
         super().__init__(self._level, plugin_cls)
 
+    @property
+    def rule_index(self):
+        """Return the dispatch index over the Rule subnodes, building it if needed."""
+        if self._rule_index is None:
+            self._rule_index = RuleIndex([subnode.plugin_cls for subnode in self._subnodes])
+        return self._rule_index
+
+    def add(self, subnode):
+        super().add(subnode)
+        self._rule_index = None
+
 class RuleNode(WorkflowNode):
 
     def __init__(self, plugin_cls):
         self._level = 1
+        # Optional Suppressor checked before the rule's transformers run
+        self.suppress = None
         super().__init__(self._level, plugin_cls)
 
+    def instrument(self, node_metrics):
+        self._call = timed_rule(self._plugin_obj, node_metrics)
+
 class TransformerNode(WorkflowNode):
 
     def __init__(self, plugin_cls):
@@ -98,36 +217,121 @@ class TransformerNode(WorkflowNode):
 
 class EndpointNode(WorkflowNode):
 
-    def __init__(self, channel_cls, endpoint_kwargs, endpoint_name):
+    def __init__(self, channel_cls, endpoint_kwargs, endpoint_name, instantiate=True, latency=None):
         self._level = 3
         self._endpoint_kwargs = endpoint_kwargs
+        self._instantiate = instantiate
         self.endpoint_name = endpoint_name
+        self.latency = latency
+        # Alerts being sent through the node, and whether to close it once there are none
+        self.users = 0
+        self.retired = False
         super().__init__(self._level, channel_cls)
 
     def _inst_plugin(self):
-        self._plugin_obj = self._plugin_cls(self.endpoint_name, **self._endpoint_kwargs)
+        # Without an instance, alerts must be handled by the delivery stage
+        self._plugin_obj = self._plugin_cls(self.endpoint_name, **self._endpoint_kwargs) if self._instantiate else None
+        self._call_batch = None
+
+    @property
+    def call_batch(self):
+        return self._call_batch or self._plugin_obj.send_batch
+
+    def instrument(self, node_metrics):
+        if self._plugin_obj is None:
+            return
+        wrap = timed_async if is_async_channel(self._plugin_cls) else timed
+        self._call = wrap(self._plugin_obj, node_metrics)
+        self._call_batch = wrap(self._plugin_obj.send_batch, node_metrics)
 
 class WorkflowManager():
-    """Load, store and orchestrate workflow executions."""
+    """
+    Load, store and orchestrate workflow executions.
+
+    If a delivery stage (DeliveryStage or AsyncDelivery) is provided, alerts
+    are queued for delivery on the endpoint's own threads or tasks; otherwise
+    they are delivered inline.
+
+    Each endpoint is instantiated once, by load_endpoint(), and its node is
+    shared by every workflow that sends to it, so the channel's connections
+    and any limits it enforces apply across all of them. A channel may be
+    called from several threads at once, e.g. when its concurrency is above
+    1, so channels guard any state they share between calls.
+
+    If open_endpoints is False, channels are never instantiated, so that a
+    delivery stage can handle alerts without opening files or connections.
+
+    If a Metrics registry is provided, every node records its calls, latency
+    and errors there. Otherwise nodes call their plugin objects directly.
+
+    If an AlertLatency is provided, alerts carry the time at which their line
+    was read and their rule matched, and the time taken to deliver them is
+    recorded there.
+    """
     
-    def __init__(self):
+    def __init__(self, delivery=None, open_endpoints=True, metrics=None, latency=None):
+        self._open_endpoints = open_endpoints
+        self._metrics = metrics
+        self._latency = latency
         self._files = {}
-        self._endpoints = {}
+        self._endpoint_nodes = {}
+        # Endpoints removed by a reload, until their queued alerts are delivered
+        self._removed = {}
+        self._endpoint_lock = threading.Lock()
+        self._workflows = {}
+        self._plans = {}
+        self._resolved = {}
+        # Guards the worktrees and compiled workflows, which worker threads also look up
+        self._lock = threading.RLock()
+        self._delivery = delivery
+        # Configuration the worktrees were loaded from, compared on reload
+        self._file_workflows = {}
+        self._suppressions = {}
+        self._endpoint_configs = {}
     
     def load_file(self, file_path: str, plugin_name: str, logtype_name: str, rule_name: str, transformer_name: str, endpoint_name: str):
         """Idempotently load a workflow from the reference strings provided."""
 
+        with self._lock:
+            # Discard any compiled workflow so it is rebuilt with the new nodes
+            self._forget({file_path})
+            workflow = (plugin_name, logtype_name, rule_name, transformer_name, endpoint_name)
+            self._build(self._files, self._endpoint_nodes, file_path, *workflow)
+            workflows = self._file_workflows.setdefault(file_path, [])
+            if workflow not in workflows:
+                workflows.append(workflow)
+
+    def load_suppression(self, file_path: str, rule_name: str, options: dict):
+        """Suppress repeated matches of a rule that is already loaded for file_path, with a Suppressor built from options."""
+        with self._lock:
+            self._forget({file_path})
+            self._suppress(self._files, file_path, rule_name, options)
+            self._suppressions.setdefault(file_path, {})[rule_name] = options
+
+    def _suppress(self, files, file_path, rule_name, options):
+        logtype_node = files.get(file_path)
+        if logtype_node is None:
+            return
+        rule_cls = resolve_class(logtype_node.plugin_cls, rule_name)
+        for rule_node in logtype_node:
+            if rule_node.plugin_cls is rule_cls:
+                rule_node.suppress = Suppressor(clsi.cls_fullname(rule_cls), file_path, **options)
+
+    def _build(self, files, endpoint_nodes, file_path, plugin_name, logtype_name, rule_name, transformer_name, endpoint_name):
+        """Add the nodes of one workflow to the worktree for file_path in files."""
+
         def get_subnode(node, plugin_cls):
             rule_node = next((subnode for subnode in node if subnode.plugin_obj.__class__ == plugin_cls), None)
             return rule_node
         
         # Get/set LogType node
-        logtype_node = self._files.get(file_path)
+        logtype_node = files.get(file_path)
         if logtype_node is None:
             plugin_mod = import_plugin(plugin_name, "logs")
             logtype_cls = resolve_class(plugin_mod, logtype_name)
             logtype_node = LogTypeNode(logtype_cls)
-            self._files[file_path] = logtype_node
+            self._instrument(logtype_node, "log_type", file_path)
+            files[file_path] = logtype_node
         else:
             logtype_cls = logtype_node.plugin_obj.__class__
 
@@ -136,6 +340,7 @@ class WorkflowManager():
         rule_node = get_subnode(logtype_node, rule_cls)
         if rule_node is None:
             rule_node = RuleNode(rule_cls)
+            self._instrument(rule_node, "rule", file_path)
             logtype_node.add(rule_node)
 
         # Get/set Transformer node
@@ -143,32 +348,292 @@ class WorkflowManager():
         transformer_node = get_subnode(rule_node, transformer_cls)
         if transformer_node is None:
             transformer_node = TransformerNode(transformer_cls)
+            self._instrument(transformer_node, "transformer", file_path)
             rule_node.add(transformer_node)
         
-        # Set endpoint node
+        # Add the endpoint's node, which every workflow sending to it shares
         try:
-            endpoint_data = self._endpoints[endpoint_name]
+            endpoint_node = endpoint_nodes[endpoint_name]
         except KeyError:
             raise EndpointUndefinedError(endpoint_name, file_path)
-        channel_cls = endpoint_data["channel_cls"]
-        endpoint_kwargs = endpoint_data["kwargs"]
-        endpoint_node = EndpointNode(channel_cls, endpoint_kwargs, endpoint_name)
-        transformer_node.add(endpoint_node)
-
-    def load_endpoint(self, plugin_name: str, channel_name: str, endpoint_name: str, endpoint_kwargs: dict):
+        if endpoint_node not in transformer_node:
+            transformer_node.add(endpoint_node)
+
+    def _instrument(self, node, kind, file_path=None):
+        if self._metrics is None:
+            return
+        # Endpoints are shared between files, so their metrics are too
+        name = node.endpoint_name if kind == "endpoint" else clsi.cls_fullname(node.plugin_cls)
+        node.instrument(self._metrics.node(kind, name, file_path))
+
+    def load_endpoint(self, plugin_name: str, channel_name: str, endpoint_name: str, endpoint_kwargs: dict, endpoint_options: dict = None):
+        """
+        Instantiate an endpoint, which is shared by every workflow that sends
+        to it, and register it with the delivery stage.
+        """
+        endpoint_node = self._create_endpoint(plugin_name, channel_name, endpoint_name, endpoint_kwargs)
+        self._endpoint_nodes[endpoint_name] = endpoint_node
+        self._endpoint_configs[endpoint_name] = (plugin_name, channel_name, endpoint_kwargs, endpoint_options)
+        self._register(endpoint_name, endpoint_node.plugin_cls, endpoint_options)
+
+    def _create_endpoint(self, plugin_name, channel_name, endpoint_name, endpoint_kwargs):
         # Resolve channel class
         plugin_mod = import_plugin(plugin_name, "channels")
         channel_cls = resolve_class(plugin_mod, channel_name)
         # Validate that endpoint keyword arguments match the specified channel
         given_kws = set(endpoint_kwargs.keys())
-        required_kws = set(channel_cls.__slots__)
-        if given_kws != required_kws:
-            raise EndpointVariableMismatchError(endpoint_name, channel_name, required_kws, given_kws)
-        # Store channel class and arguments for later
-        self._endpoints[endpoint_name] = {"channel_cls": channel_cls, "kwargs": endpoint_kwargs}
+        accepted_kws = {slot for slot in channel_cls.__slots__ if not slot.startswith("_")}
+        required_kws = accepted_kws - set(channel_cls.defaults)
+        if not required_kws <= given_kws <= accepted_kws:
+            raise EndpointVariableMismatchError(endpoint_name, channel_name, accepted_kws, given_kws)
+        endpoint_node = EndpointNode(channel_cls, endpoint_kwargs, endpoint_name, self._open_endpoints, self._latency)
+        self._instrument(endpoint_node, "endpoint")
+        return endpoint_node
+
+    def _register(self, endpoint_name, channel_cls, endpoint_options):
+        """Register an endpoint with the delivery stage."""
+        if self._delivery is None:
+            return
+        endpoint_options = endpoint_options or {}
+        delivery_options = {**endpoint_options.get("delivery", {}), **endpoint_options.get("batch", {})}
+        self._delivery.add_endpoint(
+            endpoint_name,
+            partial(self._deliver, endpoint_name),
+            partial(self._deliver_batch, endpoint_name),
+            asynchronous=is_async_channel(channel_cls),
+            retry=endpoint_options.get("retry"),
+            **delivery_options
+        )
+
+    def reload(self, endpoints, files, suppressions=()):
+        """
+        Apply a new configuration, given as the items yielded by
+        ConfigHandler.endpoints(), ConfigHandler.files() and
+        ConfigHandler.suppressions(), and return the (added, removed) file
+        paths.
+
+        Endpoints whose plugin, channel or variables changed are instantiated
+        again, and the others keep their channels, so their files and
+        connections stay open. Only the worktrees of files whose workflows or
+        suppressions changed, or that use a changed endpoint, are rebuilt, and
+        their suppressors start afresh. Each is swapped
+        in with its compiled workflow once every worktree has been built, so a
+        configuration that fails to load changes nothing.
+
+        Changes to an endpoint's delivery, batch or retry options are only
+        applied on restart, as its delivery queue may be holding alerts.
+        Alerts queued for a changed endpoint are sent by its new channel, and
+        alerts queued for a removed endpoint are still sent by its channel,
+        which is unregistered from the delivery stage once they have been.
+        Replaced channels are closed once no alert is being sent through them.
+        """
+        endpoint_configs = {}
+        for plugin_name, channel_name, endpoint_name, endpoint_kwargs, endpoint_options in endpoints:
+            endpoint_configs[endpoint_name] = (plugin_name, channel_name, endpoint_kwargs, endpoint_options)
+        file_workflows = {}
+        for file_path, *workflow in files:
+            workflows = file_workflows.setdefault(file_path, [])
+            if tuple(workflow) not in workflows:
+                workflows.append(tuple(workflow))
+        file_suppressions = {}
+        for file_path, rule_name, options in suppressions:
+            file_suppressions.setdefault(file_path, {})[rule_name] = options
+
+        # Instantiate new and changed endpoints, and build the worktrees that use them
+        endpoint_nodes = {}
+        created = []
+        rebuilt = {}
+        try:
+            for endpoint_name, (plugin_name, channel_name, endpoint_kwargs, _) in endpoint_configs.items():
+                previous = self._endpoint_configs.get(endpoint_name)
+                if previous is not None and previous[:3] == (plugin_name, channel_name, endpoint_kwargs):
+                    endpoint_nodes[endpoint_name] = self._endpoint_nodes[endpoint_name]
+                    continue
+                endpoint_node = self._create_endpoint(plugin_name, channel_name, endpoint_name, endpoint_kwargs)
+                endpoint_nodes[endpoint_name] = endpoint_node
+                created.append(endpoint_node)
+            changed = {node.endpoint_name for node in created} | (set(self._endpoint_nodes) - set(endpoint_nodes))
+            for file_path, workflows in file_workflows.items():
+                if (self._file_workflows.get(file_path) == workflows
+                        and self._suppressions.get(file_path, {}) == file_suppressions.get(file_path, {})
+                        and not any(workflow[-1] in changed for workflow in workflows)):
+                    continue
+                for workflow in workflows:
+                    self._build(rebuilt, endpoint_nodes, file_path, *workflow)
+                for rule_name, options in file_suppressions.get(file_path, {}).items():
+                    self._suppress(rebuilt, file_path, rule_name, options)
+        except Exception:
+            for endpoint_node in created:
+                if endpoint_node.plugin_obj is not None:
+                    endpoint_node.plugin_obj.close()
+            raise
+        plans = {file_path: self._compile_workflow(file_path, logtype_node) for file_path, logtype_node in rebuilt.items()}
+
+        # Register new endpoints, and warn about options that need a restart
+        for endpoint_name, (_, _, _, endpoint_options) in endpoint_configs.items():
+            if endpoint_name not in self._endpoint_configs:
+                self._register(endpoint_name, endpoint_nodes[endpoint_name].plugin_cls, endpoint_options)
+            elif self._endpoint_configs[endpoint_name][3] != endpoint_options:
+                RestartRequiredError(f"endpoints.{endpoint_name}")
+        replaced = [node for name, node in self._endpoint_nodes.items() if name in endpoint_nodes and endpoint_nodes[name] is not node]
+        removed_endpoints = {name: node for name, node in self._endpoint_nodes.items() if name not in endpoint_nodes}
+        with self._endpoint_lock:
+            self._endpoint_nodes = endpoint_nodes
+            self._removed.update(removed_endpoints)
+        self._endpoint_configs = endpoint_configs
+
+        # Swap in the new worktrees, then close the endpoints they replaced
+        added = [file_path for file_path in file_workflows if file_path not in self._files]
+        removed = [file_path for file_path in self._files if file_path not in file_workflows]
+        with self._lock:
+            for file_path, logtype_node in rebuilt.items():
+                self._plans[file_path] = plans[file_path]
+                self._files[file_path] = logtype_node
+                self._file_workflows[file_path] = file_workflows[file_path]
+                self._suppressions[file_path] = file_suppressions.get(file_path, {})
+            for file_path in removed:
+                del self._files[file_path]
+                del self._file_workflows[file_path]
+                self._suppressions.pop(file_path, None)
+                self._plans.pop(file_path, None)
+            self._forget(set(rebuilt) | set(removed), keep_plans=True)
+        for endpoint_node in replaced:
+            self._retire(endpoint_node)
+        for endpoint_name, endpoint_node in removed_endpoints.items():
+            if self._delivery is None:
+                self._drained(endpoint_name, endpoint_node)
+            else:
+                self._delivery.remove_endpoint(endpoint_name, partial(self._drained, endpoint_name, endpoint_node))
+        return added, removed
+
+    def _drained(self, endpoint_name, endpoint_node):
+        """Close a removed endpoint once its queued alerts have been delivered."""
+        with self._endpoint_lock:
+            if self._removed.get(endpoint_name) is endpoint_node:
+                del self._removed[endpoint_name]
+        self._retire(endpoint_node)
+
+    def _retire(self, endpoint_node):
+        """Close the channel of an endpoint node that is no longer used, once no alert is being sent through it."""
+        with self._endpoint_lock:
+            endpoint_node.retired = True
+            close = not endpoint_node.users
+        if close and endpoint_node.plugin_obj is not None:
+            endpoint_node.plugin_obj.close()
+
+    def _acquire(self, endpoint_name):
+        """Return the current node of an endpoint, which is not closed before it is released."""
+        with self._endpoint_lock:
+            endpoint_node = self._endpoint_nodes.get(endpoint_name) or self._removed[endpoint_name]
+            endpoint_node.users += 1
+        return endpoint_node
+
+    def _release(self, endpoint_node):
+        with self._endpoint_lock:
+            endpoint_node.users -= 1
+            close = endpoint_node.retired and not endpoint_node.users
+        if close and endpoint_node.plugin_obj is not None:
+            endpoint_node.plugin_obj.close()
+
+    def _using(self, endpoint_name, send):
+        """Return send(endpoint_node) for the endpoint's current node, releasing the node once it completes."""
+        endpoint_node = self._acquire(endpoint_name)
+        try:
+            result = send(endpoint_node)
+        except BaseException:
+            self._release(endpoint_node)
+            raise
+        if asyncio.iscoroutine(result):
+            return self._release_after(endpoint_node, result)
+        self._release(endpoint_node)
+        return result
+
+    async def _release_after(self, endpoint_node, coroutine):
+        try:
+            return await coroutine
+        finally:
+            self._release(endpoint_node)
+
+    def _deliver(self, endpoint_name, msg, meta):
+        """Deliver a queued alert."""
+        return self._using(endpoint_name, lambda endpoint_node: deliver(endpoint_node, msg, *meta))
+
+    def _deliver_batch(self, endpoint_name, items):
+        return self._using(endpoint_name, lambda endpoint_node: deliver_batch(endpoint_node, items))
 
     def get_workflow(self, path):
-        """Return a 'black-box' function that executes a workflow."""
+        """Return a 'black-box' function that executes the workflow for path on one log line."""
+        return self._get_compiled(path)[0]
+
+    def get_batch_workflow(self, path):
+        """
+        Return a 'black-box' function that executes the workflow for path on a
+        list of log lines. Raises KeyError if no workflow is configured for
+        path. Safe to call from any thread, e.g. by workers running batches
+        read back from a spill file while the config is reloaded.
+        """
+        return self._get_compiled(path)[1]
+
+    def expire_suppressed(self):
+        """Forget the expired keys of every Suppressor, logging how many alerts each suppressed."""
+        with self._lock:
+            suppressors = [rule_node.suppress for logtype_node in self._files.values() for rule_node in logtype_node
+                           if rule_node.suppress is not None]
+        for suppressor in suppressors:
+            suppressor.expire()
+
+    def forget_path(self, path):
+        """Discard the workflow compiled for path, e.g. once its file is no longer followed."""
+        with self._lock:
+            self._workflows.pop(path, None)
+            self._resolved.pop(path, None)
+
+    def _get_compiled(self, path):
+        compiled = self._workflows.get(path)
+        if compiled is None:
+            with self._lock:
+                compiled = self._workflows.get(path)
+                if compiled is None:
+                    key = self._resolve(path)
+                    plan = self._plans.get(key)
+                    if plan is None:
+                        plan = self._plans[key] = self._compile_workflow(key)
+                    compiled = plan(path)
+                    self._workflows[path] = compiled
+                    self._resolved[path] = key
+        return compiled
+
+    def _resolve(self, path):
+        """Return the key of the worktree for path: path itself, or else the first pattern that matches it."""
+        if path in self._files:
+            return path
+        for key in list(self._files):
+            if is_pattern(key) and matches(key, path):
+                return key
+        raise KeyError(path)
+
+    def _forget(self, keys, keep_plans=False):
+        """Discard the compiled workflows of the worktrees at keys, and of files with those paths."""
+        if not keep_plans:
+            for key in keys:
+                self._plans.pop(key, None)
+        for path, key in list(self._resolved.items()):
+            if key in keys or path in keys:
+                del self._resolved[path]
+                self._workflows.pop(path, None)
+
+    def _compile_workflow(self, key, log_node=None):
+        """
+        Build the execution plan for a worktree, and return a function that
+        takes the path of a file and returns functions that execute the plan
+        on a single line and on a batch of lines from it.
+
+        The plan is resolved once, so each log line is parsed a single time and
+        the parsed record is shared by every rule. Trace stacks are also
+        precomputed for every node rather than rebuilt for each line. Files
+        matched by a pattern share its plan, and only the functions bound to
+        their path are created for each file.
+        """
 
         def workflow_tracestack(*args):
             """Get the full names of multiple workflow components for debugging."""
@@ -180,62 +645,125 @@ class WorkflowManager():
                 workflow_tracestack.append(fullname)
             return workflow_tracestack
 
-        log_node = self._files[path]
-
-        def process_endpoint(endpoint_node, msg, log_line, path, trace_stack):
-            """Process each endpoint and handle any exceptions."""
-            try:
-                endpoint_node.plugin_obj(msg)
-            except Exception as exc_info:
-                EndpointError(
-                    endpoint_node.endpoint_name,
-                    clsi.cls_fullname(endpoint_node.plugin_cls),
-                    exc_info,
-                    log_line,
-                    path,
-                    trace_stack
-                )
-
-        def process_transformer(transformer_node, log_line, path, trace_stack):
-            """Process each transformer and handle any exceptions."""
-            try:
-                msg = transformer_node.plugin_obj(log_line)
+        if log_node is None:
+            log_node = self._files[key]
+        log_trace_stack = workflow_tracestack(log_node)
+
+        # Resolve the worktree into nested (node, call, trace_stack, subplan) tuples
+        plan = []
+        for rule_node in log_node:
+            transformer_plan = []
+            for transformer_node in rule_node:
+                endpoint_plan = []
                 for endpoint_node in transformer_node:
-                    process_endpoint(endpoint_node, msg, log_line, path, trace_stack)
-            except Exception as exc_info:
-                TransformerError(
-                    clsi.cls_fullname(transformer_node.plugin_cls),
-                    exc_info,
-                    log_line,
-                    path,
-                    trace_stack
-                )
-
-        def process_rule(rule_node, log_line, path, trace_stack):
-            """Process each rule and handle any exceptions."""
-            try:
-                rule_outcome = rule_node.plugin_obj(log_line)
-                if rule_outcome is not False:
-                    for transformer_node in rule_node:
-                        process_transformer(transformer_node, rule_outcome, path, trace_stack)
-            except Exception as exc_info:
-                RuleError(
-                    clsi.cls_fullname(rule_node.plugin_cls),
-                    exc_info,
-                    log_line,
-                    path,
-                    trace_stack
-                )
-
-        def workflow(log_line):
-            """Execute a workflow and log errors related to its execution."""
-            for rule_node in log_node:
-                trace_stack = workflow_tracestack(log_node, rule_node)
-                log_line = log_node.plugin_obj(log_line)
-                process_rule(rule_node, log_line, path, trace_stack)
-        
-        return workflow
+                    trace_stack = workflow_tracestack(log_node, rule_node, transformer_node, endpoint_node)
+                    endpoint_plan.append((endpoint_node, trace_stack))
+                trace_stack = workflow_tracestack(log_node, rule_node, transformer_node)
+                transformer_plan.append((transformer_node, transformer_node.call, trace_stack, endpoint_plan))
+            trace_stack = workflow_tracestack(log_node, rule_node)
+            plan.append((rule_node, rule_node.call, trace_stack, transformer_plan, rule_node.suppress))
+
+        delivery = self._delivery
+        latency = self._latency
+
+        parse = log_node.call
+        rule_index = log_node.rule_index
+
+        def bind(path):
+            """Return the workflow functions for one file, which report errors and alerts under its path."""
+
+            def process_endpoint(endpoint_node, msg, log_line, trace_stack, timing):
+                """Queue or send an alert for each endpoint."""
+                if delivery is None:
+                    result = deliver(endpoint_node, msg, log_line, path, trace_stack, timing)
+                    if asyncio.iscoroutine(result):
+                        asyncio.run(result)
+                else:
+                    delivery.submit(endpoint_node.endpoint_name, msg, (log_line, path, trace_stack, timing))
+
+            def process_transformer(transformer_node, transform, trace_stack, endpoint_plan, log_line, timing):
+                """Process each transformer and handle any exceptions."""
+                try:
+                    msg = transform(log_line)
+                    for endpoint_node, endpoint_trace_stack in endpoint_plan:
+                        process_endpoint(endpoint_node, msg, log_line, endpoint_trace_stack, timing)
+                except Exception as exc_info:
+                    TransformerError(
+                        clsi.cls_fullname(transformer_node.plugin_cls),
+                        exc_info,
+                        log_line,
+                        path,
+                        trace_stack
+                    )
+
+            def process_rule(rule_node, rule, trace_stack, transformer_plan, suppress, log_parts, detected):
+                """Process each rule and handle any exceptions."""
+                try:
+                    rule_outcome = rule(log_parts)
+                    if rule_outcome is not False:
+                        if suppress is not None and not suppress(rule_outcome):
+                            return
+                        timing = None
+                        if detected is not None:
+                            timing = (detected, time.time())
+                            latency.matched(key, *timing)
+                        for transformer_plan_item in transformer_plan:
+                            process_transformer(*transformer_plan_item, rule_outcome, timing)
+                except Exception as exc_info:
+                    RuleError(
+                        clsi.cls_fullname(rule_node.plugin_cls),
+                        exc_info,
+                        log_parts,
+                        path,
+                        trace_stack
+                    )
+
+            def workflow(log_line, detected=None):
+                """
+                Execute a workflow and log errors related to its execution.
+
+                detected is the wall-clock time at which log_line was read, if known.
+                """
+                try:
+                    log_parts = parse(log_line)
+                except Exception as exc_info:
+                    LogTypeError(
+                        clsi.cls_fullname(log_node.plugin_cls),
+                        exc_info,
+                        log_line,
+                        path,
+                        log_trace_stack
+                    )
+                    return
+                message = log_parts.get("message") if type(log_parts) is dict else None
+                for i in rule_index.candidates(message):
+                    process_rule(*plan[i], log_parts, detected)
+
+            def workflow_batch(log_lines):
+                """Execute a workflow for each line in order."""
+                # Lines from LogMonitor carry the time at which they were read
+                detected = None if latency is None else getattr(log_lines, "detected", None)
+                for log_line in log_lines:
+                    workflow(log_line, detected)
+
+            return workflow, workflow_batch
+
+        return bind
     
+    def close_endpoints(self):
+        """Release resources held by every loaded endpoint."""
+        for endpoint_node in self._iter_endpoint_nodes():
+            endpoint_node.plugin_obj.close()
+
+    def reopen_endpoints(self):
+        """Ask every loaded endpoint to reopen its files or connections."""
+        for endpoint_node in self._iter_endpoint_nodes():
+            endpoint_node.plugin_obj.reopen()
+
+    def _iter_endpoint_nodes(self):
+        endpoint_nodes = [*self._endpoint_nodes.values(), *self._removed.values()]
+        return (node for node in endpoint_nodes if node.plugin_obj is not None)
+
     def get_paths(self):
         return list(self._files.keys())
 